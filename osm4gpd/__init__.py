@@ -1,2 +1,5 @@
 from .__version__ import *
+from .index import *
+from .locations import *
 from .parse import *
+from .predicates import *
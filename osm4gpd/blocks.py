@@ -1,23 +1,281 @@
+import importlib
+import lzma
+import mmap
 import struct
 import zlib
+from contextlib import contextmanager
 from io import BufferedReader
+from pathlib import Path
+from types import ModuleType
 from typing import Generator
 
-from .proto import Blob, BlobHeader
+from .proto import Blob, BlobHeader, PrimitiveBlock, PrimitiveGroup
 
-__all__ = ["read_blocks"]
+__all__ = [
+    "scan_blobs",
+    "scan_mapped_blobs",
+    "map_file",
+    "read_blob_at",
+    "read_blobs",
+    "decompress_blob",
+    "peek_block_kinds",
+    "read_blocks",
+    "UnsupportedCompressionError",
+]
 
 
-def read_blocks(f: BufferedReader) -> Generator[bytes, None, None]:
-    """Return a generator of blocks of bytes from the given file.
+def scan_blobs(f: BufferedReader) -> Generator[tuple[BlobHeader, int], None, None]:
+    """Return a generator of blob headers, together with the byte offset of the
+    blob data they describe.
 
-    This corresponds to the fileformat part in the protobuf definitions.
+    The blob data itself is skipped, so that scanning a file only touches the
+    headers. The consumer may read from `f` in between, the position is
+    restored before the next header is parsed.
     """
     while size_header := f.read(4):
         blob_header_size: int
         blob_header_size, *_ = struct.unpack("!L", size_header)
 
-        blob: Blob = Blob.FromString(
-            f.read(BlobHeader.FromString(f.read(blob_header_size)).datasize)
+        header: BlobHeader = BlobHeader.FromString(f.read(blob_header_size))
+        offset = f.tell()
+
+        yield header, offset
+
+        f.seek(offset + header.datasize)
+
+
+@contextmanager
+def map_file(fp: Path | str) -> Generator[memoryview, None, None]:
+    """Memory-map a file read-only and expose it as a memoryview.
+
+    Slices of the view do not copy any data, but they must not outlive the
+    context.
+    """
+    with open(fp, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        buffer = memoryview(mm)
+        try:
+            yield buffer
+        finally:
+            buffer.release()
+
+
+def scan_mapped_blobs(
+    buffer: memoryview,
+) -> Generator[tuple[BlobHeader, int], None, None]:
+    """Same as `scan_blobs`, but for a memory-mapped file."""
+    pos = 0
+    while pos < len(buffer):
+        blob_header_size: int
+        blob_header_size, *_ = struct.unpack_from("!L", buffer, pos)
+        pos += 4
+
+        header: BlobHeader = BlobHeader.FromString(
+            buffer[pos : pos + blob_header_size]  # type: ignore[arg-type]
+        )
+        pos += blob_header_size
+
+        yield header, pos
+
+        pos += header.datasize
+
+
+def read_blob_at(f: BufferedReader, offset: int, size: int) -> bytes:
+    """Read a single serialized blob, as located by `scan_blobs`."""
+    f.seek(offset)
+    return f.read(size)
+
+
+def read_blobs(f: BufferedReader) -> Generator[bytes, None, None]:
+    """Return a generator of serialized, still compressed blobs from the given
+    file.
+
+    Splitting reading from decompression allows the latter to happen in a
+    different process.
+    """
+    while size_header := f.read(4):
+        blob_header_size: int
+        blob_header_size, *_ = struct.unpack("!L", size_header)
+
+        yield f.read(BlobHeader.FromString(f.read(blob_header_size)).datasize)
+
+
+def _read_varint(data: memoryview, pos: int) -> tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _iter_fields(
+    data: bytes | memoryview,
+) -> Generator[tuple[int, int | memoryview], None, None]:
+    """Iterate over the top-level fields of a serialized protobuf message.
+
+    Yields the field number together with the value of scalar fields or a
+    slice of `data` for length-delimited fields, which are not parsed.
+    """
+    view = memoryview(data)
+    pos = 0
+
+    while pos < len(view):
+        key, pos = _read_varint(view, pos)
+        field_number, wire_type = key >> 3, key & 0x07
+
+        match wire_type:
+            case 0:
+                value, pos = _read_varint(view, pos)
+                yield field_number, value
+            case 1:
+                yield field_number, int.from_bytes(view[pos : pos + 8], "little")
+                pos += 8
+            case 2:
+                length, pos = _read_varint(view, pos)
+                yield field_number, view[pos : pos + length]
+                pos += length
+            case 5:
+                yield field_number, int.from_bytes(view[pos : pos + 4], "little")
+                pos += 4
+            case _:
+                raise ValueError(f"Unexpected wire type {wire_type}.")
+
+
+def _split_blob(data: bytes | memoryview) -> tuple[int, memoryview, int]:
+    """Split a serialized `Blob` into the field number of its data field, the
+    payload and the uncompressed size, without copying the payload.
+
+    Parsing with `Blob.FromString` would copy the (compressed) payload into a
+    new bytes object, before the decompressor gets to see it. A blob only
+    consists of a handful of scalar and length-delimited fields, so reading the
+    wire format directly is cheap and returns slices of `data` instead.
+    """
+    data_field: int | None = None
+    payload = memoryview(data)[:0]
+    raw_size = 0
+
+    for field_number, value in _iter_fields(data):
+        if isinstance(value, memoryview):
+            data_field, payload = field_number, value
+        elif field_number == Blob.RAW_SIZE_FIELD_NUMBER:
+            raw_size = value
+
+    if data_field is None:
+        raise ValueError("Blob does not contain any data.")
+
+    return data_field, payload, raw_size
+
+
+# kind of the elements in a primitive group, by the field that holds them
+_GROUP_KINDS = {
+    PrimitiveGroup.NODES_FIELD_NUMBER: "node",
+    PrimitiveGroup.DENSE_FIELD_NUMBER: "node",
+    PrimitiveGroup.WAYS_FIELD_NUMBER: "way",
+    PrimitiveGroup.RELATIONS_FIELD_NUMBER: "relation",
+}
+
+
+def peek_block_kinds(block: bytes | memoryview) -> frozenset[str]:
+    """Return the kinds of elements ("node", "way" or "relation") in a
+    decompressed primitive block, without parsing it.
+
+    Only the keys of the block's fields and the first key of every group are
+    read, the string table and the elements themselves are skipped over. This
+    is much cheaper than `PrimitiveBlock.FromString`, which decodes them all.
+    """
+    kinds: set[str] = set()
+
+    for field_number, value in _iter_fields(block):
+        if field_number != PrimitiveBlock.PRIMITIVEGROUP_FIELD_NUMBER:
+            continue
+        assert isinstance(value, memoryview)
+
+        # a group holds elements of a single kind, in a single repeated field
+        for group_field, _ in _iter_fields(value):
+            if group_field in _GROUP_KINDS:
+                kinds.add(_GROUP_KINDS[group_field])
+            break
+
+    return frozenset(kinds)
+
+
+def _optional_module(*names: str) -> ModuleType | None:
+    """Import the first of the given modules that is installed."""
+    for name in names:
+        try:
+            return importlib.import_module(name)
+        except ImportError:
+            continue
+    return None
+
+
+# optional codecs, compression.zstd is part of the standard library from 3.14 on
+_lz4_block = _optional_module("lz4.block")
+_zstd = _optional_module("compression.zstd", "zstandard")
+
+
+class UnsupportedCompressionError(Exception):
+    pass
+
+
+def _decompress_lz4(payload: memoryview, raw_size: int) -> bytes:
+    if _lz4_block is None:
+        raise UnsupportedCompressionError(
+            "Blob is lz4 compressed, install the 'lz4' package, e.g. with "
+            "`pip install osm4gpd[lz4]`, to read it."
+        )
+    return _lz4_block.decompress(  # type: ignore[no-any-return]
+        payload, uncompressed_size=raw_size
+    )
+
+
+def _decompress_zstd(payload: memoryview, raw_size: int) -> bytes:
+    if _zstd is None:
+        raise UnsupportedCompressionError(
+            "Blob is zstd compressed, install the 'zstandard' package, e.g. with "
+            "`pip install osm4gpd[zstd]`, to read it."
         )
-        yield zlib.decompress(blob.zlib_data)
+    if _zstd.__name__ == "zstandard":
+        return _zstd.decompress(  # type: ignore[no-any-return]
+            payload, max_output_size=raw_size
+        )
+    return _zstd.decompress(payload)  # type: ignore[no-any-return]
+
+
+def decompress_blob(data: bytes | memoryview) -> bytes:
+    """Decompress a serialized blob, as returned by `read_blobs` or sliced from a
+    memory-mapped file.
+
+    Depending on the data field that is set, the payload is either returned as
+    is or decompressed with zlib, lzma, lz4 or zstd. The latter two require
+    the optional `lz4` and `zstandard` packages.
+    """
+    data_field, payload, raw_size = _split_blob(data)
+
+    match data_field:
+        case Blob.ZLIB_DATA_FIELD_NUMBER:
+            return zlib.decompress(payload)
+        case Blob.RAW_FIELD_NUMBER:
+            return payload.tobytes()
+        case Blob.ZSTD_DATA_FIELD_NUMBER:
+            return _decompress_zstd(payload, raw_size)
+        case Blob.LZ4_DATA_FIELD_NUMBER:
+            return _decompress_lz4(payload, raw_size)
+        case Blob.LZMA_DATA_FIELD_NUMBER:
+            return lzma.decompress(payload)
+        case _:
+            raise UnsupportedCompressionError(
+                f"Unsupported blob data field {data_field}."
+            )
+
+
+def read_blocks(f: BufferedReader) -> Generator[bytes, None, None]:
+    """Return a generator of blocks of bytes from the given file.
+
+    This corresponds to the fileformat part in the protobuf definitions.
+    """
+    for data in read_blobs(f):
+        yield decompress_blob(data)
@@ -0,0 +1,44 @@
+# Helpers for variable-length rows in compressed sparse row layout: the values
+# of row `i` are stored at `values[offsets[i]:offsets[i + 1]]`.
+import numpy as np
+from numpy.typing import NDArray
+
+
+def offsets_from_counts(counts: NDArray[np.int64]) -> NDArray[np.int64]:
+    """Return the offsets of rows with the given numbers of values."""
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+def row_index(offsets: NDArray[np.int64]) -> NDArray[np.int64]:
+    """Return the index of the row each value belongs to."""
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+
+def take(
+    offsets: NDArray[np.int64], indices: NDArray[np.int64]
+) -> tuple[NDArray[np.int64], NDArray[np.int64]]:
+    """Select the rows at `indices`, in that order.
+
+    Returns the offsets of the selected rows and the positions of their values
+    in the original values array.
+    """
+    starts = offsets[:-1][indices]
+    counts = np.diff(offsets)[indices]
+
+    new_offsets = offsets_from_counts(counts)
+    positions = np.repeat(starts - new_offsets[:-1], counts) + np.arange(
+        new_offsets[-1]
+    )
+    return new_offsets, positions
+
+
+def cumsum_rows(
+    values: NDArray[np.int64], offsets: NDArray[np.int64]
+) -> NDArray[np.int64]:
+    """Cumulative sum within each row, used to decode delta coded rows."""
+    total = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(values, out=total[1:])
+    # subtract the sum of all values before the start of each row
+    return total[1:] - np.repeat(total[offsets[:-1]], np.diff(offsets))
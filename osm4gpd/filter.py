@@ -1,99 +1,219 @@
+from dataclasses import dataclass, field
 from typing import TypeAlias, TypeVar
 
 import numpy as np
+import shapely
 from numpy.typing import NDArray
+from shapely import Polygon
 
-from .references import find_references
+from . import csr
+from .header import BBox
+from .locations import NodeLocations
+from .predicates import Predicate, as_predicate
+from .references import (
+    find_references,
+    isin_sorted,
+    relation_members,
+    union,
+    unique_ids,
+)
+from .tags import StringTable, Tags
 from .unpacked import BaseGroup, NodesGroup, RelationGroup, WayGroup
 
 ReferenceDict: TypeAlias = dict[str, NDArray[np.int64]]
 GroupType = TypeVar("GroupType", bound=BaseGroup)
 
+_EMPTY: NDArray[np.int64] = np.array([], dtype=np.int64)
 
-def get_elements_matching_tags(group: BaseGroup, tags: set[str]) -> NDArray[np.int64]:
-    """Return a set of osm ids that matches the given tags."""
-    return np.unique(
-        np.fromiter(
-            (
-                group.ids[idx]
-                for idx, element_tags in group.tags.items()
-                if len(tags.intersection(element_tags.keys())) > 0
-            ),
-            dtype=np.int64,
-        )
+
+@dataclass(frozen=True)
+class Selection:
+    """Selects elements while unpacking, that satisfy `predicate` or whose ids
+    are among the sorted `ids`."""
+
+    predicate: Predicate | None
+    ids: NDArray[np.int64] = field(default_factory=lambda: _EMPTY)
+
+    def __call__(self, ids: NDArray[np.int64], tags: Tags) -> NDArray[np.bool_]:
+        if self.predicate is None:
+            return isin_sorted(ids, self.ids)
+        return self.predicate(tags) | isin_sorted(ids, self.ids)
+
+
+def keep_ids(groups: list[GroupType], ids: NDArray[np.int64]) -> list[GroupType]:
+    """Reduce groups to the elements whose ids are among the sorted `ids`."""
+    return [group.take(isin_sorted(group.ids, ids)) for group in groups]
+
+
+def nodes_within(group: NodesGroup | NodeLocations, bbox: BBox) -> NDArray[np.bool_]:
+    """Return a mask of the nodes that lie within `bbox`, including its
+    boundary."""
+    if isinstance(bbox, Polygon):
+        shapely.prepare(bbox)
+        return np.asarray(shapely.intersects_xy(bbox, group.lon, group.lat))
+
+    minx, miny, maxx, maxy = bbox
+    return np.asarray(
+        (group.lon >= minx)
+        & (group.lon <= maxx)
+        & (group.lat >= miny)
+        & (group.lat <= maxy),
+        dtype=np.bool_,
     )
 
 
+def find_elements_within(
+    nodes: NDArray[np.int64],
+    ways: list[WayGroup],
+    relations: list[RelationGroup],
+) -> ReferenceDict:
+    """Resolve which elements to keep for a spatial cut, given the sorted ids of
+    the nodes within the area.
+
+    Ways are kept if any of their nodes is within the area, relations if any of
+    their node or way members is kept, together with the relations that contain
+    them. Kept elements are complete, i.e. all of their members are kept as
+    well, so that their geometries can be built the same way as without the cut.
+    """
+    way_ids: list[NDArray[np.int64]] = [_EMPTY]
+    for group in ways:
+        hits = isin_sorted(group.refs, nodes)
+        way_ids.append(
+            group.ids[
+                np.flatnonzero(
+                    np.bincount(
+                        csr.row_index(group.ref_offsets)[hits],
+                        minlength=len(group.ids),
+                    )
+                )
+            ]
+        )
+    kept_ways = union(way_ids)
+
+    members = [relation_members(group) for group in relations]
+    relation_ids: list[NDArray[np.int64]] = [_EMPTY]
+    for relation_group, (index, member_ids, member_types) in zip(relations, members):
+        hits = ((member_types == "node") & isin_sorted(member_ids, nodes)) | (
+            (member_types == "way") & isin_sorted(member_ids, kept_ways)
+        )
+        relation_ids.append(relation_group.ids[unique_ids(index[hits])])
+    kept_relations = union(relation_ids)
+
+    edges = [
+        (
+            group.ids[index[member_types == "relation"]],
+            member_ids[member_types == "relation"],
+        )
+        for group, (index, member_ids, member_types) in zip(relations, members)
+    ]
+    parent = np.concatenate([_EMPTY] + [p for p, _ in edges])
+    child = np.concatenate([_EMPTY] + [c for _, c in edges])
+
+    # add the relations that contain kept relations, then those contained in them
+    for source, target in ((child, parent), (parent, child)):
+        while True:
+            found = union([kept_relations, target[isin_sorted(source, kept_relations)]])
+            if len(found) == len(kept_relations):
+                break
+            kept_relations = found
+
+    # complete the kept relations, then the kept ways
+    member_nodes: list[NDArray[np.int64]] = [nodes]
+    member_ways: list[NDArray[np.int64]] = [kept_ways]
+    for relation_group, (index, member_ids, member_types) in zip(relations, members):
+        kept = isin_sorted(relation_group.ids, kept_relations)[index]
+        member_nodes.append(member_ids[kept & (member_types == "node")])
+        member_ways.append(member_ids[kept & (member_types == "way")])
+    kept_ways = union(member_ways)
+
+    for group in ways:
+        member_nodes.append(
+            group.refs_of(np.flatnonzero(isin_sorted(group.ids, kept_ways)))
+        )
+
+    return {
+        "node": union(member_nodes),
+        "way": kept_ways,
+        "relation": kept_relations,
+    }
+
+
+def get_elements_matching_tags(
+    group: BaseGroup, tags: set[str] | Predicate
+) -> NDArray[np.int64]:
+    """Return a set of osm ids that matches the given tags."""
+    return unique_ids(group.ids[as_predicate(tags)(group.tags)])
+
+
+def _get_elements_matching(
+    groups: list[GroupType], predicate: Predicate
+) -> NDArray[np.int64]:
+    """Same as `get_elements_matching_tags` for many groups, where the predicate
+    is compiled only once per string table."""
+    matching: list[NDArray[np.int64]] = []
+    strings: StringTable | None = None
+
+    for group in groups:
+        if group.tags.string_table is not strings:
+            strings = group.tags.string_table
+            compiled = predicate.compile(strings)
+        matching.append(unique_ids(group.ids[compiled(group.tags)]))
+
+    return np.concatenate(matching)
+
+
 def filter_groups(
-    groups: list[GroupType], tags: set[str], references: ReferenceDict | None = None
+    groups: list[GroupType],
+    tags: set[str] | Predicate | None,
+    references: ReferenceDict | None = None,
+    *,
+    assume_sorted: bool = False,
 ) -> tuple[list[GroupType], ReferenceDict]:
+    """Keep only elements that match `tags` or are referenced.
+
+    `tags` is either a predicate or a set of keys, of which elements need to
+    have any. With `None`, all elements are kept and only their references are
+    resolved, with an empty set only referenced elements are kept.
+
+    With `assume_sorted`, the ids of consecutive groups have to be ascending,
+    as declared by the `Sort.Type_then_ID` header feature. Membership tests
+    then use binary search against the already sorted ids.
+    """
     if references is None:
         references = {}
 
     if len(groups) == 0:
         return groups, references
 
-    matching_ids: NDArray[np.int64] = np.concatenate(
-        list(get_elements_matching_tags(group, tags) for group in groups)
+    matching_ids = (
+        np.concatenate([group.ids for group in groups])
+        if tags is None
+        else _get_elements_matching(groups, as_predicate(tags))
     )
 
+    isin = isin_sorted if assume_sorted else np.isin
+
     match groups[0]:
         case RelationGroup():
-            for k, v in find_references(
-                np.concatenate([matching_ids, references.get("relation", np.array([], dtype=np.int64))]), groups  # type: ignore[type-var]
-            ).items():
-                references[k] = np.unique(
-                    np.concatenate([references.get(k, np.array([], dtype=np.int64)), v])
-                )
+            kind = "relation"
         case WayGroup():
-            for k, v in find_references(
-                np.concatenate([matching_ids, references.get("way", np.array([], dtype=np.int64))]), groups  # type: ignore[type-var]
-            ).items():
-                references[k] = np.unique(
-                    np.concatenate([references.get(k, np.array([], dtype=np.int64)), v])
-                )
+            kind = "way"
         case _:
-            pass
+            kind = "node"
 
-    for group in groups:
-        match group:
-            case RelationGroup():
-                keep = np.where(
-                    np.isin(group.ids, matching_ids)
-                    | np.isin(group.ids, references.get("relation", []))
-                )[0]
-
-                group.ids = group.ids[keep]
-                group.version = [group.version[idx] for idx in keep]
-                group.member_ids = [group.member_ids[idx] for idx in keep]
-                group.member_types = [group.member_types[idx] for idx in keep]
-                group.member_roles = [group.member_roles[idx] for idx in keep]
-                group.tags = {i: group.tags.get(idx, {}) for i, idx in enumerate(keep)}
-                group.visible = [group.visible[idx] for idx in keep]
-                group.changeset = [group.changeset[idx] for idx in keep]
-            case WayGroup():
-                keep = np.where(
-                    np.isin(group.ids, matching_ids)
-                    | np.isin(group.ids, references.get("way", []))
-                )[0]
-
-                group.ids = group.ids[keep]
-                group.version = [group.version[idx] for idx in keep]
-                group.member_ids = [group.member_ids[idx] for idx in keep]
-                group.tags = {i: group.tags.get(idx, {}) for i, idx in enumerate(keep)}
-                group.visible = [group.visible[idx] for idx in keep]
-                group.changeset = [group.changeset[idx] for idx in keep]
-            case NodesGroup():
-                keep = np.where(
-                    np.isin(group.ids, matching_ids)
-                    | np.isin(group.ids, references.get("node", []))
-                )[0]
-                group.ids = group.ids[keep]
-                group.version = [group.version[idx] for idx in keep]
-                group.tags = {i: group.tags.get(idx, {}) for i, idx in enumerate(keep)}
-                group.visible = [group.visible[idx] for idx in keep]
-                group.changeset = [group.changeset[idx] for idx in keep]
-                group.lat = group.lat[keep]
-                group.lon = group.lon[keep]
+    if kind != "node":
+        for k, v in find_references(
+            union([matching_ids, references.get(kind, _EMPTY)]),
+            groups,  # type: ignore[type-var]
+        ).items():
+            references[k] = union([references.get(k, _EMPTY), v])
+
+    groups = [
+        group.take(
+            isin(group.ids, matching_ids)
+            | isin(group.ids, references.get(kind, _EMPTY))
+        )
+        for group in groups
+    ]
 
     return groups, references
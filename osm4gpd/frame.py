@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from numpy.typing import NDArray
+
+from . import csr
+from .tags import StringTable, Tags
+from .unpacked import BaseGroup
+
+# metadata columns, in the order they appear in the frame
+_METADATA = {"version": np.int32, "visible": np.bool_, "changeset": np.int64}
+
+
+@dataclass
+class _Part:
+    group: BaseGroup
+    geometries: NDArray[np.object_]
+    # positions of the elements of the group that become rows
+    rows: NDArray[np.int64]
+    # whether the position of each element is kept in the "idx" column
+    with_idx: bool
+
+
+@dataclass
+class FrameBuilder:
+    """Builds one frame from the elements of many groups at once.
+
+    Groups are added in the order of the rows, together with the geometries of
+    their elements. All columns are allocated once the total number of rows is
+    known and filled group by group, instead of building a frame per group
+    and concatenating them. Tags become one sparse column per key, for all
+    rows at once.
+    """
+
+    # string table of the tags, defaults to the one of the first group
+    strings: StringTable | None = None
+    _parts: list[_Part] = field(default_factory=list)
+
+    def add(
+        self,
+        group: BaseGroup,
+        geometries: NDArray[np.object_],
+        *,
+        rows: NDArray[np.bool_] | None = None,
+        with_idx: bool = False,
+    ) -> None:
+        """Add the elements of `group` with their geometries.
+
+        Args:
+            group: Elements to add.
+            geometries: Geometry of every element of the group.
+            rows: Mask of the elements that become rows, defaults to all.
+            with_idx: Keep the position of each element in the group in an
+                "idx" column, as is done for relations.
+        """
+        self._parts.append(
+            _Part(
+                group,
+                geometries,
+                (
+                    np.arange(len(group.ids))
+                    if rows is None
+                    else np.flatnonzero(rows).astype(np.int64)
+                ),
+                with_idx,
+            )
+        )
+
+    def __len__(self) -> int:
+        return sum(len(part.rows) for part in self._parts)
+
+    def _tags(self, strings: StringTable) -> Tags:
+        """Collect the tags of all rows."""
+        n_rows = len(self)
+        offsets = np.zeros(n_rows + 1, dtype=np.int64)
+        taken = [csr.take(part.group.tags.offsets, part.rows) for part in self._parts]
+        n_pairs = sum(len(positions) for _, positions in taken)
+        key_ids = np.empty(n_pairs, dtype=np.int32)
+        value_ids = np.empty(n_pairs, dtype=np.int32)
+
+        row = pair = 0
+        for part, (part_offsets, positions) in zip(self._parts, taken):
+            tags = part.group.tags.intern_into(strings)
+            offsets[row : row + len(part.rows) + 1] = part_offsets + pair
+            key_ids[pair : pair + len(positions)] = tags.key_ids[positions]
+            value_ids[pair : pair + len(positions)] = tags.value_ids[positions]
+            row += len(part.rows)
+            pair += len(positions)
+
+        return Tags(offsets, key_ids, value_ids, strings)
+
+    def _idx(self) -> tuple[NDArray[Any] | None, int]:
+        """Return the "idx" column, if any of its rows are set, and the number
+        of rows before the first one that is."""
+        if not any(part.with_idx and len(part.rows) > 0 for part in self._parts):
+            return None, 0
+
+        # rows of elements without position are missing
+        with_idx = all(part.with_idx for part in self._parts)
+        idx: NDArray[Any] = np.empty(
+            len(self), dtype=np.int64 if with_idx else np.float64
+        )
+
+        row = 0
+        first = None
+        for part in self._parts:
+            end = row + len(part.rows)
+            if part.with_idx:
+                idx[row:end] = part.rows
+                if first is None and end > row:
+                    first = row
+            else:
+                idx[row:end] = np.nan
+            row = end
+
+        return idx, first or 0
+
+    def build(self) -> gpd.GeoDataFrame:
+        """Return the frame of all rows, indexed by the ids of the elements."""
+        n_rows = len(self)
+        ids = np.empty(n_rows, dtype=np.int64)
+        geometry = np.empty(n_rows, dtype=np.object_)
+        metadata: dict[str, NDArray[Any]] = {
+            name: np.empty(n_rows, dtype=dtype) for name, dtype in _METADATA.items()
+        }
+
+        row = 0
+        for part in self._parts:
+            end = row + len(part.rows)
+            ids[row:end] = part.group.ids[part.rows]
+            geometry[row:end] = part.geometries[part.rows]
+            for name, values in metadata.items():
+                source = getattr(part.group, name)
+                # metadata is optional in the file format, it is empty if it
+                # is missing
+                values[row:end] = source[part.rows] if len(source) > 0 else 0
+            row = end
+
+        strings = self.strings
+        if strings is None:
+            strings = (
+                self._parts[0].group.tags.string_table
+                if len(self._parts) > 0
+                else StringTable()
+            )
+        tags = self._tags(strings)
+        tag_columns = tags.to_columns()
+
+        columns: dict[str, object] = {"geometry": geometry, **metadata}
+        idx, first = self._idx()
+        # tags must not replace the columns of the frame itself
+        overlap = sorted(
+            {*columns, *(() if idx is None else ("idx",))}.intersection(tag_columns)
+        )
+        if len(overlap) > 0:
+            raise ValueError(f"Keys of tags overlap with columns: {overlap}")
+
+        if idx is None:
+            columns.update(tag_columns)
+        else:
+            # the column goes after the keys of all rows before the first
+            # row that has a position
+            n_keys = len(np.unique(tags.key_ids[: tags.offsets[first]]))
+            keys = list(tag_columns)
+            columns.update({key: tag_columns[key] for key in keys[:n_keys]})
+            columns["idx"] = idx
+            columns.update({key: tag_columns[key] for key in keys[n_keys:]})
+
+        return gpd.GeoDataFrame(
+            columns, index=pd.Index(ids, name="id"), crs="EPSG:4326"
+        )
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import TypeAlias
+
+from shapely import Polygon, box, intersects
+
+from .proto import HeaderBlock
+
+__all__ = ["Header"]
+
+logger = logging.getLogger(__name__)
+
+BBox: TypeAlias = tuple[float, float, float, float] | Polygon
+
+# required features that this parser understands, see
+# https://wiki.openstreetmap.org/wiki/PBF_Format#Definition_of_the_OSMHeader_fileblock
+SUPPORTED_FEATURES = frozenset({"OsmSchema-V0.6", "DenseNodes"})
+
+
+def as_polygon(bbox: BBox) -> Polygon:
+    """Convert a `(minx, miny, maxx, maxy)` tuple to a polygon, polygons are
+    returned as is."""
+    if isinstance(bbox, Polygon):
+        return bbox
+    return box(*bbox)
+
+
+@dataclass(frozen=True)
+class Header:
+    """Content of the OSMHeader block of a file.
+
+    `bbox` is given as `(minx, miny, maxx, maxy)` in degrees.
+    """
+
+    bbox: tuple[float, float, float, float] | None = None
+    required_features: tuple[str, ...] = ()
+    optional_features: tuple[str, ...] = ()
+    writingprogram: str | None = None
+    source: str | None = None
+    replication_timestamp: datetime | None = None
+    replication_sequence_number: int | None = None
+    replication_base_url: str | None = None
+
+    @classmethod
+    def from_header_block(cls, block: HeaderBlock) -> Header:
+        return cls(
+            bbox=(
+                block.bbox.left * 1e-9,
+                block.bbox.bottom * 1e-9,
+                block.bbox.right * 1e-9,
+                block.bbox.top * 1e-9,
+            )
+            if block.HasField("bbox")
+            else None,
+            required_features=tuple(block.required_features),
+            optional_features=tuple(block.optional_features),
+            writingprogram=block.writingprogram
+            if block.HasField("writingprogram")
+            else None,
+            source=block.source if block.HasField("source") else None,
+            replication_timestamp=datetime.fromtimestamp(
+                block.osmosis_replication_timestamp, tz=timezone.utc
+            )
+            if block.HasField("osmosis_replication_timestamp")
+            else None,
+            replication_sequence_number=block.osmosis_replication_sequence_number
+            if block.HasField("osmosis_replication_sequence_number")
+            else None,
+            replication_base_url=block.osmosis_replication_base_url
+            if block.HasField("osmosis_replication_base_url")
+            else None,
+        )
+
+    @property
+    def is_sorted(self) -> bool:
+        """Whether elements are ordered by type (nodes, ways, relations) and
+        then by id."""
+        return "Sort.Type_then_ID" in (self.required_features + self.optional_features)
+
+    def check_features(self) -> None:
+        """Warn if the file requires features this parser does not understand.
+
+        Such files are read all the same, as none of the known features change
+        how blocks are decoded, but their elements may not mean what they seem
+        to, e.g. elements occur in several versions with
+        "HistoricalInformation".
+        """
+        unsupported = set(self.required_features) - SUPPORTED_FEATURES
+        if len(unsupported) > 0:
+            logger.warning(
+                "File requires features that are not supported, it is read as "
+                "if it did not: %s",
+                ", ".join(sorted(unsupported)),
+            )
+
+    def intersects(self, bbox: BBox) -> bool:
+        """Check whether the file may contain data within `bbox`.
+
+        Files without a bounding box in their header may contain anything.
+        """
+        if self.bbox is None:
+            return True
+        return bool(intersects(box(*self.bbox), as_polygon(bbox)))
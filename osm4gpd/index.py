@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import json
+from dataclasses import astuple, dataclass, field
+from pathlib import Path
+
+import numpy as np
+from numpy.typing import NDArray
+
+from .blocks import decompress_blob, read_blob_at, scan_blobs
+from .proto import PrimitiveBlock
+
+__all__ = ["BlobInfo", "BlobIndex"]
+
+# bump this whenever the layout of the sidecar file changes
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".idx"
+
+
+@dataclass(frozen=True)
+class BlobInfo:
+    """Location and content summary of a single blob.
+
+    `kinds`, `min_id` and `max_id` are only known if the blob has been peeked
+    into while building the index.
+    """
+
+    offset: int
+    size: int
+    type: str
+    kinds: tuple[str, ...] | None = None
+    min_id: int | None = None
+    max_id: int | None = None
+
+    def may_contain(self, kind: str, ids: NDArray[np.int64]) -> bool:
+        """Check whether any of the sorted `ids` of the given element kind may be
+        stored in this blob."""
+        if self.type != "OSMData":
+            return False
+        if self.kinds is not None and kind not in self.kinds:
+            return False
+        if self.min_id is None or self.max_id is None:
+            return True
+
+        pos = np.searchsorted(ids, self.min_id)
+        return bool(pos < len(ids) and ids[pos] <= self.max_id)
+
+
+def _peek(data: bytes) -> tuple[tuple[str, ...], int | None, int | None]:
+    """Return the element kinds and the id range contained in a blob."""
+    block = PrimitiveBlock.FromString(decompress_blob(data))
+
+    kinds: set[str] = set()
+    ids: list[NDArray[np.int64]] = []
+
+    for group in block.primitivegroup:
+        if len(group.dense.id) > 0:
+            kinds.add("node")
+            ids.append(np.cumsum(np.asarray(group.dense.id, dtype=np.int64)))
+        if len(group.nodes) > 0:
+            kinds.add("node")
+            ids.append(np.fromiter((n.id for n in group.nodes), dtype=np.int64))
+        if len(group.ways) > 0:
+            kinds.add("way")
+            ids.append(np.fromiter((w.id for w in group.ways), dtype=np.int64))
+        if len(group.relations) > 0:
+            kinds.add("relation")
+            ids.append(np.fromiter((r.id for r in group.relations), dtype=np.int64))
+
+    if len(ids) == 0:
+        return tuple(sorted(kinds)), None, None
+
+    all_ids = np.concatenate(ids)
+    return tuple(sorted(kinds)), int(all_ids.min()), int(all_ids.max())
+
+
+@dataclass
+class BlobIndex:
+    """Byte offsets and content summaries of all blobs in a .osm.pbf file.
+
+    The index can be persisted as a sidecar file next to the data file, so
+    that later reads can seek directly to the blobs they need.
+    """
+
+    blobs: list[BlobInfo] = field(default_factory=list)
+    file_size: int = 0
+    file_mtime_ns: int = 0
+
+    @staticmethod
+    def sidecar_path(fp: Path | str) -> Path:
+        fp = Path(fp)
+        return fp.with_name(fp.name + INDEX_SUFFIX)
+
+    @classmethod
+    def build(cls, fp: Path | str, *, peek: bool = True) -> BlobIndex:
+        """Scan a file and index its blobs.
+
+        Args:
+            fp: Path to the file.
+            peek: Whether to decompress data blobs to record the element kinds
+                and the id range they contain. Without peeking only the blob
+                headers are parsed.
+        """
+        fp = Path(fp)
+        stat = fp.stat()
+        blobs: list[BlobInfo] = []
+
+        with open(fp, "rb") as f:
+            for header, offset in scan_blobs(f):
+                if peek and header.type == "OSMData":
+                    kinds, min_id, max_id = _peek(
+                        read_blob_at(f, offset, header.datasize)
+                    )
+                    blobs.append(
+                        BlobInfo(
+                            offset, header.datasize, header.type, kinds, min_id, max_id
+                        )
+                    )
+                else:
+                    blobs.append(BlobInfo(offset, header.datasize, header.type))
+
+        return cls(blobs, file_size=stat.st_size, file_mtime_ns=stat.st_mtime_ns)
+
+    def save(self, path: Path | str) -> None:
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "version": INDEX_VERSION,
+                    "file_size": self.file_size,
+                    "file_mtime_ns": self.file_mtime_ns,
+                    "blobs": [astuple(blob) for blob in self.blobs],
+                },
+                f,
+            )
+
+    @classmethod
+    def load(cls, path: Path | str) -> BlobIndex:
+        with open(path, "r") as f:
+            content = json.load(f)
+
+        if content.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported index version in {path}")
+
+        return cls(
+            [
+                BlobInfo(
+                    offset,
+                    size,
+                    type_,
+                    tuple(kinds) if kinds is not None else None,
+                    min_id,
+                    max_id,
+                )
+                for offset, size, type_, kinds, min_id, max_id in content["blobs"]
+            ],
+            file_size=content["file_size"],
+            file_mtime_ns=content["file_mtime_ns"],
+        )
+
+    @classmethod
+    def for_file(cls, fp: Path | str, *, persist: bool = True) -> BlobIndex:
+        """Return the index of a file, reusing its sidecar if it is up to date.
+
+        If the sidecar is missing or stale, the file is scanned and, with
+        `persist`, the sidecar is (re-)written.
+        """
+        index = cls.load_current(fp)
+        if index is not None:
+            return index
+
+        index = cls.build(fp)
+        if persist:
+            index.save(cls.sidecar_path(fp))
+        return index
+
+    @classmethod
+    def load_current(cls, fp: Path | str) -> BlobIndex | None:
+        """Return the index from the sidecar of a file, if there is one and it is
+        up to date."""
+        sidecar = cls.sidecar_path(fp)
+        if not sidecar.exists():
+            return None
+
+        try:
+            index = cls.load(sidecar)
+        except (ValueError, KeyError, TypeError):
+            return None
+
+        return index if index.is_current(fp) else None
+
+    def is_current(self, fp: Path | str) -> bool:
+        """Check that the indexed file has not changed since indexing."""
+        stat = Path(fp).stat()
+        return stat.st_size == self.file_size and stat.st_mtime_ns == self.file_mtime_ns
+
+    def data_blobs(self, kind: str | None = None) -> list[BlobInfo]:
+        """Return all data blobs, optionally only those that may contain elements
+        of the given kind."""
+        return [
+            blob
+            for blob in self.blobs
+            if blob.type == "OSMData"
+            and (kind is None or blob.kinds is None or kind in blob.kinds)
+        ]
+
+    def lookup(self, kind: str, ids: NDArray[np.int64]) -> list[BlobInfo]:
+        """Return all blobs that may contain any of the given element ids."""
+        ids = np.unique(np.asarray(ids, dtype=np.int64))
+        return [blob for blob in self.blobs if blob.may_contain(kind, ids)]
@@ -0,0 +1,335 @@
+from __future__ import annotations
+
+import shutil
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Sequence
+
+import numpy as np
+import shapely
+from numpy.lib.format import open_memmap
+from numpy.typing import DTypeLike, NDArray
+
+from .unpacked import NodesGroup
+
+__all__ = ["NodeLocations", "MissingNodesError"]
+
+_FIELDS = ("ids", "lon", "lat")
+_DTYPES = (np.int64, np.float64, np.float64)
+# number of nodes that are sorted in memory at once when writing to disk
+_CHUNK_SIZE = 1 << 22
+
+
+class MissingNodesError(KeyError):
+    """Raised when elements reference nodes that are not loaded, `ids` holds
+    all of the missing node ids."""
+
+    def __init__(self, ids: NDArray[np.int64]) -> None:
+        self.ids = ids
+        super().__init__(
+            f"{len(ids)} referenced nodes are missing, e.g. {ids[:10].tolist()}"
+        )
+
+
+def _is_ascending(ids: NDArray[np.int64]) -> bool:
+    return bool(np.all(ids[1:] > ids[:-1]))
+
+
+def _open_array(fp: Path, dtype: DTypeLike, size: int) -> np.memmap[Any, np.dtype[Any]]:
+    array: np.memmap[Any, np.dtype[Any]] = open_memmap(
+        fp, mode="w+", dtype=dtype, shape=(size,)
+    )
+    return array
+
+
+def _merge_runs(
+    sources: Sequence[NDArray[Any]],
+    runs: list[tuple[int, int]],
+    targets: Sequence[NDArray[Any]],
+) -> None:
+    """Merge runs of `sources` that are sorted by id, `sources[0]`, into
+    `targets`.
+
+    Each run is read sequentially through a buffer, so that no more than about
+    `_CHUNK_SIZE` nodes are held in memory at once. In every step, all
+    buffered nodes up to the smallest last id of any buffer that does not
+    reach the end of its run are written, as no node that follows in any run
+    can come before them.
+    """
+    size = max(_CHUNK_SIZE // max(len(runs), 1), 1)
+    cursors = [start for start, _ in runs]
+    written = 0
+
+    while True:
+        active = [i for i, (_, end) in enumerate(runs) if cursors[i] < end]
+        if len(active) == 0:
+            break
+
+        buffers = [
+            sources[0][cursors[i] : min(cursors[i] + size, runs[i][1])] for i in active
+        ]
+        bounds = [
+            buffer[-1]
+            for i, buffer in zip(active, buffers)
+            if cursors[i] + len(buffer) < runs[i][1]
+        ]
+        counts = (
+            [len(buffer) for buffer in buffers]
+            if len(bounds) == 0
+            else [
+                int(np.searchsorted(buffer, min(bounds), side="right"))
+                for buffer in buffers
+            ]
+        )
+
+        ids = np.concatenate([buffer[:n] for buffer, n in zip(buffers, counts)])
+        order = np.argsort(ids, kind="stable")
+        end = written + len(ids)
+        targets[0][written:end] = ids[order]
+        for source, target in zip(sources[1:], targets[1:]):
+            values = np.concatenate(
+                [source[cursors[i] : cursors[i] + n] for i, n in zip(active, counts)]
+            )
+            target[written:end] = values[order]
+
+        for i, n in zip(active, counts):
+            cursors[i] += n
+        written = end
+
+
+class LocationWriter:
+    """Writes the locations of nodes to disk group by group, as they are read,
+    so that they never have to be held in memory all at once.
+
+    The locations are written to a new subdirectory of `directory`, so that
+    the files of stores that are still mapped are never overwritten. Nodes are
+    buffered and written in runs of about `_CHUNK_SIZE` nodes, each sorted by
+    id on its own, which `finish` merges into the files that `NodeLocations`
+    maps, unless the nodes were in order to begin with.
+    """
+
+    def __init__(self, directory: Path | str) -> None:
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        self.directory = Path(tempfile.mkdtemp(prefix="nodes-", dir=directory))
+        self._files = [
+            open(self.directory / f"unsorted-{name}.bin", "wb") for name in _FIELDS
+        ]
+        self._buffer: list[NodesGroup] = []
+        self._buffered = 0
+        self._runs: list[tuple[int, int]] = []
+        self._in_order = True
+        self._last_id: int | None = None
+
+    def __len__(self) -> int:
+        return (self._runs[-1][1] if len(self._runs) > 0 else 0) + self._buffered
+
+    def add(self, group: NodesGroup) -> None:
+        """Add the locations of the nodes in `group`."""
+        if len(group.ids) == 0:
+            return
+
+        if self._in_order and (
+            not _is_ascending(group.ids)
+            or (self._last_id is not None and group.ids[0] <= self._last_id)
+        ):
+            self._in_order = False
+        self._last_id = int(group.ids[-1])
+
+        self._buffer.append(group)
+        self._buffered += len(group.ids)
+        if self._buffered >= _CHUNK_SIZE:
+            self._write_run()
+
+    def _write_run(self) -> None:
+        if self._buffered == 0:
+            return
+
+        ids = np.concatenate([group.ids for group in self._buffer])
+        order = None if _is_ascending(ids) else np.argsort(ids, kind="stable")
+        for f, name, dtype in zip(self._files, _FIELDS, _DTYPES):
+            values = np.concatenate([getattr(group, name) for group in self._buffer])
+            values = values if order is None else values[order]
+            values.astype(dtype, copy=False).tofile(f)
+
+        start = len(self) - self._buffered
+        self._runs.append((start, start + self._buffered))
+        self._buffer, self._buffered = [], 0
+
+    def finish(self) -> NodeLocations:
+        """Sort the locations that have been added and memory-map them."""
+        self._write_run()
+        for f in self._files:
+            f.close()
+
+        n_nodes = len(self)
+        sources = [
+            (
+                np.memmap(
+                    self.directory / f"unsorted-{name}.bin",
+                    dtype=dtype,
+                    mode="r",
+                    shape=(n_nodes,),
+                )
+                if n_nodes > 0
+                else np.empty(0, dtype=dtype)
+            )
+            for name, dtype in zip(_FIELDS, _DTYPES)
+        ]
+        targets = [
+            _open_array(self.directory / f"{name}.npy", dtype, n_nodes)
+            for name, dtype in zip(_FIELDS, _DTYPES)
+        ]
+
+        if self._in_order:
+            for start in range(0, n_nodes, _CHUNK_SIZE):
+                for source, target in zip(sources, targets):
+                    target[start : start + _CHUNK_SIZE] = source[
+                        start : start + _CHUNK_SIZE
+                    ]
+        else:
+            _merge_runs(sources, self._runs, targets)
+
+        for target in targets:
+            target.flush()
+        del sources, targets
+        self._remove_unsorted()
+
+        return NodeLocations.open(self.directory)
+
+    def discard(self) -> None:
+        """Remove everything that has been written."""
+        for f in self._files:
+            f.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _remove_unsorted(self) -> None:
+        for name in _FIELDS:
+            (self.directory / f"unsorted-{name}.bin").unlink()
+
+
+@dataclass(repr=False)
+class NodeLocations:
+    """Coordinates of nodes, looked up by id.
+
+    `ids` are sorted in ascending order, `lon` and `lat` are the coordinates of
+    the node with the id at the same position. The arrays are either held in
+    memory or memory-mapped from disk, lookups work the same way for both.
+    """
+
+    ids: NDArray[np.int64]
+    lon: NDArray[np.float64]
+    lat: NDArray[np.float64]
+
+    @classmethod
+    def from_groups(
+        cls, groups: list[NodesGroup], *, directory: Path | str | None = None
+    ) -> NodeLocations:
+        """Collect the locations of all nodes in `groups`.
+
+        Args:
+            groups: Groups of nodes.
+            directory: If given, the locations are written to `.npy` files in
+                a new subdirectory of this directory, see `LocationWriter`,
+                and memory-mapped from there, instead of being concatenated
+                and sorted in memory.
+        """
+        if directory is not None:
+            return cls._write(groups, Path(directory))
+
+        if len(groups) == 0:
+            empty = np.array([], dtype=np.float64)
+            return cls(np.array([], dtype=np.int64), empty, empty)
+
+        ids = np.concatenate([group.ids for group in groups])
+        lon = np.concatenate([group.lon for group in groups])
+        lat = np.concatenate([group.lat for group in groups])
+
+        # files sorted by type and id are already in order
+        if not _is_ascending(ids):
+            order = np.argsort(ids, kind="stable")
+            ids, lon, lat = ids[order], lon[order], lat[order]
+
+        return cls(ids, lon, lat)
+
+    @classmethod
+    def open(cls, directory: Path | str) -> NodeLocations:
+        """Memory-map locations that have been written to `directory` before."""
+        directory = Path(directory)
+        return cls(
+            *(np.load(directory / f"{name}.npy", mmap_mode="r") for name in _FIELDS)
+        )
+
+    @classmethod
+    def _write(cls, groups: list[NodesGroup], directory: Path) -> NodeLocations:
+        writer = LocationWriter(directory)
+        try:
+            for group in groups:
+                writer.add(group)
+            return writer.finish()
+        except BaseException:
+            writer.discard()
+            raise
+
+    @property
+    def directory(self) -> Path | None:
+        """Directory the locations are memory-mapped from, if they are."""
+        if isinstance(self.ids, np.memmap) and self.ids.filename is not None:
+            return Path(self.ids.filename).parent
+        return None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _search(
+        self, ids: NDArray[np.int64]
+    ) -> tuple[NDArray[np.int64], NDArray[np.int64], NDArray[np.bool_]]:
+        """Binary search for `ids` in ascending order, so that locations stored
+        on disk are read sequentially.
+
+        Returns the order in which `ids` were looked up, their positions in
+        that order and whether they were found.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        order = np.argsort(ids, kind="stable")
+        sorted_ids = ids[order]
+
+        if len(self.ids) == 0:
+            return (
+                order,
+                np.zeros(len(ids), dtype=np.int64),
+                np.zeros(len(ids), dtype=np.bool_),
+            )
+
+        pos = np.searchsorted(self.ids, sorted_ids)
+        pos[pos == len(self.ids)] = 0
+        return order, pos, np.asarray(self.ids[pos] == sorted_ids, dtype=np.bool_)
+
+    def contains(self, ids: NDArray[np.int64]) -> NDArray[np.bool_]:
+        """Return a mask of the given ids that have a known location."""
+        order, _, found = self._search(ids)
+        result = np.empty(len(order), dtype=np.bool_)
+        result[order] = found
+        return result
+
+    def coordinates(self, ids: NDArray[np.int64]) -> NDArray[np.float64]:
+        """Return the `(lon, lat)` coordinates of the given ids as array of shape
+        `(len(ids), 2)`.
+
+        Raises:
+            MissingNodesError: If any of the ids has no known location.
+        """
+        order, pos, found = self._search(ids)
+        if not found.all():
+            raise MissingNodesError(np.unique(np.asarray(ids)[order[~found]]))
+
+        result = np.empty((len(order), 2), dtype=np.float64)
+        result[order, 0] = self.lon[pos]
+        result[order, 1] = self.lat[pos]
+        return result
+
+    def points(self, ids: NDArray[np.int64]) -> NDArray[np.object_]:
+        """Return the locations of the given ids as points."""
+        points: NDArray[np.object_] = shapely.points(self.coordinates(ids))
+        return points
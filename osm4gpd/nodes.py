@@ -1,24 +1,18 @@
 import geopandas as gpd
-import pandas as pd
+import numpy as np
+import shapely
+from numpy.typing import NDArray
 
+from .frame import FrameBuilder
 from .unpacked import NodesGroup
 
 
-def consolidate_nodes(group: NodesGroup) -> gpd.GeoDataFrame:
-    nodes = gpd.GeoDataFrame(
-        {
-            "geometry": gpd.points_from_xy(group.lon, group.lat, crs="EPSG:4326"),
-            "id": group.ids,
-            "version": group.version,
-            "visible": group.visible,
-            "changeset": group.changeset,
-        }
-    )
+def node_geometries(group: NodesGroup) -> NDArray[np.object_]:
+    points: NDArray[np.object_] = shapely.points(group.lon, group.lat)
+    return points
 
-    tags = pd.DataFrame.from_dict(
-        group.tags,
-        orient="index",
-        dtype=str(pd.SparseDtype(str)),
-    )
 
-    return nodes.join(tags).set_index("id")
+def consolidate_nodes(group: NodesGroup) -> gpd.GeoDataFrame:
+    builder = FrameBuilder()
+    builder.add(group, node_geometries(group))
+    return builder.build()
@@ -1,62 +1,549 @@
 from __future__ import annotations
 
-from collections import defaultdict
+import mmap
+import shutil
+import weakref
+from collections import deque
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from contextlib import nullcontext
 from dataclasses import dataclass, field
+from functools import partial
 from pathlib import Path
-from typing import Generator, TypeAlias
+from typing import Callable, Collection, Generator, Iterable, TypeAlias, TypeVar
 
 import geopandas as gpd
+import numpy as np
 import pandas as pd
-from shapely import Polygon
-
-from .blocks import read_blocks
-from .filter import filter_groups
-from .nodes import consolidate_nodes
-from .proto import HeaderBlock, PrimitiveBlock
-from .relations import consolidate_relations
-from .unpacked import BaseGroup, NodesGroup, RelationGroup, WayGroup
-from .ways import consolidate_ways
+from numpy.typing import NDArray
+
+from .blocks import decompress_blob, map_file, peek_block_kinds, scan_mapped_blobs
+from .filter import (
+    ReferenceDict,
+    Selection,
+    filter_groups,
+    find_elements_within,
+    keep_ids,
+    nodes_within,
+)
+from .frame import FrameBuilder
+from .header import BBox, Header
+from .index import BlobIndex, BlobInfo
+from .locations import LocationWriter, NodeLocations
+from .nodes import node_geometries
+from .predicates import Predicate, as_predicate
+from .proto import HeaderBlock, PrimitiveBlock, PrimitiveGroup
+from .references import union
+from .relations import relation_geometries
+from .tags import StringTable
+from .unpacked import BaseGroup, NodesGroup, RelationGroup, Selector, WayGroup
+from .unpacked.base import GroupT
+from .ways import way_geometries
 
 __all__ = ["OSMFile"]
 
-BBox: TypeAlias = tuple[float, float, float, float] | Polygon
-ReferenceDict: TypeAlias = defaultdict[str, set[int]]
+# byte offset and size of a serialized blob within a file
+BlobLocation: TypeAlias = tuple[int, int]
+
+
+# kinds of elements, as used throughout the package
+ALL_KINDS = frozenset({"node", "way", "relation"})
+# order of the kinds in files that are sorted by type, see `Header.is_sorted`
+_KIND_ORDER = {"node": 0, "way": 1, "relation": 2}
+
+# kinds of the elements in the blobs that have been looked at
+BlobKinds: TypeAlias = dict[BlobLocation, frozenset[str]]
+# blobs that are described by a blob index, by their location
+KnownBlobs: TypeAlias = dict[BlobLocation, BlobInfo]
+
+_EMPTY: NDArray[np.int64] = np.array([], dtype=np.int64)
+
+T = TypeVar("T")
+
+
+def _as_kinds(kinds: Iterable[str]) -> frozenset[str]:
+    kinds = frozenset(kinds)
+    if len(kinds) == 0 or not kinds <= ALL_KINDS:
+        raise ValueError(
+            f"Kinds of elements must be a non-empty subset of {sorted(ALL_KINDS)}, "
+            f"got {sorted(kinds)}."
+        )
+    return kinds
+
+
+def _is_closed(kinds: frozenset[str]) -> bool:
+    """Check whether elements of `kinds` only reference elements of `kinds`."""
+    return ("way" not in kinds or "node" in kinds) and (
+        "relation" not in kinds or kinds == ALL_KINDS
+    )
+
+
+def _group_kind(group: PrimitiveGroup) -> str | None:
+    # each group contains only one field at a time, where the fields can be
+    # nodes, dense, ways, relations or changesets
+    if len(group.nodes) > 0 or len(group.dense.id) > 0:
+        return "node"
+    if len(group.ways) > 0:
+        return "way"
+    if len(group.relations) > 0:
+        return "relation"
+    return None
 
 
 def _unpack_primitive_block(
     block: PrimitiveBlock,
+    interner: StringTable,
+    kinds: Collection[str] = ALL_KINDS,
+    select: Selector | None = None,
 ) -> Generator[BaseGroup, None, None]:
     string_table: list[str] = [x.decode("utf-8") for x in block.stringtable.s]
 
     for group in block.primitivegroup:
-        # each group contains only one field at a time, where the fields can be
-        # nodes, dense, ways, relations or changesets
+        kind = _group_kind(group)
+        if kind not in kinds:
+            continue
 
         if len(group.nodes) > 0:
             raise NotImplementedError()
 
-        if len(group.dense.id) > 0:
-            yield NodesGroup.from_dense_group(
-                group,
-                string_table,
-                granularity=block.granularity,
-                lat_offset=block.lat_offset,
-                lon_offset=block.lon_offset,
+        match kind:
+            case "node":
+                yield NodesGroup.from_dense_group(
+                    group,
+                    string_table,
+                    granularity=block.granularity,
+                    lat_offset=block.lat_offset,
+                    lon_offset=block.lon_offset,
+                    interner=interner,
+                    select=select,
+                )
+            case "way":
+                yield WayGroup.from_primitive_group(
+                    group, string_table, interner=interner
+                )
+            case "relation":
+                yield RelationGroup.from_primitive_group(
+                    group, string_table, interner=interner
+                )
+
+
+def _unpack_blob(
+    data: bytes | memoryview,
+    interner: StringTable | None = None,
+    kinds: Collection[str] = ALL_KINDS,
+    select: Selector | None = None,
+) -> tuple[list[BaseGroup], frozenset[str]]:
+    """Decompress and unpack the groups of the given kinds from a single
+    serialized blob.
+
+    This is the unit of work that is sent to worker processes, hence it
+    returns a list instead of a generator. Workers can not share the string
+    table of the file, they intern into a table of their own instead.
+
+    Returns the groups and the kinds of all elements in the blob. Blobs without
+    elements of the given kinds are only peeked into, but not parsed. Node
+    groups are reduced to the nodes accepted by `select` while unpacking.
+    """
+    data = decompress_blob(data)
+    block_kinds = peek_block_kinds(data)
+    if block_kinds.isdisjoint(kinds):
+        return [], block_kinds
+
+    return (
+        list(
+            _unpack_primitive_block(
+                PrimitiveBlock.FromString(data),
+                interner if interner is not None else StringTable(),
+                kinds,
+                select,
             )
+        ),
+        block_kinds,
+    )
 
-        if len(group.ways) > 0:
-            yield WayGroup.from_primitive_group(group, string_table)
 
-        if len(group.relations) > 0:
-            yield RelationGroup.from_primitive_group(group, string_table)
+# memory-mapped file and selection of a worker process, set by
+# `_init_worker`
+_worker_buffer: memoryview | None = None
+_worker_select: Selector | None = None
+
+
+def _init_worker(fp: Path, select: Selector | None = None) -> None:
+    """Map the file once per worker process, so that tasks only need to carry
+    offsets instead of the blob bytes. The selection, which may hold many ids,
+    is also sent only once."""
+    global _worker_buffer, _worker_select
+
+    _worker_select = select
+    with open(fp, "rb") as f:
+        _worker_buffer = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def _unpack_mapped_blob(
+    offset: int, size: int, kinds: Collection[str]
+) -> tuple[list[BaseGroup], frozenset[str]]:
+    assert _worker_buffer is not None, "worker was not initialized"
+    return _unpack_blob(
+        _worker_buffer[offset : offset + size], kinds=kinds, select=_worker_select
+    )
+
+
+def _intern_groups(
+    groups: list[BaseGroup], interner: StringTable
+) -> Generator[BaseGroup, None, None]:
+    for group in groups:
+        group.tags = group.tags.intern_into(interner)
+        yield group
+
+
+def _blobs_with_ids(
+    blobs: Iterable[BlobLocation],
+    known: KnownBlobs,
+    kind: str,
+    ids: NDArray[np.int64],
+) -> list[BlobLocation]:
+    """Drop the blobs that can not contain any of the sorted `ids`, according to
+    the id ranges in the blob index."""
+    return [
+        location
+        for location in blobs
+        if location not in known or known[location].may_contain(kind, ids)
+    ]
+
+
+def _is_past(block_kinds: frozenset[str], kinds: Collection[str]) -> bool:
+    """Check whether a blob with elements of `block_kinds` comes after all
+    elements of `kinds`, in a file that is sorted by type."""
+    return len(block_kinds) > 0 and min(
+        _KIND_ORDER[kind] for kind in block_kinds
+    ) > max(_KIND_ORDER[kind] for kind in kinds)
+
+
+def _locations_to_read(
+    blobs: Iterable[BlobLocation],
+    kinds: Collection[str],
+    known: KnownBlobs,
+    blob_kinds: BlobKinds,
+    is_sorted: bool,
+) -> Generator[BlobLocation, None, None]:
+    """Skip the blobs that contain no elements of `kinds` according to the blob
+    index, recording their kinds in `blob_kinds`."""
+    for location in blobs:
+        info = known.get(location)
+        if info is None or info.kinds is None:
+            yield location
+            continue
+
+        blob_kinds[location] = frozenset(info.kinds)
+        if is_sorted and _is_past(blob_kinds[location], kinds):
+            return
+        if not blob_kinds[location].isdisjoint(kinds):
+            yield location
 
 
 def _read_and_unpack_groups(
-    file_iterator: Generator[bytes, None, None],
+    fp: Path,
+    buffer: memoryview,
+    blobs: Iterable[BlobLocation],
+    interner: StringTable,
+    *,
+    kinds: Collection[str] = ALL_KINDS,
+    blob_kinds: BlobKinds | None = None,
+    known: KnownBlobs | None = None,
+    is_sorted: bool = False,
+    select: Selector | None = None,
+    workers: int = 1,
+    max_in_flight: int | None = None,
+) -> Generator[BaseGroup, None, None]:
+    """Parse all groups of the given kinds from the blobs at the given locations
+    of a memory-mapped file.
+
+    With `workers > 1`, blobs are decompressed and unpacked in a process pool,
+    where every worker maps the same file. Groups are yielded in file order and
+    at most `max_in_flight` blobs (default: twice the number of workers) are
+    submitted at any time, which bounds the memory held by pending results.
+
+    Blobs that contain no elements of the given kinds are skipped as cheaply as
+    possible: without reading them at all if the blob index in `known` tells
+    so, otherwise without parsing them. With `is_sorted`, the file is sorted
+    by type and reading stops at the first blob that only contains elements of
+    kinds that come after all of the given ones.
+
+    Tags of all groups are interned into `interner`. The kinds of the elements
+    in every blob that has been looked at are recorded in `blob_kinds`, if
+    given. With `select`, only the selected nodes are unpacked.
+    """
+    if blob_kinds is None:
+        blob_kinds = {}
+    if known is None:
+        known = {}
+    locations = _locations_to_read(blobs, kinds, known, blob_kinds, is_sorted)
+
+    if workers <= 1:
+        for offset, size in locations:
+            groups, block_kinds = _unpack_blob(
+                buffer[offset : offset + size], interner, kinds, select
+            )
+            blob_kinds[(offset, size)] = block_kinds
+            yield from groups
+
+            if is_sorted and _is_past(block_kinds, kinds):
+                return
+        return
+
+    if max_in_flight is None:
+        max_in_flight = 2 * workers
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(fp, select)
+    ) as pool:
+        pending: deque[
+            tuple[BlobLocation, Future[tuple[list[BaseGroup], frozenset[str]]]]
+        ] = deque()
+
+        def _next() -> Generator[BaseGroup, None, bool]:
+            # yields the groups of the oldest pending blob and returns whether
+            # reading can stop there
+            location, future = pending.popleft()
+            groups, block_kinds = future.result()
+            blob_kinds[location] = block_kinds
+            yield from _intern_groups(groups, interner)
+            return is_sorted and _is_past(block_kinds, kinds)
+
+        stop = False
+        for offset, size in locations:
+            if len(pending) >= max_in_flight:
+                stop = yield from _next()
+                if stop:
+                    break
+            pending.append(
+                (
+                    (offset, size),
+                    pool.submit(_unpack_mapped_blob, offset, size, kinds),
+                )
+            )
+
+        while len(pending) > 0 and not stop:
+            stop = yield from _next()
+
+        # blobs after the stop are not needed
+        for _, future in pending:
+            future.cancel()
+
+
+def _read_and_filter_groups(
+    fp: Path,
+    buffer: memoryview,
+    blobs: Iterable[BlobLocation],
+    interner: StringTable,
+    tags: Predicate | None,
+    *,
+    kinds: frozenset[str] = ALL_KINDS,
+    known: KnownBlobs | None = None,
+    is_sorted: bool = False,
+    workers: int = 1,
+    max_in_flight: int | None = None,
 ) -> Generator[BaseGroup, None, None]:
-    """Parse all nodes from a file-iterator."""
-    for block in file_iterator:
-        yield from _unpack_primitive_block(PrimitiveBlock.FromString(block))
+    """Parse only the elements of `kinds` that match `tags`, if given, and the
+    elements they reference, in two passes over the file.
+
+    The first pass unpacks ways and relations only, as far as they are needed,
+    and resolves which of them, and which nodes, have to be kept. The second
+    pass revisits only the blobs that contain nodes, where nodes that are
+    neither selected nor referenced are dropped before their tags and metadata
+    are built.
+
+    Without a blob index in `known`, the first pass has to decompress every
+    blob to find out what it contains, so that blobs with nodes are
+    decompressed twice. Keeping them decompressed in between would hold all
+    nodes of the file in memory, which is what the two passes avoid.
+    """
+    if known is None:
+        known = {}
+
+    # relations are only referenced by relations, ways by relations
+    if "relation" in kinds:
+        first_pass = frozenset({"way", "relation"})
+    elif "way" in kinds:
+        first_pass = frozenset({"way"})
+    else:
+        first_pass = frozenset()
+
+    references: ReferenceDict = {}
+    node_blobs: Iterable[BlobLocation] = blobs
+
+    if len(first_pass) > 0:
+        blob_kinds: BlobKinds = {}
+        ways: list[WayGroup] = []
+        relations: list[RelationGroup] = []
+
+        for group in _read_and_unpack_groups(
+            fp,
+            buffer,
+            blobs,
+            interner,
+            kinds=first_pass,
+            blob_kinds=blob_kinds,
+            known=known,
+            is_sorted=is_sorted,
+            workers=workers,
+            max_in_flight=max_in_flight,
+        ):
+            match group:
+                case WayGroup():
+                    ways.append(group)
+                case RelationGroup():
+                    relations.append(group)
+
+        relations, references = filter_groups(
+            relations, tags=tags, assume_sorted=is_sorted
+        )
+        # an empty set matches nothing, ways that are not requested are only
+        # kept where relations reference them
+        ways, references = filter_groups(
+            ways,
+            tags=tags if "way" in kinds else set(),
+            references=references,
+            assume_sorted=is_sorted,
+        )
+        yield from relations
+        yield from ways
+
+        node_blobs = sorted(
+            location for location, kinds_ in blob_kinds.items() if "node" in kinds_
+        )
+
+    node_ids = references.get("node", _EMPTY)
+    select: Selector | None
+    if "node" not in kinds:
+        select = Selection(None, node_ids)
+        node_blobs = _blobs_with_ids(node_blobs, known, "node", node_ids)
+    elif tags is not None:
+        select = Selection(tags, node_ids)
+    else:
+        select = None
+
+    for group in _read_and_unpack_groups(
+        fp,
+        buffer,
+        node_blobs,
+        interner,
+        kinds={"node"},
+        known=known,
+        is_sorted=is_sorted,
+        select=select,
+        workers=workers,
+        max_in_flight=max_in_flight,
+    ):
+        if not group.is_empty():
+            yield group
+
+
+def _read_and_cut_groups(
+    fp: Path,
+    buffer: memoryview,
+    blobs: Iterable[BlobLocation],
+    interner: StringTable,
+    bbox: BBox,
+    *,
+    known: KnownBlobs | None = None,
+    workers: int = 1,
+    max_in_flight: int | None = None,
+) -> Generator[BaseGroup, None, None]:
+    """Parse only the elements within `bbox`, as resolved by
+    `find_elements_within`.
+
+    Ways and relations are unpacked first. The blobs that contain nodes are
+    then read twice: once to find the nodes within the area, which decides
+    about the ways and relations to keep, and once to unpack the nodes within
+    the area and those needed to complete the kept ways and relations.
+    """
+    if known is None:
+        known = {}
+
+    blob_kinds: BlobKinds = {}
+    ways: list[WayGroup] = []
+    relations: list[RelationGroup] = []
+
+    for group in _read_and_unpack_groups(
+        fp,
+        buffer,
+        blobs,
+        interner,
+        kinds={"way", "relation"},
+        blob_kinds=blob_kinds,
+        known=known,
+        workers=workers,
+        max_in_flight=max_in_flight,
+    ):
+        match group:
+            case WayGroup():
+                ways.append(group)
+            case RelationGroup():
+                relations.append(group)
+
+    node_blobs = sorted(
+        location for location, kinds in blob_kinds.items() if "node" in kinds
+    )
+    within: list[NDArray[np.int64]] = []
+    for group in _read_and_unpack_groups(
+        fp,
+        buffer,
+        node_blobs,
+        # tags are not needed here, so they should not end up in `interner`
+        StringTable(),
+        kinds={"node"},
+        workers=workers,
+        max_in_flight=max_in_flight,
+    ):
+        assert isinstance(group, NodesGroup)
+        within.append(group.ids[nodes_within(group, bbox)])
+
+    keep = find_elements_within(union(within), ways=ways, relations=relations)
+    yield from keep_ids(relations, keep["relation"])
+    yield from keep_ids(ways, keep["way"])
+
+    for group in _read_and_unpack_groups(
+        fp,
+        buffer,
+        _blobs_with_ids(node_blobs, known, "node", keep["node"]),
+        interner,
+        kinds={"node"},
+        select=Selection(None, keep["node"]),
+        workers=workers,
+        max_in_flight=max_in_flight,
+    ):
+        if not group.is_empty():
+            yield group
+
+
+def _map_groups(
+    func: Callable[[GroupT], T],
+    groups: list[GroupT],
+    pool: Executor | None = None,
+) -> list[T]:
+    """Apply `func` to each group, in a thread pool if given, and return the
+    results in the order of the groups."""
+    if pool is None:
+        return [func(group) for group in groups]
+    return list(pool.map(func, groups))
+
+
+def _way_frame(
+    groups: list[WayGroup], geometries: list[NDArray[np.object_]]
+) -> gpd.GeoDataFrame:
+    """Return a frame of only the geometries of ways, indexed by their ids."""
+    return gpd.GeoDataFrame(
+        {"geometry": np.concatenate([np.array([], dtype=np.object_), *geometries])},
+        index=pd.Index(
+            np.concatenate([_EMPTY, *(group.ids for group in groups)]), name="id"
+        ),
+        crs="EPSG:4326",
+    )
 
 
 @dataclass
@@ -64,105 +551,361 @@ class OSMFile:
     nodes: list[NodesGroup] = field(default_factory=list)
     ways: list[WayGroup] = field(default_factory=list)
     relations: list[RelationGroup] = field(default_factory=list)
+    header: Header | None = None
+    # strings of all tags, shared by the groups of the file
+    strings: StringTable = field(default_factory=StringTable)
+    # locations of all nodes, if they have been stored on disk while reading,
+    # `nodes` then only holds the nodes that are consolidated
+    locations: NodeLocations | None = None
+    # kinds of elements that are consolidated, elements of other kinds are only
+    # there because they are referenced
+    kinds: frozenset[str] = ALL_KINDS
 
     # protected property that is used to store the arguments to filter
     # for later use during consolidation, since pre-consolidation filtering
     # can leave non-matching geometries that are referenced by some way or relation
-    _filter: set[str] | None = None
+    _filter: Predicate | None = None
 
     @classmethod
-    def from_file(cls, fp: Path | str) -> OSMFile:
+    def from_file(
+        cls,
+        fp: Path | str,
+        *,
+        workers: int = 1,
+        max_in_flight: int | None = None,
+        bbox: BBox | None = None,
+        tags: set[str] | Predicate | None = None,
+        kinds: Iterable[str] | None = None,
+        node_store: Path | str | None = None,
+    ) -> OSMFile:
+        """Load all elements from a .osm.pbf file.
+
+        Args:
+            fp: Path to the file.
+            workers: Number of processes used to decompress and unpack blocks.
+                With the default of 1, everything happens in the calling
+                process.
+            max_in_flight: Maximum number of blocks that are submitted to the
+                worker processes at the same time. Defaults to twice the
+                number of workers.
+            bbox: Area of interest as `(minx, miny, maxx, maxy)` tuple or
+                polygon. Only elements within it are loaded, the same as
+                calling `filter` afterwards. If the bounding box declared in
+                the file header does not intersect it, no data is read at all.
+            tags: If given, only elements that satisfy this predicate, or have
+                any of these keys, and the elements they reference are loaded,
+                the same as calling `filter` afterwards. Nodes are filtered
+                while reading, so that they never have to be held in memory
+                all at once. This reads the file twice, and without an up to
+                date blob index also decompresses blocks of nodes twice, so
+                for files that are read repeatedly, create the index once
+                with `BlobIndex.for_file`.
+            kinds: If given, only elements of these kinds ("node", "way" and
+                "relation") and the elements they reference are loaded, the
+                same as calling `filter` afterwards. Blocks that contain no
+                elements that are needed are not parsed, and not even read if
+                the file is sorted by type or has an up to date blob index.
+            node_store: Directory in which to store the locations of all nodes
+                while reading, for files whose nodes do not fit in memory.
+                The locations are memory-mapped from there as `locations`
+                and removed once they are no longer used. Only the nodes
+                that are consolidated themselves are kept in `nodes`, nodes
+                that are only needed for the geometries of ways and
+                relations are dropped.
+
+        Raises:
+            ValueError: If `workers` or `max_in_flight` is less than 1.
+        """
+        if workers < 1:
+            raise ValueError(f"workers must be at least 1, got {workers}.")
+        if max_in_flight is not None and max_in_flight < 1:
+            raise ValueError(f"max_in_flight must be at least 1, got {max_in_flight}.")
+
         if isinstance(fp, str):
             fp = Path(fp)
+        predicate = None if tags is None else as_predicate(tags)
+        kinds = ALL_KINDS if kinds is None else _as_kinds(kinds)
+
+        # an up to date index tells which blobs to skip without reading them
+        index = BlobIndex.load_current(fp)
+        known: KnownBlobs = (
+            {}
+            if index is None
+            else {(blob.offset, blob.size): blob for blob in index.blobs}
+        )
 
         nodes: list[NodesGroup] = []
         ways: list[WayGroup] = []
         relations: list[RelationGroup] = []
+        strings = StringTable()
 
-        with open(fp, "rb") as f:
-            file_iterator = read_blocks(f)
-
-            # fixme: do something with header block here
-            _: HeaderBlock = HeaderBlock.FromString(next(file_iterator))
+        with map_file(fp) as buffer:
+            blobs = (
+                (offset, header.datasize)
+                for header, offset in scan_mapped_blobs(buffer)
+            )
 
-            for group in _read_and_unpack_groups(file_iterator):
-                match group:
-                    case NodesGroup():
-                        nodes.append(group)
-                    case WayGroup():
-                        ways.append(group)
-                    case RelationGroup():
-                        relations.append(group)
+            offset, size = next(blobs)
+            header = Header.from_header_block(
+                HeaderBlock.FromString(decompress_blob(buffer[offset : offset + size]))
+            )
+            header.check_features()
+
+            if bbox is not None and not header.intersects(bbox):
+                return cls(header=header)
+
+            if bbox is not None:
+                groups = _read_and_cut_groups(
+                    fp,
+                    buffer,
+                    blobs,
+                    strings,
+                    bbox,
+                    known=known,
+                    workers=workers,
+                    max_in_flight=max_in_flight,
+                )
+            elif predicate is None and _is_closed(kinds):
+                groups = _read_and_unpack_groups(
+                    fp,
+                    buffer,
+                    blobs,
+                    strings,
+                    kinds=kinds,
+                    known=known,
+                    is_sorted=header.is_sorted,
+                    workers=workers,
+                    max_in_flight=max_in_flight,
+                )
+            else:
+                groups = _read_and_filter_groups(
+                    fp,
+                    buffer,
+                    blobs,
+                    strings,
+                    predicate,
+                    kinds=kinds,
+                    known=known,
+                    is_sorted=header.is_sorted,
+                    workers=workers,
+                    max_in_flight=max_in_flight,
+                )
+
+            writer = None if node_store is None else LocationWriter(node_store)
+            try:
+                for group in groups:
+                    match group:
+                        case NodesGroup():
+                            if writer is not None:
+                                writer.add(group)
+                                # nodes that are not consolidated are only needed
+                                # for their locations, which are in the store
+                                if "node" not in kinds:
+                                    continue
+                                if predicate is not None:
+                                    group = group.take(predicate(group.tags))
+                            nodes.append(group)
+                        case WayGroup():
+                            ways.append(group)
+                        case RelationGroup():
+                            relations.append(group)
+
+                locations = None if writer is None else writer.finish()
+            except BaseException:
+                if writer is not None:
+                    writer.discard()
+                raise
+
+        if writer is not None:
+            # the store is removed with the last reference to its locations
+            weakref.finalize(
+                locations, shutil.rmtree, writer.directory, ignore_errors=True
+            )
 
-        return cls(nodes, ways, relations)
+        if bbox is not None:
+            osm = cls(
+                nodes,
+                ways,
+                relations,
+                header=header,
+                strings=strings,
+                locations=locations,
+            )
+            # the spatial cut is consistent in itself, filter it afterwards
+            if predicate is not None or kinds != ALL_KINDS:
+                osm.filter(tags=predicate, kinds=kinds)
+            return osm
+
+        return cls(
+            nodes,
+            ways,
+            relations,
+            header=header,
+            strings=strings,
+            locations=locations,
+            kinds=kinds,
+            _filter=predicate,
+        )
 
-    def filter(self, *, tags: set[str]) -> OSMFile:
-        self.relations, references = filter_groups(self.relations, tags=tags)
+    @property
+    def is_sorted(self) -> bool:
+        return self.header is not None and self.header.is_sorted
+
+    def filter(
+        self,
+        *,
+        tags: set[str] | Predicate | None = None,
+        bbox: BBox | None = None,
+        kinds: Iterable[str] | None = None,
+    ) -> OSMFile:
+        """Keep only elements that satisfy `tags`, or have any of these keys, and
+        the elements they reference.
+
+        With `bbox`, only nodes within it, the ways that have any node within
+        it and the relations that have any of those as members are kept. Kept
+        ways are completed with all of their nodes, so that their geometries
+        are not clipped.
+
+        With `kinds`, only elements of these kinds are kept, together with the
+        elements of other kinds they reference, and only they are consolidated.
+
+        To avoid loading elements that are dropped here, pass the same `tags`
+        and `kinds` to `from_file` instead. That filters while reading, which
+        is a lot cheaper with an up to date blob index, see
+        `BlobIndex.for_file`.
+        """
+        if tags is None and bbox is None and kinds is None:
+            raise ValueError("Either tags, bbox or kinds need to be given.")
+
+        if bbox is not None:
+            self._filter_bbox(bbox)
+        if tags is None and kinds is None:
+            return self
+
+        predicate = None if tags is None else as_predicate(tags)
+        self.kinds = self.kinds if kinds is None else self.kinds & _as_kinds(kinds)
+
+        # an empty set matches nothing, elements of kinds that are not requested
+        # are only kept where they are referenced
+        self.relations, references = filter_groups(
+            self.relations,
+            tags=predicate if "relation" in self.kinds else set(),
+            assume_sorted=self.is_sorted,
+        )
         self.ways, references = filter_groups(
-            self.ways, tags=tags, references=references
+            self.ways,
+            tags=predicate if "way" in self.kinds else set(),
+            references=references,
+            assume_sorted=self.is_sorted,
+        )
+        self.nodes, _ = filter_groups(
+            self.nodes,
+            tags=predicate if "node" in self.kinds else set(),
+            references=references,
+            assume_sorted=self.is_sorted,
         )
-        self.nodes, _ = filter_groups(self.nodes, tags=tags, references=references)
 
-        self._filter = tags
+        if predicate is not None:
+            self._filter = predicate
         return self
 
-    def _consolidate_nodes(self) -> gpd.GeoDataFrame:
-        _node_parts = [
-            consolidate_nodes(nodes) for nodes in self.nodes if not nodes.is_empty()
-        ]
-        if len(_node_parts) > 0:
-            return pd.concat(_node_parts)
-        else:
-            raise ValueError("Nothing to consolidate.")
-
-    def _consolidate_ways(self, *, nodes: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
-        _way_parts = [
-            consolidate_ways(ways, nodes=nodes)
-            for ways in self.ways
-            if not ways.is_empty()
-        ]
-
-        if len(_way_parts) > 0:
-            return pd.concat(_way_parts)
-        else:
-            return gpd.GeoDataFrame()
-
-    def _consolidate_relations(
-        self, *, nodes: gpd.GeoDataFrame, ways: gpd.GeoDataFrame
-    ) -> gpd.GeoDataFrame:
-        _relation_parts = [
-            consolidate_relations(relations, ways=ways, nodes=nodes)
-            for relations in self.relations
-            if not relations.is_empty()
-        ]
-
-        if len(_relation_parts) > 0:
-            return pd.concat(_relation_parts)
-        else:
-            return gpd.GeoDataFrame()
-
-    def consolidate(self) -> gpd.GeoDataFrame:
-        nodes = self._consolidate_nodes()
-        ways = self._consolidate_ways(nodes=nodes)
-        relations = self._consolidate_relations(nodes=nodes, ways=ways)
-
-        gdf = pd.concat([nodes, ways, relations])
-
-        if self._filter is not None:
-            # filter for rows that match a filter category
-            gdf = gdf[gdf[list(self._filter)].notna().any(axis=1)]
-
-            # drop columns that became all NA from filtering
-            gdf = gdf[gdf.columns[~gdf.isna().all()]]
-
-        return gdf
-
+    def _filter_bbox(self, bbox: BBox) -> None:
+        within = [group.ids[nodes_within(group, bbox)] for group in self.nodes]
+        if self.locations is not None:
+            # nodes that are only stored may be within as well
+            within.append(self.locations.ids[nodes_within(self.locations, bbox)])
+        keep = find_elements_within(
+            union(within),
+            ways=self.ways,
+            relations=self.relations,
+        )
 
-#  header_bbox = box(
-#      header_block.bbox.bottom * 1e-9,
-#      header_block.bbox.left * 1e-9,
-#      header_block.bbox.top * 1e-9,
-#      header_block.bbox.right * 1e-9,
-#  )
-#
-#  if bounding_box is not None and not intersects(header_bbox, bounding_box):
+        self.nodes = keep_ids(self.nodes, keep["node"])
+        self.ways = keep_ids(self.ways, keep["way"])
+        self.relations = keep_ids(self.relations, keep["relation"])
+
+    def consolidate(self, *, workers: int = 1, threads: int = 1) -> gpd.GeoDataFrame:
+        """Build one frame with the geometries and tags of all elements of the
+        requested kinds.
+
+        The frame is built in one pass over all groups, with its columns
+        allocated once. Rows that do not match the filter, if any, are left
+        out before they are built.
+
+        Args:
+            workers: Number of processes used to build the geometries of
+                relations. With the default of 1, everything happens in the
+                calling process.
+            threads: Number of threads used to build the geometries of node and
+                way groups. Most of this work happens in shapely and NumPy,
+                which release the GIL, so that groups are built in parallel
+                without sending them to other processes.
+        """
+        # groups that were not read with this file, are interned into its
+        # strings first, so that the filter is compiled against all of them
+        for group in [*self.nodes, *self.ways, *self.relations]:
+            group.tags = group.tags.intern_into(self.strings)
+        # the string array is built once, instead of once per thread
+        self.strings.as_array()
+
+        compiled = None if self._filter is None else self._filter.compile(self.strings)
+
+        def _rows(group: BaseGroup) -> NDArray[np.bool_] | None:
+            # filter for rows that match a filter category
+            if compiled is None:
+                return None
+            return compiled(group.tags)
+
+        builder = FrameBuilder(self.strings)
+        with (
+            ThreadPoolExecutor(max_workers=threads) if threads > 1 else nullcontext()
+        ) as pool:
+            if "node" in self.kinds:
+                nodes = [group for group in self.nodes if not group.is_empty()]
+                # nodes that are not consolidated may have been left out in
+                # favour of their stored locations
+                if len(nodes) == 0 and len(self.locations or ()) == 0:
+                    raise ValueError("Nothing to consolidate.")
+
+                for node_group, geometries in zip(
+                    nodes, _map_groups(node_geometries, nodes, pool)
+                ):
+                    builder.add(node_group, geometries, rows=_rows(node_group))
+
+            if not self.kinds.isdisjoint({"way", "relation"}):
+                locations = (
+                    self.locations
+                    if self.locations is not None
+                    else NodeLocations.from_groups(self.nodes)
+                )
+                ways = [group for group in self.ways if not group.is_empty()]
+                way_geometries_ = _map_groups(
+                    partial(way_geometries, locations=locations), ways, pool
+                )
+                if "way" in self.kinds:
+                    for way_group, geometries in zip(ways, way_geometries_):
+                        builder.add(way_group, geometries, rows=_rows(way_group))
+
+                if "relation" in self.kinds:
+                    relations = [g for g in self.relations if not g.is_empty()]
+                    # relations are built from the geometries of their member ways
+                    geometries = relation_geometries(
+                        relations,
+                        ways=_way_frame(ways, way_geometries_),
+                        locations=locations,
+                        way_groups=self.ways,
+                        workers=workers,
+                    )
+
+                    start = 0
+                    for relation_group in relations:
+                        end = start + len(relation_group.ids)
+                        builder.add(
+                            relation_group,
+                            geometries[start:end],
+                            rows=_rows(relation_group),
+                            with_idx=True,
+                        )
+                        start = end
+
+        return builder.build()
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import re
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Callable, Iterable, TypeAlias
+
+import numpy as np
+from numpy.typing import NDArray
+
+from .tags import StringTable, Tags
+
+__all__ = [
+    "Predicate",
+    "Key",
+    "HasAnyKey",
+    "ValueIn",
+    "ValueMatches",
+    "Not",
+    "And",
+    "Or",
+    "as_predicate",
+]
+
+# evaluates a predicate on tags that point into the table it was compiled for
+CompiledPredicate: TypeAlias = Callable[[Tags], NDArray[np.bool_]]
+
+
+def _elements_with_pairs(tags: Tags, pairs: NDArray[np.bool_]) -> NDArray[np.bool_]:
+    """Return a mask of the elements that have at least one of the selected
+    key/value pairs."""
+    return np.bincount(tags.element_index()[pairs], minlength=tags.n_elements).astype(
+        np.bool_
+    )
+
+
+class Predicate(ABC):
+    """Condition on the tags of an element.
+
+    Predicates are compiled against a string table once, which resolves all
+    keys and values to ids, and then test the tags of whole groups at once.
+    They can be combined with `&`, `|` and `~`.
+    """
+
+    @abstractmethod
+    def compile(self, strings: StringTable) -> CompiledPredicate:
+        """Resolve the predicate against `strings`."""
+
+    def __call__(self, tags: Tags) -> NDArray[np.bool_]:
+        return self.compile(tags.string_table)(tags)
+
+    def __and__(self, other: Predicate) -> Predicate:
+        return And((self, other))
+
+    def __or__(self, other: Predicate) -> Predicate:
+        return Or((self, other))
+
+    def __invert__(self) -> Predicate:
+        return Not(self)
+
+
+@dataclass(frozen=True)
+class HasAnyKey(Predicate):
+    """Elements that have any of `keys`."""
+
+    keys: frozenset[str]
+
+    def compile(self, strings: StringTable) -> CompiledPredicate:
+        key_ids = strings.lookup(self.keys)
+        return lambda tags: _elements_with_pairs(tags, np.isin(tags.key_ids, key_ids))
+
+
+@dataclass(frozen=True)
+class ValueIn(Predicate):
+    """Elements whose value of `key` is one of `values`."""
+
+    key: str
+    values: frozenset[str]
+
+    def compile(self, strings: StringTable) -> CompiledPredicate:
+        key_ids = strings.lookup((self.key,))
+        value_ids = strings.lookup(self.values)
+        return lambda tags: _elements_with_pairs(
+            tags, np.isin(tags.key_ids, key_ids) & np.isin(tags.value_ids, value_ids)
+        )
+
+
+@dataclass(frozen=True)
+class ValueMatches(Predicate):
+    """Elements whose value of `key` matches the regular expression `pattern`
+    (anywhere in the value, as with `re.search`)."""
+
+    key: str
+    pattern: str
+
+    def compile(self, strings: StringTable) -> CompiledPredicate:
+        # the pattern is tested once per distinct string, not once per element
+        search = re.compile(self.pattern).search
+        key_ids = strings.lookup((self.key,))
+        value_ids = np.flatnonzero(
+            np.fromiter(
+                (search(s) is not None for s in strings.strings),
+                dtype=np.bool_,
+                count=len(strings),
+            )
+        )
+        return lambda tags: _elements_with_pairs(
+            tags, np.isin(tags.key_ids, key_ids) & np.isin(tags.value_ids, value_ids)
+        )
+
+
+@dataclass(frozen=True)
+class Not(Predicate):
+    """Elements that do not satisfy `predicate`, including elements without
+    any of the keys it tests."""
+
+    predicate: Predicate
+
+    def compile(self, strings: StringTable) -> CompiledPredicate:
+        compiled = self.predicate.compile(strings)
+        return lambda tags: ~compiled(tags)
+
+
+@dataclass(frozen=True)
+class And(Predicate):
+    """Elements that satisfy all `predicates`."""
+
+    predicates: tuple[Predicate, ...]
+
+    def compile(self, strings: StringTable) -> CompiledPredicate:
+        compiled = [predicate.compile(strings) for predicate in self.predicates]
+
+        def _all(tags: Tags) -> NDArray[np.bool_]:
+            result = np.ones(tags.n_elements, dtype=np.bool_)
+            for c in compiled:
+                result &= c(tags)
+            return result
+
+        return _all
+
+
+@dataclass(frozen=True)
+class Or(Predicate):
+    """Elements that satisfy any of `predicates`."""
+
+    predicates: tuple[Predicate, ...]
+
+    def compile(self, strings: StringTable) -> CompiledPredicate:
+        compiled = [predicate.compile(strings) for predicate in self.predicates]
+
+        def _any(tags: Tags) -> NDArray[np.bool_]:
+            result = np.zeros(tags.n_elements, dtype=np.bool_)
+            for c in compiled:
+                result |= c(tags)
+            return result
+
+        return _any
+
+
+@dataclass(frozen=True)
+class Key(Predicate):
+    """Elements that have the tag `key`, with methods to test its value.
+
+    Example:
+        >>> Key("highway").isin({"primary", "secondary"}) | Key("building").not_in({"no"})
+    """
+
+    key: str
+
+    def compile(self, strings: StringTable) -> CompiledPredicate:
+        return HasAnyKey(frozenset({self.key})).compile(strings)
+
+    def equals(self, value: str) -> Predicate:
+        return ValueIn(self.key, frozenset({value}))
+
+    def isin(self, values: Iterable[str]) -> Predicate:
+        return ValueIn(self.key, frozenset(values))
+
+    def not_in(self, values: Iterable[str]) -> Predicate:
+        """Elements that have `key`, with a value that is not in `values`."""
+        return self & ~self.isin(values)
+
+    def matches(self, pattern: str) -> Predicate:
+        return ValueMatches(self.key, pattern)
+
+
+def as_predicate(tags: set[str] | Predicate) -> Predicate:
+    """Plain sets of keys select elements that have any of them."""
+    if isinstance(tags, Predicate):
+        return tags
+    return HasAnyKey(frozenset(tags))
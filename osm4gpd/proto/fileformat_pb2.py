@@ -13,7 +13,7 @@ _sym_db = _symbol_database.Default()
 
 
 DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(
-    b'\n\x10\x66ileformat.proto\x12\x06OSMPBF"l\n\x04\x42lob\x12\x0b\n\x03raw\x18\x01 \x01(\x0c\x12\x10\n\x08raw_size\x18\x02 \x01(\x05\x12\x11\n\tzlib_data\x18\x03 \x01(\x0c\x12\x11\n\tlzma_data\x18\x04 \x01(\x0c\x12\x1f\n\x13OBSOLETE_bzip2_data\x18\x05 \x01(\x0c\x42\x02\x18\x01"?\n\nBlobHeader\x12\x0c\n\x04type\x18\x01 \x02(\t\x12\x11\n\tindexdata\x18\x02 \x01(\x0c\x12\x10\n\x08\x64\x61tasize\x18\x03 \x02(\x05\x42\x11\n\rcrosby.binaryH\x03'
+    b'\n\x10\x66ileformat.proto\x12\x06OSMPBF"\x91\x01\n\x04\x42lob\x12\x0b\n\x03raw\x18\x01 \x01(\x0c\x12\x10\n\x08raw_size\x18\x02 \x01(\x05\x12\x11\n\tzlib_data\x18\x03 \x01(\x0c\x12\x11\n\tlzma_data\x18\x04 \x01(\x0c\x12\x1f\n\x13OBSOLETE_bzip2_data\x18\x05 \x01(\x0c\x42\x02\x18\x01\x12\x10\n\x08lz4_data\x18\x06 \x01(\x0c\x12\x11\n\tzstd_data\x18\x07 \x01(\x0c"?\n\nBlobHeader\x12\x0c\n\x04type\x18\x01 \x02(\t\x12\x11\n\tindexdata\x18\x02 \x01(\x0c\x12\x10\n\x08\x64\x61tasize\x18\x03 \x02(\x05\x42\x11\n\rcrosby.binaryH\x03'
 )
 
 _globals = globals()
@@ -24,8 +24,8 @@ if _descriptor._USE_C_DESCRIPTORS == False:
     DESCRIPTOR._serialized_options = b"\n\rcrosby.binaryH\003"
     _BLOB.fields_by_name["OBSOLETE_bzip2_data"]._options = None
     _BLOB.fields_by_name["OBSOLETE_bzip2_data"]._serialized_options = b"\030\001"
-    _globals["_BLOB"]._serialized_start = 28
-    _globals["_BLOB"]._serialized_end = 136
-    _globals["_BLOBHEADER"]._serialized_start = 138
-    _globals["_BLOBHEADER"]._serialized_end = 201
+    _globals["_BLOB"]._serialized_start = 29
+    _globals["_BLOB"]._serialized_end = 174
+    _globals["_BLOBHEADER"]._serialized_start = 176
+    _globals["_BLOBHEADER"]._serialized_end = 239
 # @@protoc_insertion_point(module_scope)
@@ -37,6 +37,8 @@ class Blob(Message):
     ZLIB_DATA_FIELD_NUMBER: int
     LZMA_DATA_FIELD_NUMBER: int
     OBSOLETE_BZIP2_DATA_FIELD_NUMBER: int
+    LZ4_DATA_FIELD_NUMBER: int
+    ZSTD_DATA_FIELD_NUMBER: int
     raw: bytes
     """No compression"""
     raw_size: int
@@ -49,6 +51,10 @@ class Blob(Message):
     """Formerly used for bzip2 compressed data. Depreciated in 2010.
     Don't reuse this tag number.
     """
+    lz4_data: bytes
+    """For LZ4 compressed data (optional)"""
+    zstd_data: bytes
+    """For ZSTD compressed data (optional)"""
     def __init__(
         self,
         *,
@@ -57,12 +63,16 @@ class Blob(Message):
         zlib_data: bytes | None = ...,
         lzma_data: bytes | None = ...,
         OBSOLETE_bzip2_data: bytes | None = ...,
+        lz4_data: bytes | None = ...,
+        zstd_data: bytes | None = ...,
     ) -> None: ...
     def HasField(
         self,
         field_name: typing_extensions.Literal[
             "OBSOLETE_bzip2_data",
             b"OBSOLETE_bzip2_data",
+            "lz4_data",
+            b"lz4_data",
             "lzma_data",
             b"lzma_data",
             "raw",
@@ -71,6 +81,8 @@ class Blob(Message):
             b"raw_size",
             "zlib_data",
             b"zlib_data",
+            "zstd_data",
+            b"zstd_data",
         ],
     ) -> bool: ...
     def ClearField(
@@ -78,6 +90,8 @@ class Blob(Message):
         field_name: typing_extensions.Literal[
             "OBSOLETE_bzip2_data",
             b"OBSOLETE_bzip2_data",
+            "lz4_data",
+            b"lz4_data",
             "lzma_data",
             b"lzma_data",
             "raw",
@@ -86,6 +100,8 @@ class Blob(Message):
             b"raw_size",
             "zlib_data",
             b"zlib_data",
+            "zstd_data",
+            b"zstd_data",
         ],
     ) -> None: ...
 
@@ -1,84 +1,175 @@
+from dataclasses import dataclass
 from typing import TypeAlias, TypeVar
 
 import numpy as np
 from numpy.typing import NDArray
 
+from . import csr
 from .unpacked import RelationGroup, WayGroup
 
 ReferenceDict: TypeAlias = dict[str, NDArray[np.int64]]
 GroupType = TypeVar("GroupType", RelationGroup, WayGroup)
 
+# kinds of members, the position is used as code in `MemberIndex.types`
+MEMBER_KINDS = ("node", "way", "relation")
 
-def union(ids: list[NDArray[np.int64]]) -> NDArray[np.int64]:
-    try:
-        return np.unique(np.concatenate(ids))
-    except ValueError:
-        return np.array([], dtype=np.int64)
-
-
-def _get_references_from_group(
-    group: GroupType, ids: NDArray[np.int64]
-) -> ReferenceDict:
-    references = {}
-
-    match group:
-        case WayGroup():
-            references["node"] = union(
-                [group.member_ids[idx] for idx in np.where(np.isin(group.ids, ids))[0]]
-            )
-        case RelationGroup():
-            references["node"] = union(
-                [
-                    group.member_ids[idx][group.member_types[idx] == "node"]
-                    for idx in np.where(np.isin(group.ids, ids))[0]
-                ]
-            )
-
-            references["way"] = union(
-                [
-                    group.member_ids[idx][group.member_types[idx] == "way"]
-                    for idx in np.where(np.isin(group.ids, ids))[0]
-                ]
-            )
-
-            references["relation"] = union(
-                [
-                    group.member_ids[idx][group.member_types[idx] == "relation"]
-                    for idx in np.where(np.isin(group.ids, ids))[0]
-                ]
-            )
-        case _:
-            raise NotImplementedError()
+_EMPTY: NDArray[np.int64] = np.array([], dtype=np.int64)
 
-    return references
+
+def unique_ids(ids: NDArray[np.int64]) -> NDArray[np.int64]:
+    """Same as `np.unique(ids)`.
+
+    Since NumPy 2.3, `np.unique` finds the unique values of integer arrays with
+    a hash table, which is many times slower than sorting for arrays of ids.
+    """
+    ids = np.sort(ids)
+    if len(ids) == 0:
+        return ids
+
+    keep = np.empty(len(ids), dtype=np.bool_)
+    keep[0] = True
+    np.not_equal(ids[1:], ids[:-1], out=keep[1:])
+    return ids[keep]
+
+
+def union(ids: list[NDArray[np.int64]]) -> NDArray[np.int64]:
+    return unique_ids(np.concatenate([_EMPTY, *ids]))
+
+
+def isin_sorted(
+    ids: NDArray[np.int64], sorted_ids: NDArray[np.int64]
+) -> NDArray[np.bool_]:
+    """Same as `np.isin(ids, sorted_ids)`, but relies on `sorted_ids` being
+    sorted, which avoids sorting both arrays again."""
+    if len(sorted_ids) == 0:
+        return np.zeros(len(ids), dtype=np.bool_)
+
+    pos = np.searchsorted(sorted_ids, ids)
+    pos[pos == len(sorted_ids)] = 0
+    return np.asarray(sorted_ids[pos] == ids, dtype=np.bool_)
+
+
+def relation_members(
+    group: RelationGroup,
+) -> tuple[NDArray[np.int64], NDArray[np.int64], NDArray[np.object_]]:
+    """Return the index of the relation, the id and the type of all members of
+    the group."""
+    counts = np.fromiter(
+        (len(members) for members in group.member_ids),
+        dtype=np.int64,
+        count=len(group.member_ids),
+    )
+    if counts.sum() == 0:
+        return _EMPTY, _EMPTY, np.array([], dtype=np.object_)
+
+    return (
+        np.repeat(np.arange(len(counts)), counts),
+        np.concatenate(group.member_ids),
+        np.concatenate(group.member_types),
+    )
+
+
+@dataclass
+class MemberIndex:
+    """Members of all ways or relations of a file, grouped by the id of the
+    element they belong to.
+
+    The members of the element `parents[i]` are stored at
+    `members[offsets[i]:offsets[i + 1]]`, where `parents` are sorted and
+    `types` holds the positions of the member kinds in `MEMBER_KINDS`.
+    """
+
+    parents: NDArray[np.int64]
+    offsets: NDArray[np.int64]
+    members: NDArray[np.int64]
+    types: NDArray[np.int8]
+
+    @classmethod
+    def from_groups(cls, groups: list[GroupType]) -> "MemberIndex":
+        parents: list[NDArray[np.int64]] = [_EMPTY]
+        members: list[NDArray[np.int64]] = [_EMPTY]
+        types: list[NDArray[np.int8]] = [np.array([], dtype=np.int8)]
+
+        for group in groups:
+            match group:
+                case WayGroup():
+                    parents.append(group.ids[csr.row_index(group.ref_offsets)])
+                    members.append(group.refs)
+                    types.append(np.zeros(len(group.refs), dtype=np.int8))
+                case RelationGroup():
+                    index, member_ids, member_types = relation_members(group)
+                    codes = np.full(len(member_ids), -1, dtype=np.int8)
+                    for code, kind in enumerate(MEMBER_KINDS):
+                        codes[member_types == kind] = code
+
+                    parents.append(group.ids[index])
+                    members.append(member_ids)
+                    types.append(codes)
+
+        parent = np.concatenate(parents)
+        order = np.argsort(parent, kind="stable")
+        parent = parent[order]
+
+        # elements without members do not appear, they reference nothing
+        starts = (
+            np.flatnonzero(np.r_[True, parent[1:] != parent[:-1]])
+            if len(parent) > 0
+            else _EMPTY
+        )
+        return cls(
+            parents=parent[starts],
+            offsets=np.r_[starts, len(parent)].astype(np.int64),
+            members=np.concatenate(members)[order],
+            types=np.concatenate(types)[order],
+        )
+
+    def members_of(
+        self, ids: NDArray[np.int64]
+    ) -> tuple[NDArray[np.int64], NDArray[np.int8]]:
+        """Return the ids and types of all members of the given elements."""
+        rows = np.searchsorted(self.parents, ids)
+        found = rows < len(self.parents)
+        found[found] = self.parents[rows[found]] == ids[found]
+
+        _, positions = csr.take(self.offsets, rows[found])
+        return self.members[positions], self.types[positions]
 
 
 def find_references(keep: NDArray[np.int64], groups: list[GroupType]) -> ReferenceDict:
-    """Recursively find all relation/way/node ids, referenced by relation/way
-    ids in the initial set `keep`."""
-    references: dict[str, NDArray[np.int64]] = {}
+    """Find all relation/way/node ids, referenced by relation/way ids in the
+    initial set `keep`.
+
+    Relations that are referenced are followed in turn, one level of nesting
+    at a time, until no new relations are found. Every relation is visited
+    only once, which also ends cycles of relations that reference each other.
+    """
+    references: ReferenceDict = {}
 
     if len(groups) == 0 or len(keep) == 0:
         return references
 
-    for group in groups:
-        for k, v in _get_references_from_group(group, keep).items():
-            references[k] = np.unique(
-                np.concatenate([references.get(k, np.array([], dtype=np.int64)), v])
-            )
-
-    match groups[0]:
-        case RelationGroup():
-            # Recursively find all other references
-            for k, v in find_references(
-                np.setdiff1d(np.fromiter(references["relation"], dtype=np.int64), keep),
-                groups,
-            ).items():
-                references[k] = np.unique(
-                    np.concatenate([references.get(k, np.array([], dtype=np.int64)), v])
-                )
-            return references
-        case WayGroup():
-            return references
-        case _:
-            raise NotImplementedError()
+    index = MemberIndex.from_groups(groups)
+    member_ids: list[NDArray[np.int64]] = []
+    member_types: list[NDArray[np.int8]] = []
+
+    visited = unique_ids(np.asarray(keep, dtype=np.int64))
+    frontier = visited
+    while len(frontier) > 0:
+        ids, types = index.members_of(frontier)
+        member_ids.append(ids)
+        member_types.append(types)
+
+        if isinstance(groups[0], WayGroup):
+            break
+
+        children = unique_ids(ids[types == MEMBER_KINDS.index("relation")])
+        frontier = children[~isin_sorted(children, visited)]
+        visited = union([visited, frontier])
+
+    all_ids = np.concatenate(member_ids)
+    all_types = np.concatenate(member_types)
+    kinds = MEMBER_KINDS if isinstance(groups[0], RelationGroup) else ("node",)
+    for kind in kinds:
+        references[kind] = unique_ids(all_ids[all_types == MEMBER_KINDS.index(kind)])
+
+    return references
@@ -1,14 +1,19 @@
+from __future__ import annotations
+
 import logging
-from functools import partial
-from typing import Generator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Generator, Iterator, TypeAlias
 
 import geopandas as gpd
 import numpy as np
 import pandas as pd
+import shapely
 from numpy.typing import NDArray
 from shapely import (
     Geometry,
     GeometryCollection,
+    LinearRing,
     LineString,
     MultiLineString,
     MultiPolygon,
@@ -17,10 +22,25 @@ from shapely import (
 )
 from shapely.ops import linemerge
 
-from .unpacked import RelationGroup
+from . import csr
+from .frame import FrameBuilder
+from .locations import NodeLocations
+from .references import MemberIndex, isin_sorted, relation_members, union
+from .rings import RingAssemblyError, assemble_multipolygon
+from .unpacked import RelationGroup, WayGroup
 
 logger = logging.getLogger(__name__)
 
+_EMPTY: NDArray[np.int64] = np.array([], dtype=np.int64)
+
+# ids, geometry type ids, coordinate offsets and coordinates of ways
+PackedWays: TypeAlias = tuple[
+    NDArray[np.int64], NDArray[np.int32], NDArray[np.int64], NDArray[np.float64]
+]
+
+# a geometry as WKB and the type ids of its parts, see `_to_wkb`
+PackedGeometry: TypeAlias = tuple[bytes | None, NDArray[np.int32]]
+
 
 class ConsolidationError(Exception):
     pass
@@ -69,17 +89,46 @@ def parse_multipolygon_relation(
     types: NDArray[np.object_],
     ways: gpd.GeoDataFrame,
     relations: gpd.GeoDataFrame | None = None,
+    *,
+    way_nodes: MemberIndex | None = None,
 ) -> Polygon | MultiPolygon:
+    """Multipolygons are built from the "outer" and "inner" ways and relations
+    among their members.
+
+    With the nodes of the ways in `way_nodes`, rings are joined by their nodes,
+    which is a lot faster than the general overlay operations that are used
+    otherwise. Overlay is still used for multipolygons with member relations
+    and wherever the rings do not form a valid multipolygon.
+    """
+    if way_nodes is not None and not (types == "relation").any():
+        is_way = (types == "way") & np.isin(members, ways.index)
+        try:
+            return assemble_multipolygon(
+                members[is_way & (roles == "outer")],
+                members[is_way & (roles == "inner")],
+                ways,
+                way_nodes,
+            )
+        except RingAssemblyError as e:
+            logger.debug("Rings can not be assembled, using overlay: %s", e)
+
     if (types == "relation").any() and relations is None:
         raise ConsolidationError(
             "Can not consolidate multipolygon that depends on relations."
         )
     elif (types == "relation").any() and relations is not None:
+        # member relations that could not be built are left out
         outer_ = relations.loc[
-            members[(types == "relation") & (roles == "outer")], "geometry"
+            relations.index.intersection(
+                members[(types == "relation") & (roles == "outer")]
+            ),
+            "geometry",
         ].to_list()
         inner_ = relations.loc[
-            members[(types == "relation") & (roles == "inner_")], "geometry"
+            relations.index.intersection(
+                members[(types == "relation") & (roles == "inner")]
+            ),
+            "geometry",
         ].to_list()
     else:
         outer_ = []
@@ -120,14 +169,13 @@ def parse_generic_relation(
     types: NDArray[np.object_],
     *,
     ways: gpd.GeoDataFrame,
-    nodes: gpd.GeoDataFrame,
+    locations: NodeLocations,
     relations: gpd.GeoDataFrame | None = None,
 ) -> GeometryCollection:
+    node_ids = members[types == "node"]
     geoms = (
         ways.loc[ways.index.intersection(members[types == "way"]), "geometry"].to_list()
-        + nodes.loc[
-            nodes.index.intersection(members[types == "node"]), "geometry"
-        ].to_list()
+        + locations.points(node_ids[locations.contains(node_ids)]).tolist()
     )
 
     if relations is not None:
@@ -138,95 +186,450 @@ def parse_generic_relation(
     return GeometryCollection(geoms)
 
 
-def _consolidate_geometries(
-    group: RelationGroup, ways: gpd.GeoDataFrame, nodes: gpd.GeoDataFrame
-) -> Generator[tuple[int, Geometry | partial], None, None]:
-    for idx, (members, roles, types) in enumerate(
-        zip(group.member_ids, group.member_roles, group.member_types)
-    ):
-        match group.tags.get(idx, {"type": "generic"})["type"]:
-            case "multipolygon":
-                if (types == "relation").any():
-                    yield idx, partial(
-                        parse_multipolygon_relation,
-                        members=members,
-                        roles=roles,
-                        types=types,
-                        ways=ways,
-                    )
-                    continue
-
-                yield idx, parse_multipolygon_relation(members, roles, types, ways)
-            case "boundary":
-                yield idx, parse_boundary_relation(members, roles, types, ways)
-            case _:
-                if (types == "relation").any():
-                    yield idx, partial(
-                        parse_generic_relation,
-                        members=members,
-                        types=types,
-                        ways=ways,
-                        nodes=nodes,
-                    )
-                    continue
-
-                yield idx, parse_generic_relation(
-                    members, types, ways=ways, nodes=nodes
-                )
+def _build_geometry(
+    members: NDArray[np.int64],
+    roles: NDArray[np.object_],
+    types: NDArray[np.object_],
+    relation_type: str | None,
+    *,
+    ways: gpd.GeoDataFrame,
+    locations: NodeLocations,
+    relations: gpd.GeoDataFrame | None,
+    way_nodes: MemberIndex | None,
+) -> Geometry:
+    match relation_type:
+        case "multipolygon":
+            return parse_multipolygon_relation(
+                members, roles, types, ways, relations, way_nodes=way_nodes
+            )
+        case "boundary":
+            return parse_boundary_relation(members, roles, types, ways)
+        case _:
+            return parse_generic_relation(
+                members, types, ways=ways, locations=locations, relations=relations
+            )
+
+
+def _peel(
+    remaining: NDArray[np.bool_],
+    waiting: NDArray[np.int64],
+    blocking: NDArray[np.int64],
+) -> list[NDArray[np.int64]]:
+    """Repeatedly remove the relations from `remaining` that do not wait for
+    any other remaining relation, where `waiting[i]` waits for `blocking[i]`.
+
+    Returns the positions of the removed relations, in rounds, and updates
+    `remaining` in place.
+    """
+    n_relations = len(remaining)
+    edges = remaining[waiting] & remaining[blocking]
+    waiting, blocking = waiting[edges], blocking[edges]
+    pending = np.bincount(waiting, minlength=n_relations)
+
+    rounds: list[NDArray[np.int64]] = []
+    ready = np.flatnonzero((pending == 0) & remaining)
+    while len(ready) > 0:
+        rounds.append(ready)
+        remaining[ready] = False
+
+        is_ready = np.zeros(n_relations, dtype=np.bool_)
+        is_ready[ready] = True
+        pending -= np.bincount(waiting[is_ready[blocking]], minlength=n_relations)
+        ready = np.flatnonzero((pending == 0) & remaining)
+
+    return rounds
+
+
+def _dependency_order(
+    n_relations: int, parents: NDArray[np.int64], children: NDArray[np.int64]
+) -> tuple[list[NDArray[np.int64]], NDArray[np.bool_]]:
+    """Order relations so that each one comes after the relations it contains.
+
+    The relation at position `parents[i]` contains the one at `children[i]`.
+    Returns the positions of the relations in rounds, where the relations of
+    a round only contain relations of earlier rounds, and a mask of the
+    relations in cycles. These only contain each other and form one round,
+    which is built without their members in cycles.
+    """
+    in_cycle = np.ones(n_relations, dtype=np.bool_)
+    below = _peel(in_cycle, parents, children)
+    # relations that contain a cycle without being part of it
+    above = _peel(in_cycle, children, parents)
+
+    rounds = [*below, np.flatnonzero(in_cycle), *above[::-1]]
+    return [positions for positions in rounds if len(positions) > 0], in_cycle
+
+
+def _relation_edges(
+    groups: list[RelationGroup], ids: NDArray[np.int64]
+) -> tuple[NDArray[np.int64], NDArray[np.int64]]:
+    """Return the positions of all pairs of relations in `groups` where the
+    first contains the second, `ids` are the ids of all relations in order."""
+    parents: list[NDArray[np.int64]] = []
+    members: list[NDArray[np.int64]] = []
+
+    start = 0
+    for group in groups:
+        index, member_ids, member_types = relation_members(group)
+        is_relation = member_types == "relation"
+        parents.append(index[is_relation] + start)
+        members.append(member_ids[is_relation])
+        start += len(group.ids)
+
+    parent = np.concatenate([_EMPTY, *parents])
+    member = np.concatenate([_EMPTY, *members])
+
+    # member relations that are not loaded are left out
+    by_id = np.argsort(ids, kind="stable")
+    found = isin_sorted(member, ids[by_id])
+    return parent[found], by_id[np.searchsorted(ids[by_id], member[found])]
+
+
+@dataclass
+class _RelationTask:
+    """Everything needed to build the geometry of one relation, apart from the
+    geometries of ways and the locations of nodes.
+
+    `nested` holds the geometries of the member relations with `nested_ids`,
+    packed by `_to_wkb` when the task is sent to a worker process.
+    """
 
+    members: NDArray[np.int64]
+    roles: NDArray[np.object_]
+    types: NDArray[np.object_]
+    relation_type: str | None
+    nested_ids: NDArray[np.int64] | None = None
+    nested: NDArray[np.object_] | None = None
+
+    def build(
+        self,
+        ways: gpd.GeoDataFrame,
+        locations: NodeLocations,
+        way_nodes: MemberIndex | None = None,
+    ) -> Geometry:
+        relations = None
+        if self.nested_ids is not None:
+            relations = gpd.GeoDataFrame(
+                {"geometry": self.nested},
+                index=pd.Index(self.nested_ids, name="id"),
+            )
+
+        return _build_geometry(
+            self.members,
+            self.roles,
+            self.types,
+            self.relation_type,
+            ways=ways,
+            locations=locations,
+            relations=relations,
+            way_nodes=way_nodes,
+        )
 
-def consolidate_relations(
-    group: RelationGroup, ways: gpd.GeoDataFrame, nodes: gpd.GeoDataFrame
+
+@dataclass
+class _Relations:
+    """Relations of all groups of a file, in order, together with the order in
+    which they have to be built."""
+
+    ids: NDArray[np.int64]
+    members: list[NDArray[np.int64]]
+    roles: list[NDArray[np.object_]]
+    types: list[NDArray[np.object_]]
+    relation_types: list[str | None]
+    # the member relations of the relation at position `i` are at positions
+    # `member_relations[member_offsets[i]:member_offsets[i + 1]]`
+    member_offsets: NDArray[np.int64]
+    member_relations: NDArray[np.int64]
+    rounds: list[NDArray[np.int64]]
+    in_cycle: NDArray[np.bool_]
+
+    @classmethod
+    def from_groups(cls, groups: list[RelationGroup]) -> _Relations:
+        ids = np.concatenate([group.ids for group in groups])
+        parents, children = _relation_edges(groups, ids)
+        rounds, in_cycle = _dependency_order(len(ids), parents, children)
+
+        return cls(
+            ids=ids,
+            members=[m for group in groups for m in group.member_ids],
+            roles=[r for group in groups for r in group.member_roles],
+            types=[t for group in groups for t in group.member_types],
+            relation_types=[
+                t for group in groups for t in group.tags.get_values("type")
+            ],
+            member_offsets=csr.offsets_from_counts(
+                np.bincount(parents, minlength=len(ids))
+            ),
+            member_relations=children[np.argsort(parents, kind="stable")],
+            rounds=rounds,
+            in_cycle=in_cycle,
+        )
+
+    def task(self, pos: int, geometries: NDArray[np.object_]) -> _RelationTask:
+        """Return the task that builds the relation at `pos`, where
+        `geometries` holds the geometries of all relations built before."""
+        task = _RelationTask(
+            self.members[pos],
+            self.roles[pos],
+            self.types[pos],
+            self.relation_types[pos],
+        )
+        if (task.types == "relation").any():
+            nested = self.member_relations[
+                self.member_offsets[pos] : self.member_offsets[pos + 1]
+            ]
+            if self.in_cycle[pos]:
+                nested = nested[~self.in_cycle[nested]]
+            task.nested_ids = self.ids[nested]
+            task.nested = geometries[nested]
+
+        return task
+
+    def way_members(self) -> NDArray[np.int64]:
+        return union([m[t == "way"] for m, t in zip(self.members, self.types)])
+
+    def node_members(self) -> NDArray[np.int64]:
+        return union([m[t == "node"] for m, t in zip(self.members, self.types)])
+
+
+def _pack_ways(ways: gpd.GeoDataFrame) -> PackedWays:
+    """Pack way geometries into arrays, which are a lot cheaper to send to
+    other processes than the geometries themselves."""
+    if len(ways) == 0:
+        return (
+            _EMPTY,
+            np.array([], dtype=np.int32),
+            np.zeros(1, np.int64),
+            np.empty((0, 2)),
+        )
+
+    geometries = ways.geometry.to_numpy()
+    coordinates, index = shapely.get_coordinates(geometries, return_index=True)
+    return (
+        ways.index.to_numpy(dtype=np.int64),
+        shapely.get_type_id(geometries),
+        csr.offsets_from_counts(np.bincount(index, minlength=len(geometries))),
+        coordinates,
+    )
+
+
+def _unpack_ways(
+    ids: NDArray[np.int64],
+    type_ids: NDArray[np.int32],
+    offsets: NDArray[np.int64],
+    coordinates: NDArray[np.float64],
 ) -> gpd.GeoDataFrame:
-    resolved_geometries: list[Geometry] = []
-    resolved_idx: list[int] = []
-    unresolved: list[tuple[int, Geometry]] = []
-
-    for idx, geometry in _consolidate_geometries(group, ways, nodes):
-        match geometry:
-            case Geometry():  # type: ignore[misc]
-                resolved_geometries.append(geometry)
-                resolved_idx.append(idx)
-            case partial():
-                unresolved.append((idx, geometry))
-
-    relations = gpd.GeoDataFrame(
-        {
-            "idx": resolved_idx,
-            "id": group.ids[resolved_idx],
-            "geometry": resolved_geometries,
-            "version": np.array(group.version)[resolved_idx],
-            "changeset": np.array(group.changeset)[resolved_idx],
-            "visible": np.array(group.visible)[resolved_idx],
-        },
-        crs="EPSG:4326",
+    """Rebuild the way geometries packed by `_pack_ways`, ways only ever are
+    line strings, linear rings or polygons without holes."""
+    geometries = np.full(len(ids), None, dtype=np.object_)
+
+    for type_id, build in (
+        (shapely.GeometryType.LINESTRING, shapely.linestrings),
+        (shapely.GeometryType.LINEARRING, shapely.linearrings),
+        (
+            shapely.GeometryType.POLYGON,
+            lambda coords, indices: shapely.polygons(
+                shapely.linearrings(coords, indices=indices)
+            ),
+        ),
+    ):
+        selected = np.flatnonzero(type_ids == type_id)
+        if len(selected) == 0:
+            continue
+
+        selected_offsets, positions = csr.take(offsets, selected)
+        geometries[selected] = build(
+            coordinates[positions], indices=csr.row_index(selected_offsets)
+        )
+
+    return gpd.GeoDataFrame(
+        {"geometry": geometries}, index=pd.Index(ids, name="id"), crs="EPSG:4326"
     )
 
-    if len(unresolved) > 0:
-        relations = pd.concat(
-            [
-                relations,
-                gpd.GeoDataFrame.from_dict(
-                    {
-                        idx: {
-                            "geometry": func(relations=relations.set_index("id")),
-                            "version": group.version[idx],
-                            "changeset": group.version[idx],
-                            "visible": group.version[idx],
-                            "id": group.ids[idx],
-                        }
-                        for idx, func in unresolved
-                    },
-                    orient="index",
-                    crs="EPSG:4326",
+
+# geometries and nodes of ways and locations of nodes of a worker process,
+# set by `_init_worker`
+_worker_ways: gpd.GeoDataFrame | None = None
+_worker_way_nodes: MemberIndex | None = None
+_worker_locations: NodeLocations | None = None
+
+
+def _init_worker(
+    packed_ways: PackedWays,
+    way_nodes: MemberIndex | None,
+    locations: NodeLocations,
+) -> None:
+    """Receive the ways and nodes that relations are built from once per
+    worker process, so that tasks only need to carry the relations."""
+    global _worker_ways, _worker_way_nodes, _worker_locations
+
+    _worker_ways = _unpack_ways(*packed_ways)
+    _worker_way_nodes = way_nodes
+    _worker_locations = locations
+
+
+def _part_type_ids(geometry: Geometry | None) -> list[int]:
+    """Type ids of `geometry` or, for collections, of all of their parts,
+    depth first."""
+    if geometry is None:
+        return []
+    if shapely.get_type_id(geometry) == shapely.GeometryType.GEOMETRYCOLLECTION:
+        return [t for part in geometry.geoms for t in _part_type_ids(part)]
+    return [int(shapely.get_type_id(geometry))]
+
+
+def _restore_rings(geometry: Geometry, type_ids: Iterator[int]) -> Geometry:
+    if shapely.get_type_id(geometry) == shapely.GeometryType.GEOMETRYCOLLECTION:
+        return GeometryCollection(
+            [_restore_rings(part, type_ids) for part in geometry.geoms]
+        )
+    if next(type_ids) == shapely.GeometryType.LINEARRING:
+        return LinearRing(geometry.coords)
+    return geometry
+
+
+def _to_wkb(geometry: Geometry | None) -> PackedGeometry:
+    """Pack a geometry as WKB, which has no type for linear rings, together
+    with the type ids of its parts, so that `_from_wkb` can restore them."""
+    return (
+        shapely.to_wkb(geometry),
+        np.array(_part_type_ids(geometry), dtype=np.int32),
+    )
+
+
+def _from_wkb(packed: NDArray[np.object_]) -> NDArray[np.object_]:
+    """Rebuild the geometries packed by `_to_wkb`."""
+    geometries: NDArray[np.object_] = shapely.from_wkb(
+        np.array([wkb for wkb, _ in packed], dtype=np.object_)
+    )
+    for pos, (_, type_ids) in enumerate(packed):
+        if (type_ids == shapely.GeometryType.LINEARRING).any():
+            geometries[pos] = _restore_rings(geometries[pos], iter(type_ids))
+    return geometries
+
+
+def _build_packed(task: _RelationTask) -> PackedGeometry:
+    assert (
+        _worker_ways is not None and _worker_locations is not None
+    ), "worker was not initialized"
+
+    if task.nested is not None:
+        task.nested = _from_wkb(task.nested)
+    return _to_wkb(task.build(_worker_ways, _worker_locations, _worker_way_nodes))
+
+
+def _build_in_processes(
+    relations: _Relations,
+    ways: gpd.GeoDataFrame,
+    way_nodes: MemberIndex | None,
+    locations: NodeLocations,
+    workers: int,
+) -> NDArray[np.object_]:
+    """Build the geometries of all relations in a process pool, round by round.
+
+    The ways and the nodes that are members of any relation are sent to the
+    workers once per worker. Geometries are sent back packed by `_to_wkb`.
+    """
+    node_ids = relations.node_members()
+    node_ids = node_ids[locations.contains(node_ids)]
+    coordinates = locations.coordinates(node_ids)
+    locations = NodeLocations(node_ids, coordinates[:, 0], coordinates[:, 1])
+
+    packed = np.full(len(relations.ids), None, dtype=np.object_)
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(_pack_ways(ways), way_nodes, locations),
+    ) as pool:
+        for positions in relations.rounds:
+            tasks = [relations.task(pos, packed) for pos in positions]
+            packed[positions] = np.fromiter(
+                pool.map(
+                    _build_packed,
+                    tasks,
+                    chunksize=max(1, len(tasks) // (4 * workers)),
                 ),
-            ]
+                dtype=np.object_,
+                count=len(tasks),
+            )
+
+    return _from_wkb(packed)
+
+
+def relation_geometries(
+    groups: list[RelationGroup],
+    ways: gpd.GeoDataFrame,
+    locations: NodeLocations,
+    *,
+    way_groups: list[WayGroup] | None = None,
+    workers: int = 1,
+) -> NDArray[np.object_]:
+    """Build the geometries of the relations of all `groups`, in order.
+
+    Relations that contain other relations are built after them, from their
+    geometries, regardless of the group they are in. Relations that are part
+    of a cycle are built without their members in that cycle.
+
+    Given the `way_groups` that `ways` were built from, the rings of
+    multipolygons are joined by the nodes of their ways. With `workers > 1`,
+    geometries are built in a process pool, at the same time for all relations
+    that do not depend on each other.
+    """
+    groups = [group for group in groups if not group.is_empty()]
+    if len(groups) == 0:
+        return np.array([], dtype=np.object_)
+
+    relations = _Relations.from_groups(groups)
+    if relations.in_cycle.any():
+        logger.warning(
+            "%d relations are part of cycles of relations, e.g. %s. They are "
+            "built without their members in cycles.",
+            relations.in_cycle.sum(),
+            relations.ids[relations.in_cycle][:10].tolist(),
         )
 
-    return relations.join(
-        pd.DataFrame.from_dict(
-            group.tags,
-            orient="index",
-            dtype=str(pd.SparseDtype(str)),
+    # lookups in the ways are a lot faster without all the other ways
+    way_members = relations.way_members()
+    ways = ways[isin_sorted(ways.index.to_numpy(dtype=np.int64), way_members)]
+    way_nodes = (
+        None
+        if way_groups is None
+        else MemberIndex.from_groups(
+            [group.take(isin_sorted(group.ids, way_members)) for group in way_groups]
         )
-    ).set_index("id")
+    )
+
+    if workers > 1:
+        return _build_in_processes(relations, ways, way_nodes, locations, workers)
+
+    geometries = np.full(len(relations.ids), None, dtype=np.object_)
+    for positions in relations.rounds:
+        for pos in positions:
+            geometries[pos] = relations.task(pos, geometries).build(
+                ways, locations, way_nodes
+            )
+    return geometries
+
+
+def consolidate_relations(
+    groups: list[RelationGroup],
+    ways: gpd.GeoDataFrame,
+    locations: NodeLocations,
+    *,
+    way_groups: list[WayGroup] | None = None,
+    workers: int = 1,
+) -> gpd.GeoDataFrame:
+    """Build the frame of the relations of all `groups`, see
+    `relation_geometries`."""
+    geometries = relation_geometries(
+        groups, ways, locations, way_groups=way_groups, workers=workers
+    )
+
+    builder = FrameBuilder()
+    start = 0
+    for group in groups:
+        end = start + len(group.ids)
+        builder.add(group, geometries[start:end], with_idx=True)
+        start = end
+
+    return builder.build()
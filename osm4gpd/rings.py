@@ -0,0 +1,189 @@
+import geopandas as gpd
+import numpy as np
+import shapely
+from numpy.typing import NDArray
+from shapely import MultiPolygon, Polygon
+
+from . import csr
+from .references import MemberIndex
+
+# ways of a ring, as position of the way and whether it is traversed backwards
+Ring = list[tuple[int, bool]]
+
+
+class RingAssemblyError(Exception):
+    pass
+
+
+def join_rings(refs: list[NDArray[np.int64]]) -> list[Ring]:
+    """Join ways, given by the ids of their nodes, into closed rings.
+
+    Ways are joined where they share an end node, which is a lot cheaper than
+    merging their coordinates, and may be traversed backwards to do so.
+
+    Raises:
+        RingAssemblyError: If some ways can not be joined into closed rings.
+    """
+    rings: list[Ring] = []
+    # open ways by the ids of their end nodes
+    ends: dict[int, list[int]] = {}
+
+    for way, nodes in enumerate(refs):
+        if len(nodes) < 2:
+            raise RingAssemblyError(f"Way at position {way} has too few nodes.")
+        if nodes[0] == nodes[-1]:
+            if len(nodes) < 4:
+                raise RingAssemblyError(f"Way at position {way} is too short.")
+            rings.append([(way, False)])
+        else:
+            ends.setdefault(int(nodes[0]), []).append(way)
+            ends.setdefault(int(nodes[-1]), []).append(way)
+
+    used: set[int] = set()
+    for first in sorted({way for ways in ends.values() for way in ways}):
+        if first in used:
+            continue
+
+        used.add(first)
+        ring = [(first, False)]
+        start, end = int(refs[first][0]), int(refs[first][-1])
+
+        while end != start:
+            following = next((way for way in ends[end] if way not in used), None)
+            if following is None:
+                raise RingAssemblyError(f"Ring can not be closed at node {end}.")
+
+            used.add(following)
+            backwards = bool(refs[following][0] != end)
+            ring.append((following, backwards))
+            end = int(refs[following][0] if backwards else refs[following][-1])
+
+        if sum(len(refs[way]) - 1 for way, _ in ring) < 3:
+            raise RingAssemblyError(f"Ring at node {start} is too short.")
+        rings.append(ring)
+
+    return rings
+
+
+def _ring_coordinates(
+    rings: list[Ring],
+    coordinates: NDArray[np.float64],
+    offsets: NDArray[np.int64],
+) -> NDArray[np.object_]:
+    """Build the linear rings from the coordinates of their ways, where the
+    coordinates of way `i` are at `coordinates[offsets[i]:offsets[i + 1]]`."""
+    positions: list[NDArray[np.int64]] = []
+    index: list[NDArray[np.int64]] = []
+
+    for i, ring in enumerate(rings):
+        for j, (way, backwards) in enumerate(ring):
+            way_positions = np.arange(offsets[way], offsets[way + 1])
+            if backwards:
+                way_positions = way_positions[::-1]
+            # ways share their first node with the end of the previous one
+            if j > 0:
+                way_positions = way_positions[1:]
+
+            positions.append(way_positions)
+            index.append(np.full(len(way_positions), i))
+
+    rings_: NDArray[np.object_] = shapely.linearrings(
+        coordinates[np.concatenate(positions)], indices=np.concatenate(index)
+    )
+    return rings_
+
+
+def _way_coordinates(
+    way_ids: NDArray[np.int64],
+    ways: gpd.GeoDataFrame,
+    way_nodes: MemberIndex,
+) -> tuple[list[NDArray[np.int64]], NDArray[np.float64], NDArray[np.int64]]:
+    """Return the node ids, the coordinates and the coordinate offsets of the
+    given ways.
+
+    Raises:
+        RingAssemblyError: If the geometry of any of the ways does not have a
+            coordinate for each of its nodes.
+    """
+    rows = np.searchsorted(way_nodes.parents, way_ids)
+    if (rows == len(way_nodes.parents)).any() or (
+        way_nodes.parents[rows] != way_ids
+    ).any():
+        raise RingAssemblyError("Nodes of some ways are unknown.")
+
+    refs = [
+        way_nodes.members[way_nodes.offsets[row] : way_nodes.offsets[row + 1]]
+        for row in rows
+    ]
+    coordinates, index = shapely.get_coordinates(
+        ways.loc[way_ids, "geometry"].to_numpy(), return_index=True
+    )
+    counts = np.bincount(index, minlength=len(way_ids))
+    if not np.array_equal(counts, [len(nodes) for nodes in refs]):
+        raise RingAssemblyError("Geometries of some ways do not match their nodes.")
+
+    return refs, coordinates, csr.offsets_from_counts(counts)
+
+
+def assemble_multipolygon(
+    outer: NDArray[np.int64],
+    inner: NDArray[np.int64],
+    ways: gpd.GeoDataFrame,
+    way_nodes: MemberIndex,
+) -> Polygon | MultiPolygon:
+    """Build a multipolygon from the ids of its outer and inner ways.
+
+    Ways are joined into rings by their nodes. Each inner ring becomes a hole
+    of the smallest outer ring that contains it, which is found with prepared
+    containment tests, inner rings that are in no outer ring are left out.
+
+    Raises:
+        RingAssemblyError: If the ways do not form closed rings, or the rings
+            do not form a valid multipolygon, e.g. because they overlap.
+    """
+    if len(outer) == 0:
+        raise RingAssemblyError("Multipolygon has no outer ways.")
+
+    way_ids = np.concatenate([outer, inner])
+    refs, coordinates, offsets = _way_coordinates(way_ids, ways, way_nodes)
+
+    shell_rings = _ring_coordinates(
+        join_rings(refs[: len(outer)]), coordinates, offsets
+    )
+    hole_rings = (
+        _ring_coordinates(
+            [
+                [(way + len(outer), backwards) for way, backwards in ring]
+                for ring in join_rings(refs[len(outer) :])
+            ],
+            coordinates,
+            offsets,
+        )
+        if len(inner) > 0
+        else np.array([], dtype=np.object_)
+    )
+
+    shells = shapely.polygons(shell_rings)
+    holes = shapely.polygons(hole_rings)
+    shapely.prepare(shells)
+
+    # candidates by bounding box, then the smallest shell that contains a hole
+    hole_index, shell_index = shapely.STRtree(shells).query(holes)
+    within = shapely.contains(shells[shell_index], holes[hole_index])
+    hole_index, shell_index = hole_index[within], shell_index[within]
+    by_area = np.lexsort((shapely.area(shells)[shell_index], hole_index))
+    hole_index, shell_index = hole_index[by_area], shell_index[by_area]
+    first = np.r_[True, hole_index[1:] != hole_index[:-1]][: len(hole_index)]
+
+    holes_of: list[list[int]] = [[] for _ in range(len(shells))]
+    for hole, shell in zip(hole_index[first], shell_index[first]):
+        holes_of[shell].append(hole)
+
+    polygons = [
+        Polygon(shell, hole_rings[holes_of[i]]) for i, shell in enumerate(shell_rings)
+    ]
+    result = polygons[0] if len(polygons) == 1 else MultiPolygon(polygons)
+
+    if not result.is_valid:
+        raise RingAssemblyError(shapely.is_valid_reason(result))
+    return result
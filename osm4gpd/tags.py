@@ -1,28 +1,293 @@
-from typing import Generator, Sequence
+from __future__ import annotations
 
+from dataclasses import dataclass
+from itertools import chain
+from typing import Iterable, Iterator, Mapping, Sequence
+
+import numpy as np
+import pandas as pd
+from numpy.typing import NDArray
+
+from . import csr
 from .proto import Node, Relation, Way
 
+__all__ = ["StringTable", "Tags"]
+
+_SPARSE_STR = pd.SparseDtype(np.object_, np.nan)  # type: ignore[arg-type]
+
+# sparse arrays can only be built from the positions of their values with the
+# sparse index of pandas, which is not public, see `_sparse_column`
+try:
+    from pandas._libs.sparse import IntIndex as _IntIndex
+except ImportError:
+    _IntIndex = None  # type: ignore[assignment, misc]
+
+
+def _sparse_column(
+    values: NDArray[np.object_], rows: NDArray[np.int32], n_rows: int
+) -> pd.arrays.SparseArray:
+    """Return a sparse string column of `n_rows` with `values` at the ascending
+    positions `rows`.
+
+    Without the sparse index of pandas, the column is sparsified from a dense
+    array instead, which takes time and memory for every row.
+    """
+    if _IntIndex is not None:
+        return pd.arrays.SparseArray(
+            values,
+            sparse_index=_IntIndex(n_rows, rows),  # type: ignore[call-arg]
+            dtype=_SPARSE_STR,
+        )
 
-def get_tags(obj: Relation | Way | Node, string_table: list[str]) -> dict[str, str]:
-    return {string_table[k]: string_table[v] for k, v in zip(obj.keys, obj.vals)}
+    dense = np.full(n_rows, np.nan, dtype=np.object_)
+    dense[rows] = values
+    return pd.arrays.SparseArray(dense, dtype=_SPARSE_STR)
 
 
 def parse_dense_tags(
-    keys_vals: Sequence[int], string_table: list[str]
-) -> Generator[tuple[int, dict[str, str]], None, None]:
-    node_idx = 0
-    kv_idx = 0
-
-    while kv_idx < len(keys_vals):
-        tags = dict()
-        while keys_vals[kv_idx] != 0:
-            k = keys_vals[kv_idx]
-            v = keys_vals[kv_idx + 1]
-            kv_idx += 2
-            tags[string_table[k]] = string_table[v]
-
-        if len(tags) > 0:
-            yield node_idx, tags
-
-        kv_idx += 1
-        node_idx += 1
+    keys_vals: Sequence[int], n_elements: int
+) -> tuple[NDArray[np.int64], NDArray[np.int32], NDArray[np.int32]]:
+    """Decode the `keys_vals` stream of dense nodes.
+
+    The stream holds alternating key and value string ids for each node, where
+    the tags of consecutive nodes are separated by a 0. The result is given in
+    compressed sparse row layout: the key and value ids of element `i` are
+    found at `offsets[i]:offsets[i + 1]`.
+    """
+    kv = np.asarray(keys_vals, dtype=np.int32)
+
+    if len(kv) == 0:
+        empty = np.array([], dtype=np.int32)
+        return np.zeros(n_elements + 1, dtype=np.int64), empty, empty
+
+    is_delimiter = kv == 0
+    pairs = kv[~is_delimiter]
+
+    # each non-delimiter entry belongs to the node with the index of the number
+    # of delimiters preceding it
+    element_idx = np.cumsum(is_delimiter)[~is_delimiter][0::2]
+
+    offsets = csr.offsets_from_counts(np.bincount(element_idx, minlength=n_elements))
+
+    return offsets, pairs[0::2], pairs[1::2]
+
+
+class StringTable:
+    """Interner that assigns every distinct string a stable integer id.
+
+    A single table is shared by all groups of a file, so that each distinct
+    key or value is stored only once and ids can be compared across groups.
+    """
+
+    def __init__(self, strings: Iterable[str] = ()) -> None:
+        self.strings: list[str] = []
+        self._ids: dict[str, int] = {}
+        self._array: NDArray[np.object_] = np.array([], dtype=np.object_)
+        self.intern(strings)
+
+    def intern(self, strings: Iterable[str]) -> NDArray[np.int32]:
+        """Add the given strings to the table and return their ids."""
+        ids = self._ids
+        table = self.strings
+
+        def _intern(string: str) -> int:
+            idx = ids.get(string)
+            if idx is None:
+                idx = ids[string] = len(table)
+                table.append(string)
+            return idx
+
+        return np.fromiter(map(_intern, strings), dtype=np.int32)
+
+    def lookup(self, strings: Iterable[str]) -> NDArray[np.int32]:
+        """Return the ids of those of the given strings that are in the table."""
+        return np.fromiter(
+            (self._ids[s] for s in strings if s in self._ids), dtype=np.int32
+        )
+
+    def resolve(self, ids: NDArray[np.int32]) -> list[str]:
+        """Return the strings with the given ids."""
+        return [self.strings[idx] for idx in ids.tolist()]
+
+    def as_array(self) -> NDArray[np.object_]:
+        """Return all strings as object array, indexable by id."""
+        if len(self._array) != len(self.strings):
+            self._array = np.array(self.strings, dtype=np.object_)
+        return self._array
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+    def __getstate__(self) -> list[str]:
+        return self.strings
+
+    def __setstate__(self, strings: list[str]) -> None:
+        self.__init__(strings)  # type: ignore[misc]
+
+
+@dataclass(repr=False, eq=False)
+class Tags(Mapping[int, dict[str, str]]):
+    """Tags of all elements of a group in compressed sparse row layout.
+
+    The key and value ids of element `i` are stored at
+    `key_ids[offsets[i]:offsets[i + 1]]` and
+    `value_ids[offsets[i]:offsets[i + 1]]` and point into `string_table`, which
+    is usually shared by all groups of a file.
+
+    As a mapping, this behaves like a dictionary from the index of every element
+    that has tags to a dictionary of its tags. Those dictionaries are decoded on
+    demand only.
+    """
+
+    offsets: NDArray[np.int64]
+    key_ids: NDArray[np.int32]
+    value_ids: NDArray[np.int32]
+    string_table: StringTable
+
+    @classmethod
+    def from_dense(
+        cls,
+        keys_vals: Sequence[int],
+        n_elements: int,
+        string_ids: NDArray[np.int32],
+        string_table: StringTable,
+    ) -> Tags:
+        """Decode dense node tags, `string_ids` maps the string ids of the block
+        to ids in `string_table`."""
+        offsets, key_ids, value_ids = parse_dense_tags(keys_vals, n_elements)
+        return cls(offsets, string_ids[key_ids], string_ids[value_ids], string_table)
+
+    @classmethod
+    def from_elements(
+        cls,
+        elements: Sequence[Node | Way | Relation],
+        string_ids: NDArray[np.int32],
+        string_table: StringTable,
+    ) -> Tags:
+        """Collect the tags of ways or relations, `string_ids` maps the string ids
+        of the block to ids in `string_table`."""
+        offsets = csr.offsets_from_counts(
+            np.fromiter(
+                (len(element.keys) for element in elements),
+                dtype=np.int64,
+                count=len(elements),
+            )
+        )
+
+        return cls(
+            offsets=offsets,
+            key_ids=string_ids[
+                np.fromiter(
+                    chain.from_iterable(element.keys for element in elements),
+                    dtype=np.int32,
+                    count=offsets[-1],
+                )
+            ],
+            value_ids=string_ids[
+                np.fromiter(
+                    chain.from_iterable(element.vals for element in elements),
+                    dtype=np.int32,
+                    count=offsets[-1],
+                )
+            ],
+            string_table=string_table,
+        )
+
+    @property
+    def n_elements(self) -> int:
+        return len(self.offsets) - 1
+
+    def counts(self) -> NDArray[np.int64]:
+        """Return the number of tags of every element."""
+        return np.diff(self.offsets)
+
+    def element_index(self) -> NDArray[np.int64]:
+        """Return the index of the element each key/value pair belongs to."""
+        return csr.row_index(self.offsets)
+
+    def intern_into(self, string_table: StringTable) -> Tags:
+        """Return the same tags with ids pointing into another string table."""
+        if string_table is self.string_table:
+            return self
+
+        # only strings that are in use are added to the other table
+        used = np.unique(np.concatenate([self.key_ids, self.value_ids]))
+        string_ids = np.zeros(len(self.string_table), dtype=np.int32)
+        string_ids[used] = string_table.intern(self.string_table.resolve(used))
+        return Tags(
+            self.offsets,
+            string_ids[self.key_ids],
+            string_ids[self.value_ids],
+            string_table,
+        )
+
+    def has_any_key(self, keys: Iterable[str]) -> NDArray[np.bool_]:
+        """Return a mask of all elements that have at least one of `keys`."""
+        matches = np.isin(self.key_ids, self.string_table.lookup(keys))
+        return np.bincount(
+            self.element_index()[matches], minlength=self.n_elements
+        ).astype(np.bool_)
+
+    def get_values(self, key: str) -> NDArray[np.object_]:
+        """Return the value of `key` for every element, `None` where it is not
+        set."""
+        result = np.full(self.n_elements, None, dtype=np.object_)
+        matches = np.isin(self.key_ids, self.string_table.lookup((key,)))
+        result[self.element_index()[matches]] = self.string_table.as_array()[
+            self.value_ids[matches]
+        ]
+        return result
+
+    def take(self, indices: NDArray[np.int64]) -> Tags:
+        """Return the tags of the elements at `indices`, in that order."""
+        offsets, pairs = csr.take(self.offsets, indices)
+        return Tags(
+            offsets, self.key_ids[pairs], self.value_ids[pairs], self.string_table
+        )
+
+    def to_columns(self) -> dict[str, pd.arrays.SparseArray]:
+        """Return one sparse string column per key, with one value per element,
+        in the order in which the keys first occur."""
+        element_index = self.element_index().astype(np.int32)
+        strings = self.string_table.as_array()
+
+        # group pairs by key, keeping keys in order of their first occurrence
+        order = np.argsort(self.key_ids, kind="stable")
+        key_ids, group_starts = np.unique(self.key_ids[order], return_index=True)
+        bounds = np.append(group_starts, len(order))
+
+        columns: dict[str, pd.arrays.SparseArray] = {}
+        for i in np.argsort(order[group_starts], kind="stable"):
+            pairs = order[bounds[i] : bounds[i + 1]]
+            rows = element_index[pairs]
+
+            # a key that occurs repeatedly for one element keeps its last value
+            last = np.append(rows[1:] != rows[:-1], True)
+
+            columns[strings[key_ids[i]]] = _sparse_column(
+                strings[self.value_ids[pairs[last]]], rows[last], self.n_elements
+            )
+
+        return columns
+
+    def __getitem__(self, idx: int) -> dict[str, str]:
+        if not 0 <= idx < self.n_elements:
+            raise KeyError(idx)
+
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        if start == end:
+            raise KeyError(idx)
+
+        strings = self.string_table.strings
+        return {
+            strings[k]: strings[v]
+            for k, v in zip(
+                self.key_ids[start:end].tolist(), self.value_ids[start:end].tolist()
+            )
+        }
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(np.flatnonzero(self.counts()).tolist())
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.counts()))
@@ -1,18 +1,56 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
+from typing import Any, Callable, TypeAlias, TypeVar
 
 import numpy as np
 from numpy.typing import NDArray
 
-__all__ = ["BaseGroup"]
+from osm4gpd.tags import Tags
+
+__all__ = ["BaseGroup", "Selector"]
+
+# returns a mask of the elements to keep while unpacking, given their ids and
+# tags, the latter pointing into a string table of the block
+Selector: TypeAlias = Callable[[NDArray[np.int64], Tags], NDArray[np.bool_]]
+
+GroupT = TypeVar("GroupT", bound="BaseGroup")
+
+
+def _take_optional(values: NDArray[Any], indices: NDArray[np.int64]) -> NDArray[Any]:
+    # metadata is optional in the file format, it is empty if it is missing
+    return values[indices] if len(values) > 0 else values
 
 
 @dataclass(repr=False)
 class BaseGroup:
+    """Elements of a single kind from one primitive group.
+
+    Metadata is stored with one value per element, except for `version` and
+    `changeset` of nodes, which are empty if the file does not contain them.
+    """
+
     ids: NDArray[np.int64]
-    tags: dict[int, dict[str, str]]
-    version: list[int]
-    visible: list[bool]
-    changeset: list[int]
+    tags: Tags
+    version: NDArray[np.int32]
+    visible: NDArray[np.bool_]
+    changeset: NDArray[np.int64]
 
     def is_empty(self) -> bool:
         return len(self.ids) == 0
+
+    def take(self: GroupT, indices: NDArray[np.int64] | NDArray[np.bool_]) -> GroupT:
+        """Return a group of the elements at `indices`, or where the mask
+        `indices` is set."""
+        if indices.dtype == np.bool_:
+            return replace(self, **self._take_fields(np.flatnonzero(indices)))
+        return replace(self, **self._take_fields(np.asarray(indices, dtype=np.int64)))
+
+    def _take_fields(self, indices: NDArray[np.int64]) -> dict[str, Any]:
+        """Return the fields of the elements at `indices`, subclasses extend this
+        with their own fields."""
+        return {
+            "ids": self.ids[indices],
+            "tags": self.tags.take(indices),
+            "version": _take_optional(self.version, indices),
+            "visible": self.visible[indices],
+            "changeset": _take_optional(self.changeset, indices),
+        }
@@ -1,15 +1,15 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from itertools import accumulate
-from typing import Generator, Iterator, Sequence
+from typing import Any, Sequence
 
 import numpy as np
 from numpy.typing import NDArray
 
 from osm4gpd.proto import PrimitiveGroup
+from osm4gpd.tags import StringTable, Tags
 
-from .base import BaseGroup
+from .base import BaseGroup, Selector
 
 __all__ = ["NodesGroup"]
 
@@ -28,55 +28,64 @@ class NodesGroup(BaseGroup):
         granularity: float,
         lat_offset: float,
         lon_offset: float,
+        interner: StringTable | None = None,
+        select: Selector | None = None,
     ) -> NodesGroup:
-        return cls(
-            ids=np.fromiter(accumulate(group.dense.id), dtype=np.int64),
-            lat=np.fromiter(
-                (
-                    (x * granularity + lat_offset) * 1e-9
-                    for x in accumulate(group.dense.lat)
-                ),
-                dtype=np.float64,
-            ),
-            lon=np.fromiter(
-                (
-                    (x * granularity + lon_offset) * 1e-9
-                    for x in accumulate(group.dense.lon)
-                ),
-                dtype=np.float64,
-            ),
-            tags=dict(_parse_dense_tags(group.dense.keys_vals, string_table)),
-            version=list(group.dense.denseinfo.version),
-            visible=list(_visible(group.dense.denseinfo.visible, len(group.dense.id))),
-            changeset=list(accumulate(group.dense.denseinfo.changeset)),
-        )
+        if interner is None:
+            interner = StringTable()
 
+        dense = group.dense
+        n_nodes = len(dense.id)
 
-def _parse_dense_tags(
-    keys_vals: Sequence[int], string_table: list[str]
-) -> Generator[tuple[int, dict[str, str]], None, None]:
-    node_idx = 0
-    kv_idx = 0
+        ids = np.cumsum(np.asarray(dense.id, dtype=np.int64))
+        # coordinates are delta coded multiples of `granularity` nanodegrees
+        lat = np.cumsum(np.asarray(dense.lat, dtype=np.int64)) * granularity
+        lon = np.cumsum(np.asarray(dense.lon, dtype=np.int64)) * granularity
+        version = np.asarray(dense.denseinfo.version, dtype=np.int32)
+        visible = _visible(dense.denseinfo.visible, n_nodes)
+        changeset = np.cumsum(np.asarray(dense.denseinfo.changeset, dtype=np.int64))
 
-    while kv_idx < len(keys_vals):
-        tags = dict()
-        while keys_vals[kv_idx] != 0:
-            k = keys_vals[kv_idx]
-            v = keys_vals[kv_idx + 1]
-            kv_idx += 2
-            tags[string_table[k]] = string_table[v]
+        if select is None:
+            tags = Tags.from_dense(
+                dense.keys_vals, n_nodes, interner.intern(string_table), interner
+            )
+        else:
+            # evaluate the selection on the strings of the block, only the tags
+            # of the selected nodes are added to `interner`
+            local = StringTable()
+            tags = Tags.from_dense(
+                dense.keys_vals, n_nodes, local.intern(string_table), local
+            )
+            keep = np.flatnonzero(select(ids, tags))
+            tags = tags.take(keep).intern_into(interner)
+            ids, lat, lon, visible = ids[keep], lat[keep], lon[keep], visible[keep]
+            if len(version) > 0:
+                version = version[keep]
+            if len(changeset) > 0:
+                changeset = changeset[keep]
 
-        if len(tags) > 0:
-            yield node_idx, tags
+        return cls(
+            ids=ids,
+            lat=np.multiply(lat + lat_offset, 1e-9, dtype=np.float64),
+            lon=np.multiply(lon + lon_offset, 1e-9, dtype=np.float64),
+            tags=tags,
+            version=version,
+            visible=visible,
+            changeset=changeset,
+        )
 
-        kv_idx += 1
-        node_idx += 1
+    def _take_fields(self, indices: NDArray[np.int64]) -> dict[str, Any]:
+        return {
+            **super()._take_fields(indices),
+            "lat": self.lat[indices],
+            "lon": self.lon[indices],
+        }
 
 
-def _visible(values: Sequence[bool], length: int) -> Iterator[bool]:
+def _visible(values: Sequence[bool], length: int) -> NDArray[np.bool_]:
     if len(values) == length:
-        return iter(values)
+        return np.asarray(values, dtype=np.bool_)
     elif len(values) == 0:
-        return (True for _ in range(length))
+        return np.ones(length, dtype=np.bool_)
     else:
         raise ValueError("Invalid length of 'visible' values")
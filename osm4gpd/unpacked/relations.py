@@ -2,12 +2,13 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from itertools import accumulate
+from typing import Any
 
 import numpy as np
 from numpy.typing import NDArray
 
 from osm4gpd.proto import PrimitiveGroup
-from osm4gpd.tags import get_tags
+from osm4gpd.tags import StringTable, Tags
 
 from .base import BaseGroup
 
@@ -22,18 +23,27 @@ class RelationGroup(BaseGroup):
 
     @classmethod
     def from_primitive_group(
-        cls, group: PrimitiveGroup, string_table: list[str]
+        cls,
+        group: PrimitiveGroup,
+        string_table: list[str],
+        *,
+        interner: StringTable | None = None,
     ) -> RelationGroup:
+        if interner is None:
+            interner = StringTable()
+        string_ids = interner.intern(string_table)
+        # interned strings, indexable by the string ids of the block
+        strings = interner.resolve(string_ids)
+
         ids: list[int] = []
         versions: list[int] = []
         member_ids: list[NDArray[np.int64]] = []
         member_types: list[NDArray[np.object_]] = []
         member_roles: list[NDArray[np.object_]] = []
-        tags: dict[int, dict[str, str]] = {}
         visible: list[bool] = []
         changeset: list[int] = []
 
-        for i, relation in enumerate(group.relations):
+        for relation in group.relations:
             ids.append(relation.id)
 
             member_types.append(
@@ -48,26 +58,30 @@ class RelationGroup(BaseGroup):
             member_ids.append(np.fromiter(accumulate(relation.memids), dtype=np.int64))
             member_roles.append(
                 np.fromiter(
-                    (string_table[sid] for sid in relation.roles_sid), dtype=np.object_
+                    (strings[sid] for sid in relation.roles_sid), dtype=np.object_
                 )
             )
 
-            _tags = get_tags(relation, string_table)
-            if len(_tags) > 0:
-                tags[i] = _tags
-
             # fixme: add optional here
             versions.append(relation.info.version)
             visible.append(relation.info.visible)
             changeset.append(relation.info.changeset)
 
         return cls(
-            ids=np.array(ids),
-            tags=tags,
-            version=versions,
-            changeset=changeset,
-            visible=visible,
+            ids=np.array(ids, dtype=np.int64),
+            tags=Tags.from_elements(group.relations, string_ids, interner),
+            version=np.array(versions, dtype=np.int32),
+            changeset=np.array(changeset, dtype=np.int64),
+            visible=np.array(visible, dtype=np.bool_),
             member_ids=member_ids,
             member_roles=member_roles,
             member_types=member_types,
         )
+
+    def _take_fields(self, indices: NDArray[np.int64]) -> dict[str, Any]:
+        return {
+            **super()._take_fields(indices),
+            "member_types": [self.member_types[idx] for idx in indices],
+            "member_roles": [self.member_roles[idx] for idx in indices],
+            "member_ids": [self.member_ids[idx] for idx in indices],
+        }
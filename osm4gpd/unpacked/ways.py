@@ -1,13 +1,15 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from itertools import accumulate
+from itertools import chain
+from typing import Any
 
 import numpy as np
 from numpy.typing import NDArray
 
+from osm4gpd import csr
 from osm4gpd.proto import PrimitiveGroup
-from osm4gpd.tags import get_tags
+from osm4gpd.tags import StringTable, Tags
 
 from .base import BaseGroup
 
@@ -16,36 +18,80 @@ __all__ = ["WayGroup"]
 
 @dataclass(repr=False)
 class WayGroup(BaseGroup):
-    member_ids: list[NDArray[np.int64]]
+    """Ways of a group, with their node references in compressed sparse row
+    layout: the node ids of way `i` are `refs[ref_offsets[i]:ref_offsets[i + 1]]`.
+    """
+
+    refs: NDArray[np.int64]
+    ref_offsets: NDArray[np.int64]
 
     @classmethod
     def from_primitive_group(
-        cls, group: PrimitiveGroup, string_table: list[str]
+        cls,
+        group: PrimitiveGroup,
+        string_table: list[str],
+        *,
+        interner: StringTable | None = None,
     ) -> WayGroup:
-        ids: list[int] = []
-        versions: list[int] = []
-        member_ids: list[NDArray[np.int64]] = []
-        tags: dict[int, dict[str, str]] = {}
-        visible: list[bool] = []
-        changeset: list[int] = []
-
-        for i, way in enumerate(group.ways):
-            member_ids.append(np.fromiter(accumulate(way.refs), dtype=np.int64))
-            _tags = get_tags(way, string_table)
-            if len(_tags) > 0:
-                tags[i] = _tags
-
-            ids.append(way.id)
-            # fixme: add optional here
-            versions.append(way.info.version)
-            visible.append(way.info.visible)
-            changeset.append(way.info.changeset)
+        if interner is None:
+            interner = StringTable()
+        string_ids = interner.intern(string_table)
+
+        ref_offsets = csr.offsets_from_counts(
+            np.fromiter(
+                (len(way.refs) for way in group.ways),
+                dtype=np.int64,
+                count=len(group.ways),
+            )
+        )
+        # refs are delta coded within each way
+        refs = csr.cumsum_rows(
+            np.fromiter(
+                chain.from_iterable(way.refs for way in group.ways),
+                dtype=np.int64,
+                count=ref_offsets[-1],
+            ),
+            ref_offsets,
+        )
 
         return cls(
-            ids=np.array(ids),
-            tags=tags,
-            member_ids=member_ids,
-            version=versions,
-            changeset=changeset,
-            visible=visible,
+            ids=np.fromiter(
+                (way.id for way in group.ways), dtype=np.int64, count=len(group.ways)
+            ),
+            tags=Tags.from_elements(group.ways, string_ids, interner),
+            refs=refs,
+            ref_offsets=ref_offsets,
+            version=np.fromiter(
+                (way.info.version for way in group.ways),
+                dtype=np.int32,
+                count=len(group.ways),
+            ),
+            changeset=np.fromiter(
+                (way.info.changeset for way in group.ways),
+                dtype=np.int64,
+                count=len(group.ways),
+            ),
+            visible=np.fromiter(
+                (way.info.visible for way in group.ways),
+                dtype=np.bool_,
+                count=len(group.ways),
+            ),
         )
+
+    def _take_fields(self, indices: NDArray[np.int64]) -> dict[str, Any]:
+        ref_offsets, positions = csr.take(self.ref_offsets, indices)
+        return {
+            **super()._take_fields(indices),
+            "refs": self.refs[positions],
+            "ref_offsets": ref_offsets,
+        }
+
+    @property
+    def member_ids(self) -> list[NDArray[np.int64]]:
+        """The node ids of every way, as views into `refs`."""
+        return np.split(self.refs, self.ref_offsets[1:-1])
+
+    def refs_of(self, indices: NDArray[np.int64]) -> NDArray[np.int64]:
+        """Return the node ids of the ways at `indices`, concatenated."""
+        _, positions = csr.take(self.ref_offsets, indices)
+        return self.refs[positions]
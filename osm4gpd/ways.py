@@ -1,57 +1,70 @@
-from typing import Generator, Type
-
 import geopandas as gpd
 import numpy as np
-import pandas as pd
+import shapely
 from numpy.typing import NDArray
-from shapely import Geometry, LinearRing, LineString, Polygon
 
+from . import csr
+from .frame import FrameBuilder
+from .locations import NodeLocations
 from .unpacked import WayGroup
 
 
-def infer_way_type(
-    refs: NDArray[np.int64], tags: dict[str, str]
-) -> Type[LinearRing] | Type[Polygon] | Type[LineString]:
-    """Rules are taken from here: https://wiki.openstreetmap.org/wiki/Way#Types_of_way"""
-    # if way is closed
-    if refs[-1] == refs[0]:
-        # exceptions where a closed way is not intended to be an area
-        if "highway" not in tags and "barrier" not in tags:
-            return LinearRing  # type: ignore[no-any-return]
-        else:
-            return Polygon  # type: ignore[no-any-return]
-    else:
-        return LineString  # type: ignore[no-any-return]
-
-
-def _get_geometries(
-    references: list[NDArray[np.int64]],
-    tags: dict[int, dict[str, str]],
-    nodes: gpd.GeoDataFrame,
-) -> Generator[Geometry, None, None]:
-    for i, refs in enumerate(references):
-        geom_type = infer_way_type(refs, tags.get(i, {}))
-        yield geom_type(nodes.loc[refs, "geometry"])
-
-
-def consolidate_ways(group: WayGroup, nodes: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
-    tags = pd.DataFrame.from_dict(
-        group.tags,
-        orient="index",
-        dtype=str(pd.SparseDtype(str)),
+def infer_way_types(
+    group: WayGroup,
+) -> tuple[NDArray[np.bool_], NDArray[np.bool_], NDArray[np.bool_]]:
+    """Return masks of the ways that are line strings, linear rings and polygons.
+
+    Rules are taken from here: https://wiki.openstreetmap.org/wiki/Way#Types_of_way
+    Ways with too few nodes for their type are in none of the masks.
+    """
+    counts = np.diff(group.ref_offsets)
+    nonempty = counts > 0
+
+    closed = np.zeros(len(counts), dtype=np.bool_)
+    closed[nonempty] = (
+        group.refs[group.ref_offsets[:-1][nonempty]]
+        == group.refs[group.ref_offsets[1:][nonempty] - 1]
     )
+    # exceptions where a closed way is not intended to be an area
+    area = closed & group.tags.has_any_key({"highway", "barrier"})
 
     return (
-        gpd.GeoDataFrame(
-            {
-                "geometry": _get_geometries(group.member_ids, group.tags, nodes),
-                "version": group.version,
-                "changeset": group.changeset,
-                "visible": group.visible,
-                "id": group.ids,
-            },
-            crs="EPSG:4326",
-        )
-        .join(tags)
-        .set_index("id")
+        ~closed & (counts >= 2),
+        closed & ~area & (counts >= 4),
+        area & (counts >= 4),
     )
+
+
+def way_geometries(group: WayGroup, locations: NodeLocations) -> NDArray[np.object_]:
+    """Build the geometries of all ways at once, ways that cannot form a valid
+    geometry are `None`."""
+    # look up the nodes of all ways at once
+    coordinates = locations.coordinates(group.refs)
+    geometries = np.full(len(group.ids), None, dtype=np.object_)
+
+    for mask, build in zip(
+        infer_way_types(group),
+        (
+            shapely.linestrings,
+            shapely.linearrings,
+            lambda coords, indices: shapely.polygons(
+                shapely.linearrings(coords, indices=indices)
+            ),
+        ),
+    ):
+        selected = np.flatnonzero(mask)
+        if len(selected) == 0:
+            continue
+
+        offsets, positions = csr.take(group.ref_offsets, selected)
+        geometries[selected] = build(
+            coordinates[positions], indices=csr.row_index(offsets)
+        )
+
+    return geometries
+
+
+def consolidate_ways(group: WayGroup, locations: NodeLocations) -> gpd.GeoDataFrame:
+    builder = FrameBuilder()
+    builder.add(group, way_geometries(group, locations))
+    return builder.build()
@@ -0,0 +1,86 @@
+from dataclasses import dataclass, field
+from typing import Any
+
+import numpy as np
+
+from osm4gpd.tags import StringTable, Tags
+from osm4gpd.unpacked import NodesGroup, RelationGroup, WayGroup
+
+# tags of every element of a group, in the order of the elements
+ElementTags = list[dict[str, str]] | None
+
+
+@dataclass
+class GroupBuilder:
+    """Builds small groups of nodes, ways or relations, whose tags are interned
+    into the same string table.
+
+    Elements are given in order, versions count up from 1 within each group.
+    """
+
+    strings: StringTable = field(default_factory=StringTable)
+
+    def _common(self, ids: list[int], tags: ElementTags) -> dict[str, Any]:
+        n = len(ids)
+        if tags is None:
+            tags = [{}] * n
+        pairs = [(k, v) for element in tags for k, v in element.items()]
+        return {
+            "ids": np.array(ids, dtype=np.int64),
+            "tags": Tags(
+                offsets=np.cumsum([0, *map(len, tags)], dtype=np.int64),
+                key_ids=self.strings.intern([k for k, _ in pairs]),
+                value_ids=self.strings.intern([v for _, v in pairs]),
+                string_table=self.strings,
+            ),
+            "version": np.arange(1, n + 1, dtype=np.int32),
+            "visible": np.ones(n, dtype=np.bool_),
+            "changeset": np.zeros(n, dtype=np.int64),
+        }
+
+    def nodes(
+        self,
+        ids: list[int],
+        tags: ElementTags = None,
+        *,
+        coordinates: list[tuple[float, float]] | None = None,
+    ) -> NodesGroup:
+        """Nodes at the given `(lon, lat)` coordinates, all at `(0, 0)` by
+        default."""
+        lon, lat = (
+            np.array(coordinates, dtype=np.float64).reshape(-1, 2).T
+            if coordinates is not None
+            else np.zeros((2, len(ids)))
+        )
+        return NodesGroup(**self._common(ids, tags), lat=lat, lon=lon)
+
+    def ways(self, refs: dict[int, list[int]], tags: ElementTags = None) -> WayGroup:
+        """Ways with the ids of their nodes, by the id of the way."""
+        return WayGroup(
+            **self._common(list(refs), tags),
+            refs=np.array(
+                [node for nodes in refs.values() for node in nodes], dtype=np.int64
+            ),
+            ref_offsets=np.cumsum([0, *map(len, refs.values())], dtype=np.int64),
+        )
+
+    def relations(
+        self, members: dict[int, list[tuple[str, int, str]]], tags: ElementTags = None
+    ) -> RelationGroup:
+        """Relations with the type, id and role of their members, by the id of
+        the relation."""
+        return RelationGroup(
+            **self._common(list(members), tags),
+            member_types=[
+                np.array([type_ for type_, _, _ in m], dtype=np.object_)
+                for m in members.values()
+            ],
+            member_roles=[
+                np.array([role for _, _, role in m], dtype=np.object_)
+                for m in members.values()
+            ],
+            member_ids=[
+                np.array([id_ for _, id_, _ in m], dtype=np.int64)
+                for m in members.values()
+            ],
+        )
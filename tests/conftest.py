@@ -1,6 +1,7 @@
 from pathlib import Path
 
 import pytest
+from builders import GroupBuilder
 
 
 @pytest.fixture
@@ -21,3 +22,8 @@ def malta(shared_datadir: Path) -> Path:
 @pytest.fixture
 def extract(shared_datadir: Path) -> Path:
     return shared_datadir.joinpath("extract.osm.pbf")
+
+
+@pytest.fixture
+def group_builder() -> GroupBuilder:
+    return GroupBuilder()
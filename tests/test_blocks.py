@@ -0,0 +1,144 @@
+import lzma
+import struct
+from pathlib import Path
+from typing import Callable
+
+import pytest
+
+from osm4gpd import OSMFile, blocks
+from osm4gpd.blocks import (
+    UnsupportedCompressionError,
+    decompress_blob,
+    map_file,
+    peek_block_kinds,
+    read_blob_at,
+    read_blobs,
+    read_blocks,
+    scan_blobs,
+    scan_mapped_blobs,
+)
+from osm4gpd.proto import Blob, BlobHeader, PrimitiveBlock
+
+
+@pytest.mark.parametrize("filename", ["andorra", "extract"])
+def test_mapped_scan_matches_file_scan(
+    filename: str, request: pytest.FixtureRequest
+) -> None:
+    fp: Path = request.getfixturevalue(filename)
+
+    with open(fp, "rb") as f:
+        expected = [(header.type, offset) for header, offset in scan_blobs(f)]
+
+    with map_file(fp) as buffer:
+        assert [
+            (header.type, offset) for header, offset in scan_mapped_blobs(buffer)
+        ] == expected
+
+
+@pytest.mark.parametrize("filename", ["extract"])
+def test_mapped_blobs_decompress_like_file_blobs(
+    filename: str, request: pytest.FixtureRequest
+) -> None:
+    fp: Path = request.getfixturevalue(filename)
+
+    with open(fp, "rb") as f:
+        expected = list(read_blocks(f))
+
+    with open(fp, "rb") as f:
+        assert [decompress_blob(blob) for blob in read_blobs(f)] == expected
+
+    with map_file(fp) as buffer:
+        assert [
+            decompress_blob(buffer[offset : offset + header.datasize])
+            for header, offset in scan_mapped_blobs(buffer)
+        ] == expected
+
+
+def _reencode(fp: Path, target: Path, encode: Callable[[bytes], Blob]) -> None:
+    """Write a copy of `fp`, with every blob re-encoded by `encode`."""
+    with open(fp, "rb") as f, open(target, "wb") as out:
+        for header, offset in scan_blobs(f):
+            blob = encode(decompress_blob(read_blob_at(f, offset, header.datasize)))
+            data = blob.SerializeToString()
+            blob_header = BlobHeader(type=header.type, datasize=len(data))
+            serialized_header = blob_header.SerializeToString()
+
+            out.write(struct.pack("!L", len(serialized_header)))
+            out.write(serialized_header)
+            out.write(data)
+
+
+def _raw(block: bytes) -> Blob:
+    return Blob(raw=block)
+
+
+def _lzma(block: bytes) -> Blob:
+    return Blob(raw_size=len(block), lzma_data=lzma.compress(block))
+
+
+def _lz4(block: bytes) -> Blob:
+    lz4_block = pytest.importorskip("lz4.block")
+    return Blob(
+        raw_size=len(block), lz4_data=lz4_block.compress(block, store_size=False)
+    )
+
+
+def _zstd(block: bytes) -> Blob:
+    zstandard = pytest.importorskip("zstandard")
+    return Blob(raw_size=len(block), zstd_data=zstandard.compress(block))
+
+
+@pytest.mark.parametrize("encode", [_raw, _lzma, _lz4, _zstd])
+def test_blobs_are_decompressed_by_data_field(
+    encode: Callable[[bytes], Blob], extract: Path, tmp_path: Path
+) -> None:
+    target = tmp_path.joinpath("reencoded.osm.pbf")
+    _reencode(extract, target, encode)
+
+    with open(extract, "rb") as f:
+        expected = list(read_blocks(f))
+
+    with open(target, "rb") as f:
+        assert list(read_blocks(f)) == expected
+
+    assert OSMFile.from_file(target).consolidate().shape == (1184, 157)
+
+
+@pytest.mark.parametrize(
+    "field,module,extra",
+    [("zstd_data", "_zstd", "zstd"), ("lz4_data", "_lz4_block", "lz4")],
+)
+def test_missing_codec_raises(
+    field: str, module: str, extra: str, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    blob = Blob(raw_size=3, **{field: b"abc"}).SerializeToString()
+    monkeypatch.setattr(blocks, module, None)
+
+    with pytest.raises(UnsupportedCompressionError, match=rf"osm4gpd\[{extra}\]"):
+        decompress_blob(blob)
+
+
+@pytest.mark.parametrize("filename", ["andorra", "extract"])
+def test_peeked_kinds_match_parsed_kinds(
+    filename: str, request: pytest.FixtureRequest
+) -> None:
+    fp: Path = request.getfixturevalue(filename)
+
+    with map_file(fp) as buffer:
+        for header, offset in scan_mapped_blobs(buffer):
+            if header.type != "OSMData":
+                continue
+            block = decompress_blob(buffer[offset : offset + header.datasize])
+            parsed = PrimitiveBlock.FromString(block)
+
+            assert peek_block_kinds(block) == {
+                kind
+                for group in parsed.primitivegroup
+                for kind, elements in (
+                    ("node", group.dense.id),
+                    ("node", group.nodes),
+                    ("way", group.ways),
+                    ("relation", group.relations),
+                )
+                if len(elements) > 0
+            }
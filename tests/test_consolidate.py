@@ -1,6 +1,17 @@
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
 import pytest
+from builders import GroupBuilder
+from shapely import LinearRing, LineString, Polygon, box
 
+from osm4gpd.locations import NodeLocations
 from osm4gpd.parse import OSMFile
+from osm4gpd.relations import consolidate_relations
+from osm4gpd.unpacked import RelationGroup
+from osm4gpd.ways import consolidate_ways
 
 
 @pytest.mark.parametrize(
@@ -62,3 +73,189 @@ def test_consolidation_respects_filtering(
     )
 
     assert gdf[list(tags)].isna().sum().sum() == 0
+
+
+def test_way_geometry_types_are_inferred(group_builder: GroupBuilder) -> None:
+    locations = NodeLocations(
+        ids=np.array([1, 2, 3, 4], dtype=np.int64),
+        lon=np.array([0, 1, 1, 0], dtype=np.float64),
+        lat=np.array([0, 0, 1, 1], dtype=np.float64),
+    )
+    ways = group_builder.ways(
+        # the last two ways have too few nodes for any geometry
+        {10: [1, 2, 3], 11: [1, 2, 3, 4, 1], 12: [1, 2, 3, 1], 13: [2, 3, 2], 14: [3]},
+        # only way 12 is tagged as highway=primary
+        tags=[{}, {}, {"highway": "primary"}, {}, {}],
+    )
+
+    gdf = consolidate_ways(ways, locations)
+
+    assert gdf.geometry.geom_type.tolist()[:3] == [
+        "LineString",
+        "LinearRing",
+        "Polygon",
+    ]
+    assert gdf.geometry.isna().tolist() == [False, False, False, True, True]
+    assert gdf.geometry[12].equals(Polygon([(0, 0), (1, 0), (1, 1), (0, 0)]))
+
+
+def test_filter_applies_to_groups_built_directly(group_builder: GroupBuilder) -> None:
+    nodes = group_builder.nodes(
+        [1, 2, 3], [{"amenity": "bench"}, {"highway": "stop"}, {"amenity": "cafe"}]
+    )
+
+    gdf = OSMFile(nodes=[nodes]).filter(tags={"amenity"}).consolidate()
+
+    assert gdf.index.tolist() == [1, 3]
+    assert gdf["amenity"].tolist() == ["bench", "cafe"]
+
+
+def _multipolygons(
+    group_builder: GroupBuilder,
+    members: dict[int, list[tuple[str, int, str]]],
+) -> RelationGroup:
+    """Multipolygon relations named after their id."""
+    return group_builder.relations(
+        members, tags=[{"type": "multipolygon", "name": str(id_)} for id_ in members]
+    )
+
+
+def _squares() -> gpd.GeoDataFrame:
+    return gpd.GeoDataFrame(
+        {"geometry": [box(0, 0, 1, 1), box(2, 0, 3, 1), box(0.2, 0.2, 0.8, 0.8)]},
+        index=pd.Index([1, 2, 3], name="id"),
+    )
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_nested_relations_are_built_across_groups(
+    workers: int, group_builder: GroupBuilder
+) -> None:
+    # every relation contains the one in the next group
+    groups = [
+        _multipolygons(group_builder, {100: [("relation", 200, "outer")]}),
+        _multipolygons(
+            group_builder,
+            {
+                200: [
+                    ("relation", 300, "outer"),
+                    ("way", 2, "outer"),
+                    ("relation", 301, "inner"),
+                ]
+            },
+        ),
+        _multipolygons(
+            group_builder, {300: [("way", 1, "outer")], 301: [("way", 3, "outer")]}
+        ),
+    ]
+
+    gdf = consolidate_relations(
+        groups,
+        ways=_squares(),
+        locations=NodeLocations.from_groups([]),
+        workers=workers,
+    )
+
+    assert gdf.index.tolist() == [100, 200, 300, 301]
+    assert gdf["name"].tolist() == ["100", "200", "300", "301"]
+    assert gdf["version"].tolist() == [1, 1, 1, 2]
+    expected = (
+        box(0, 0, 1, 1).union(box(2, 0, 3, 1)).difference(box(0.2, 0.2, 0.8, 0.8))
+    )
+    assert gdf.geometry[100].equals(expected)
+    assert gdf.geometry[200].equals(expected)
+
+
+def test_cycles_of_relations_are_reported(
+    caplog: pytest.LogCaptureFixture, group_builder: GroupBuilder
+) -> None:
+    groups = [
+        _multipolygons(
+            group_builder,
+            {
+                400: [("way", 1, "outer"), ("relation", 401, "outer")],
+                401: [("way", 2, "outer"), ("relation", 400, "outer")],
+                402: [("relation", 400, "outer")],
+            },
+        )
+    ]
+
+    gdf = consolidate_relations(
+        groups, ways=_squares(), locations=NodeLocations.from_groups([])
+    )
+
+    assert "part of cycles" in caplog.text
+    assert gdf.geometry[400].equals(box(0, 0, 1, 1))
+    assert gdf.geometry[401].equals(box(2, 0, 3, 1))
+    # relations that only contain a cycle are built from its members
+    assert gdf.geometry[402].equals(box(0, 0, 1, 1))
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_linear_rings_are_kept_in_collections(
+    workers: int, group_builder: GroupBuilder
+) -> None:
+    groups = [
+        group_builder.relations(
+            {
+                500: [("way", 1, ""), ("way", 2, "")],
+                501: [("relation", 500, ""), ("way", 2, "")],
+            },
+            tags=[{"type": "route"}, {"type": "route"}],
+        )
+    ]
+    ways = gpd.GeoDataFrame(
+        {
+            "geometry": [
+                LinearRing([(0, 0), (1, 0), (1, 1)]),
+                LineString([(2, 0), (3, 0)]),
+            ]
+        },
+        index=pd.Index([1, 2], name="id"),
+    )
+
+    gdf = consolidate_relations(
+        groups, ways=ways, locations=NodeLocations.from_groups([]), workers=workers
+    )
+
+    assert [part.geom_type for part in gdf.geometry[500].geoms] == [
+        "LinearRing",
+        "LineString",
+    ]
+    assert gdf.geometry[501].geoms[1].geoms[0].geom_type == "LinearRing"
+
+
+def test_relations_can_be_built_in_processes(andorra: Path) -> None:
+    osm = OSMFile.from_file(andorra, kinds={"relation"})
+
+    expected = osm.consolidate()
+    result = osm.consolidate(workers=2)
+
+    assert result.index.equals(expected.index)
+    assert result.geometry.geom_equals(expected.geometry).all()
+    # linear rings within collections survive being sent between processes
+    assert result.geometry.geom_type.equals(expected.geometry.geom_type)
+    assert (
+        result.geometry.explode(index_parts=True)
+        .geom_type.sort_index()
+        .equals(expected.geometry.explode(index_parts=True).geom_type.sort_index())
+    )
+    pd.testing.assert_frame_equal(
+        result.drop(columns="geometry"), expected.drop(columns="geometry")
+    )
+
+
+@pytest.mark.parametrize("filename", ["extract", "andorra"])
+def test_groups_can_be_consolidated_in_threads(
+    filename: str, request: pytest.FixtureRequest
+) -> None:
+    osm = OSMFile.from_file(request.getfixturevalue(filename), kinds={"way"})
+
+    expected = osm.consolidate()
+    result = osm.consolidate(threads=4)
+
+    assert result.index.equals(expected.index)
+    assert result.geometry.geom_equals(expected.geometry).all()
+    pd.testing.assert_frame_equal(
+        result.drop(columns="geometry"), expected.drop(columns="geometry")
+    )
@@ -1,8 +1,10 @@
 from functools import reduce
 from operator import or_
+from pathlib import Path
 
 import numpy as np
 import pytest
+import shapely
 from numpy.typing import NDArray
 
 from osm4gpd import OSMFile
@@ -196,3 +198,92 @@ def test_way_members_are_in_references(
         np.unique(np.concatenate([np.concatenate(way.member_ids) for way in osm.ways])),
         references["node"],
     ).all()
+
+
+@pytest.mark.parametrize(
+    "filename,tags,workers",
+    [
+        ("extract", {"amenity"}, 1),
+        ("andorra", {"building"}, 1),
+        ("andorra", {"route"}, 2),
+    ],
+)
+def test_filtering_while_loading_matches_filtering_afterwards(
+    filename: str, tags: set[str], workers: int, request: pytest.FixtureRequest
+) -> None:
+    fp = request.getfixturevalue(filename)
+    expected = OSMFile.from_file(fp).filter(tags=tags)
+    osm = OSMFile.from_file(fp, tags=tags, workers=workers)
+
+    for kind in ("nodes", "ways", "relations"):
+        np.testing.assert_array_equal(
+            np.concatenate([group.ids for group in getattr(osm, kind)]),
+            np.concatenate([group.ids for group in getattr(expected, kind)]),
+        )
+
+
+# part of Andorra la Vella
+ANDORRA_BOX = (1.515, 42.503, 1.525, 42.510)
+
+
+def test_filter_by_bbox_keeps_elements_complete(andorra: Path) -> None:
+    osm = OSMFile.from_file(andorra)
+    all_way_ids = np.concatenate([group.ids for group in osm.ways])
+    minx, miny, maxx, maxy = ANDORRA_BOX
+    inside = np.concatenate(
+        [
+            group.ids[
+                (group.lon >= minx)
+                & (group.lon <= maxx)
+                & (group.lat >= miny)
+                & (group.lat <= maxy)
+            ]
+            for group in osm.nodes
+        ]
+    )
+    osm.filter(bbox=ANDORRA_BOX)
+    node_ids = np.concatenate([group.ids for group in osm.nodes])
+    way_ids = np.concatenate([group.ids for group in osm.ways])
+    assert len(osm.relations) > 0
+
+    assert np.isin(inside, node_ids).all()
+    for way_group in osm.ways:
+        assert np.isin(way_group.refs, node_ids).all()
+    for relation_group in osm.relations:
+        for members, types in zip(
+            relation_group.member_ids, relation_group.member_types
+        ):
+            # members that are not part of the extract can not be kept
+            way_members = members[types == "way"]
+            way_members = way_members[np.isin(way_members, all_way_ids)]
+            assert np.isin(way_members, way_ids).all()
+
+    gdf = osm.consolidate()
+    assert gdf.geometry.intersects(shapely.box(*ANDORRA_BOX)).sum() > 0
+
+
+def test_filter_by_polygon_matches_box(andorra: Path) -> None:
+    by_box = OSMFile.from_file(andorra).filter(bbox=ANDORRA_BOX)
+    by_polygon = OSMFile.from_file(andorra).filter(bbox=shapely.box(*ANDORRA_BOX))
+
+    for kind in ("nodes", "ways", "relations"):
+        np.testing.assert_array_equal(
+            np.concatenate([group.ids for group in getattr(by_box, kind)]),
+            np.concatenate([group.ids for group in getattr(by_polygon, kind)]),
+        )
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_bbox_while_loading_matches_filtering_afterwards(
+    andorra: Path, workers: int
+) -> None:
+    expected = OSMFile.from_file(andorra).filter(bbox=ANDORRA_BOX, tags={"highway"})
+    osm = OSMFile.from_file(
+        andorra, bbox=ANDORRA_BOX, tags={"highway"}, workers=workers
+    )
+
+    for kind in ("nodes", "ways", "relations"):
+        np.testing.assert_array_equal(
+            np.concatenate([group.ids for group in getattr(osm, kind)]),
+            np.concatenate([group.ids for group in getattr(expected, kind)]),
+        )
@@ -0,0 +1,63 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from builders import GroupBuilder
+from shapely import Point
+
+from osm4gpd import OSMFile
+from osm4gpd.frame import FrameBuilder
+
+
+def test_frame_is_built_from_groups(group_builder: GroupBuilder) -> None:
+    first = group_builder.nodes([1, 2, 3], [{"a": "x"}, {}, {"b": "y"}])
+    second = group_builder.nodes([4, 5], [{"c": "z"}, {"a": "w", "c": "v"}])
+
+    builder = FrameBuilder(group_builder.strings)
+    builder.add(first, np.array([Point(0, 0), None, Point(2, 0)]))
+    builder.add(
+        second,
+        np.array([Point(0, 0), Point(1, 0)]),
+        rows=np.array([False, True]),
+        with_idx=True,
+    )
+    gdf = builder.build()
+
+    assert gdf.index.tolist() == [1, 2, 3, 5]
+    assert list(gdf.columns) == [
+        "geometry",
+        "version",
+        "visible",
+        "changeset",
+        "a",
+        "b",
+        "idx",
+        "c",
+    ]
+    assert gdf["version"].tolist() == [1, 2, 3, 2]
+    assert gdf["a"].tolist()[::3] == ["x", "w"]
+    assert gdf["c"].tolist()[3] == "v"
+    assert gdf["idx"].tolist()[3] == 1 and gdf["idx"].isna().sum() == 3
+    assert gdf.geometry.isna().tolist() == [False, True, False, False]
+
+
+@pytest.mark.parametrize("key", ["version", "geometry"])
+def test_tags_must_not_overlap_columns(group_builder: GroupBuilder, key: str) -> None:
+    builder = FrameBuilder(group_builder.strings)
+    builder.add(group_builder.nodes([1], [{key: "x"}]), np.array([Point(0, 0)]))
+
+    with pytest.raises(ValueError, match="overlap"):
+        builder.build()
+
+
+def test_frame_matches_tags_of_groups(andorra: Path) -> None:
+    osm = OSMFile.from_file(andorra, kinds={"relation"})
+    gdf = osm.consolidate()
+
+    tags = gdf.drop(columns=["geometry", "version", "visible", "changeset", "idx"])
+    rows = tags.itertuples(index=False)
+    for group in osm.relations:
+        for i in range(len(group.ids)):
+            values = {k: v for k, v in zip(tags.columns, next(rows)) if pd.notna(v)}
+            assert values == group.tags.get(i, {})
@@ -0,0 +1,70 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from osm4gpd import BlobIndex, OSMFile
+from osm4gpd.blocks import read_blob_at, read_blobs
+
+
+@pytest.mark.parametrize("filename", ["andorra", "extract"])
+def test_index_locates_all_blobs(filename: str, request: pytest.FixtureRequest) -> None:
+    fp: Path = request.getfixturevalue(filename)
+    index = BlobIndex.build(fp)
+
+    with open(fp, "rb") as f:
+        blobs = list(read_blobs(f))
+
+        assert len(index.blobs) == len(blobs)
+        assert index.blobs[0].type == "OSMHeader"
+
+        for info, blob in zip(index.blobs, blobs):
+            assert read_blob_at(f, info.offset, info.size) == blob
+
+
+@pytest.mark.parametrize("filename", ["andorra"])
+def test_index_id_ranges_cover_elements(
+    filename: str, request: pytest.FixtureRequest
+) -> None:
+    fp: Path = request.getfixturevalue(filename)
+    index = BlobIndex.build(fp)
+    osm = OSMFile.from_file(fp)
+
+    for kind, groups in (
+        ("node", osm.nodes),
+        ("way", osm.ways),
+        ("relation", osm.relations),
+    ):
+        ids = np.concatenate([group.ids for group in groups])
+        candidates = index.lookup(kind, ids)
+
+        assert len(candidates) == len(index.data_blobs(kind))
+        assert all(kind in blob.kinds for blob in candidates)  # type: ignore[operator]
+        assert min(blob.min_id for blob in candidates) == ids.min()  # type: ignore[type-var]
+        assert max(blob.max_id for blob in candidates) == ids.max()  # type: ignore[type-var]
+
+
+@pytest.mark.parametrize("filename", ["andorra"])
+def test_index_sidecar_is_reused_until_file_changes(
+    filename: str, request: pytest.FixtureRequest
+) -> None:
+    fp: Path = request.getfixturevalue(filename)
+    sidecar = BlobIndex.sidecar_path(fp)
+
+    index = BlobIndex.for_file(fp)
+    assert sidecar.exists()
+    assert BlobIndex.load(sidecar) == index
+
+    mtime = sidecar.stat().st_mtime_ns
+    assert BlobIndex.for_file(fp) == index
+    assert sidecar.stat().st_mtime_ns == mtime
+
+    stat = fp.stat()
+    os.utime(fp, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert not index.is_current(fp)
+
+    rebuilt = BlobIndex.for_file(fp)
+    assert rebuilt.is_current(fp)
+    assert rebuilt.blobs == index.blobs
+    assert BlobIndex.load(sidecar) == rebuilt
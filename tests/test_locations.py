@@ -0,0 +1,129 @@
+import gc
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from osm4gpd import OSMFile, locations
+from osm4gpd.locations import MissingNodesError, NodeLocations
+
+
+def test_node_locations_match_nodes(andorra: Path) -> None:
+    osm = OSMFile.from_file(andorra)
+    locations = NodeLocations.from_groups(osm.nodes)
+
+    assert len(locations) == sum(len(group.ids) for group in osm.nodes)
+    assert (np.diff(locations.ids) > 0).all()
+
+    group = osm.nodes[-1]
+    ids = group.ids[::-7]
+    np.testing.assert_array_equal(
+        locations.coordinates(ids), np.column_stack([group.lon, group.lat])[::-7]
+    )
+
+
+def test_missing_nodes_are_reported_at_once() -> None:
+    locations = NodeLocations(
+        ids=np.array([1, 5, 9], dtype=np.int64),
+        lon=np.array([0.0, 1.0, 2.0]),
+        lat=np.array([0.0, 1.0, 2.0]),
+    )
+
+    assert locations.contains(np.array([0, 5, 10])).tolist() == [False, True, False]
+
+    with pytest.raises(MissingNodesError) as e:
+        locations.coordinates(np.array([10, 5, 0, 10], dtype=np.int64))
+
+    assert e.value.ids.tolist() == [0, 10]
+
+
+@pytest.mark.parametrize("chunk_size", [1 << 22, 1 << 15])
+def test_node_locations_can_be_stored_on_disk(
+    chunk_size: int, andorra: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(locations, "_CHUNK_SIZE", chunk_size)
+    osm = OSMFile.from_file(andorra)
+    in_memory = NodeLocations.from_groups(osm.nodes)
+    directory = tmp_path / "nodes"
+
+    # unordered groups have to be sorted on disk, in several runs with the
+    # smaller chunk size
+    on_disk = NodeLocations.from_groups(osm.nodes[::-1], directory=directory)
+
+    assert isinstance(on_disk.ids, np.memmap)
+    assert on_disk.directory is not None
+    assert on_disk.directory.parent == directory
+    assert sorted(p.name for p in on_disk.directory.iterdir()) == [
+        "ids.npy",
+        "lat.npy",
+        "lon.npy",
+    ]
+    np.testing.assert_array_equal(on_disk.ids, in_memory.ids)
+    np.testing.assert_array_equal(on_disk.lon, in_memory.lon)
+    np.testing.assert_array_equal(on_disk.lat, in_memory.lat)
+
+    ids = osm.ways[0].refs
+    np.testing.assert_array_equal(on_disk.coordinates(ids), in_memory.coordinates(ids))
+    np.testing.assert_array_equal(
+        NodeLocations.open(on_disk.directory).coordinates(ids),
+        in_memory.coordinates(ids),
+    )
+
+
+def test_stores_in_the_same_directory_are_separate(
+    andorra: Path, tmp_path: Path
+) -> None:
+    osm = OSMFile.from_file(andorra)
+    first = NodeLocations.from_groups(osm.nodes[:1], directory=tmp_path)
+    expected = np.array(first.ids)
+
+    second = NodeLocations.from_groups(osm.nodes[1:], directory=tmp_path)
+
+    assert first.directory != second.directory
+    np.testing.assert_array_equal(first.ids, expected)
+
+
+def test_consolidation_with_node_store(extract: Path, tmp_path: Path) -> None:
+    expected = OSMFile.from_file(extract).consolidate()
+    osm = OSMFile.from_file(extract, node_store=tmp_path / "nodes")
+    assert osm.locations is not None
+    assert isinstance(osm.locations.ids, np.memmap)
+    gdf = osm.consolidate()
+
+    assert gdf.shape == expected.shape
+    assert gdf.geometry.geom_equals(expected.geometry).all()
+    # the store is removed once the locations are no longer used
+    del osm
+    gc.collect()
+    assert list((tmp_path / "nodes").iterdir()) == []
+
+
+def test_node_store_keeps_only_consolidated_nodes(
+    extract: Path, tmp_path: Path
+) -> None:
+    expected = OSMFile.from_file(extract, kinds={"way"}).consolidate()
+    osm = OSMFile.from_file(extract, kinds={"way"}, node_store=tmp_path / "nodes")
+    gdf = osm.consolidate()
+
+    assert osm.nodes == []
+    assert gdf.shape == expected.shape
+    assert gdf.geometry.geom_equals(expected.geometry).all()
+
+
+def test_bbox_filter_with_node_store(extract: Path, tmp_path: Path) -> None:
+    osm = OSMFile.from_file(extract)
+    # the middle half of the nodes along each axis
+    (minx, maxx), (miny, maxy) = (
+        np.quantile(np.concatenate(axis), [0.25, 0.75])
+        for axis in ([g.lon for g in osm.nodes], [g.lat for g in osm.nodes])
+    )
+    bbox = (minx, miny, maxx, maxy)
+    expected = osm.filter(bbox=bbox).consolidate()
+    gdf = (
+        OSMFile.from_file(extract, node_store=tmp_path / "nodes")
+        .filter(bbox=bbox)
+        .consolidate()
+    )
+
+    assert gdf.shape == expected.shape
+    assert gdf.geometry.geom_equals(expected.geometry).all()
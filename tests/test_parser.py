@@ -1,6 +1,14 @@
+import struct
+from pathlib import Path
+
+import numpy as np
 import pytest
+from shapely import box
 
+from osm4gpd import BlobIndex, parse
+from osm4gpd.blocks import decompress_blob, read_blob_at, scan_blobs
 from osm4gpd.parse import OSMFile
+from osm4gpd.proto import Blob, BlobHeader, HeaderBlock
 
 
 @pytest.mark.parametrize(
@@ -39,3 +47,166 @@ def test_osm_file_object_can_be_filtered_by_tags(
     assert len(osm.nodes) > 0
     assert len(osm.relations) > 0
     assert len(osm.ways) > 0
+
+
+@pytest.mark.parametrize("filename", ["andorra"])
+def test_parallel_loading_preserves_order(
+    filename: str, request: pytest.FixtureRequest
+) -> None:
+    fp = request.getfixturevalue(filename)
+    serial = OSMFile.from_file(fp)
+    parallel = OSMFile.from_file(fp, workers=2, max_in_flight=3)
+
+    for kind in ("nodes", "ways", "relations"):
+        serial_groups = getattr(serial, kind)
+        parallel_groups = getattr(parallel, kind)
+
+        assert len(serial_groups) == len(parallel_groups)
+        for a, b in zip(serial_groups, parallel_groups):
+            assert (a.ids == b.ids).all()
+            assert dict(a.tags.items()) == dict(b.tags.items())
+            assert b.tags.string_table is parallel.strings
+
+
+@pytest.mark.parametrize(
+    "workers,max_in_flight",
+    [(0, None), (-1, None), (2, 0)],
+)
+def test_invalid_parallelism_is_rejected(
+    workers: int, max_in_flight: int | None, andorra: Path
+) -> None:
+    with pytest.raises(ValueError, match="must be at least 1"):
+        OSMFile.from_file(andorra, workers=workers, max_in_flight=max_in_flight)
+
+
+@pytest.mark.parametrize("filename", ["andorra"])
+def test_header_is_exposed(filename: str, request: pytest.FixtureRequest) -> None:
+    osm = OSMFile.from_file(request.getfixturevalue(filename))
+
+    assert osm.header is not None
+    assert osm.header.bbox is not None
+    assert osm.header.bbox[0] < osm.header.bbox[2]
+    assert osm.header.bbox[1] < osm.header.bbox[3]
+    assert "DenseNodes" in osm.header.required_features
+    assert osm.header.replication_timestamp is not None
+    assert osm.is_sorted
+
+
+def test_files_with_unsupported_features_are_read(
+    extract: Path, tmp_path: Path, caplog: pytest.LogCaptureFixture
+) -> None:
+    target = tmp_path / "history.osm.pbf"
+    with open(extract, "rb") as f, open(target, "wb") as out:
+        for i, (header, offset) in enumerate(scan_blobs(f)):
+            data = read_blob_at(f, offset, header.datasize)
+            if i == 0:
+                block = HeaderBlock.FromString(decompress_blob(data))
+                block.required_features.extend(["HistoricalInformation"])
+                data = Blob(raw=block.SerializeToString()).SerializeToString()
+            serialized = BlobHeader(
+                type=header.type, datasize=len(data)
+            ).SerializeToString()
+            out.write(struct.pack("!L", len(serialized)) + serialized + data)
+
+    osm = OSMFile.from_file(target)
+
+    assert osm.header is not None
+    assert "HistoricalInformation" in osm.header.required_features
+    assert "HistoricalInformation" in caplog.text
+    assert len(osm.nodes) == len(OSMFile.from_file(extract).nodes)
+
+
+@pytest.mark.parametrize("filename", ["andorra"])
+def test_file_outside_of_bbox_is_skipped(
+    filename: str, request: pytest.FixtureRequest
+) -> None:
+    fp = request.getfixturevalue(filename)
+
+    osm = OSMFile.from_file(fp, bbox=(13.0, 52.3, 13.8, 52.7))
+    assert osm.header is not None
+    assert len(osm.nodes) == len(osm.ways) == len(osm.relations) == 0
+
+    osm = OSMFile.from_file(fp, bbox=box(1.5, 42.5, 1.6, 42.6))
+    assert len(osm.nodes) > 0
+
+
+@pytest.mark.parametrize("filename,tags", [("andorra", {"building"})])
+def test_sorted_filtering_matches_unsorted_filtering(
+    filename: str, tags: set[str], request: pytest.FixtureRequest
+) -> None:
+    fp = request.getfixturevalue(filename)
+
+    sorted_ = OSMFile.from_file(fp).filter(tags=tags)
+    unsorted = OSMFile.from_file(fp)
+    unsorted.header = None
+    unsorted.filter(tags=tags)
+
+    for kind in ("nodes", "ways", "relations"):
+        for a, b in zip(getattr(sorted_, kind), getattr(unsorted, kind)):
+            assert (a.ids == b.ids).all()
+
+
+@pytest.mark.parametrize(
+    "kinds,workers",
+    [({"node"}, 1), ({"way"}, 1), ({"relation"}, 2), ({"node", "relation"}, 1)],
+)
+def test_loading_kinds_matches_filtering_afterwards(
+    kinds: set[str], workers: int, andorra: Path
+) -> None:
+    expected = OSMFile.from_file(andorra).filter(kinds=kinds)
+    osm = OSMFile.from_file(andorra, kinds=kinds, workers=workers)
+
+    assert osm.kinds == expected.kinds == kinds
+    for kind in ("nodes", "ways", "relations"):
+        np.testing.assert_array_equal(
+            np.concatenate(
+                [np.array([], dtype=np.int64)]
+                + [group.ids for group in getattr(osm, kind)]
+            ),
+            np.concatenate(
+                [np.array([], dtype=np.int64)]
+                + [group.ids for group in getattr(expected, kind)]
+            ),
+        )
+
+
+@pytest.mark.parametrize("kinds", [set(), {"node", "area"}])
+def test_invalid_kinds_are_rejected(kinds: set[str], andorra: Path) -> None:
+    with pytest.raises(ValueError, match="'node', 'relation', 'way'"):
+        OSMFile.from_file(andorra, kinds=kinds)
+
+    osm = OSMFile.from_file(andorra, kinds={"relation"})
+    with pytest.raises(ValueError, match="'node', 'relation', 'way'"):
+        osm.filter(kinds=kinds)
+
+
+@pytest.mark.parametrize("with_index", [False, True])
+def test_blobs_of_other_kinds_are_not_read(
+    with_index: bool, andorra: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    index = BlobIndex.build(andorra)
+    if with_index:
+        index.save(BlobIndex.sidecar_path(andorra))
+
+    read: list[int] = []
+
+    def _decompress(data: bytes | memoryview) -> bytes:
+        read.append(len(data))
+        return decompress_blob(data)
+
+    monkeypatch.setattr(parse, "decompress_blob", _decompress)
+    osm = OSMFile.from_file(andorra, kinds={"node"})
+
+    assert len(osm.nodes) > 0
+    assert len(osm.ways) == len(osm.relations) == 0
+    # the header, the blobs with nodes and, without an index, the first blob
+    # after them, which tells that the file is sorted past all nodes
+    assert len(read) == 1 + len(index.data_blobs("node")) + (0 if with_index else 1)
+
+
+def test_consolidation_respects_kinds(extract: Path) -> None:
+    osm = OSMFile.from_file(extract, kinds={"way"})
+    gdf = osm.consolidate()
+
+    assert len(osm.nodes) > 0
+    assert set(gdf.index) == set(np.concatenate([group.ids for group in osm.ways]))
@@ -0,0 +1,66 @@
+import re
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import pytest
+
+from osm4gpd import OSMFile
+from osm4gpd.predicates import HasAnyKey, Key, Predicate
+
+PREDICATES: list[tuple[Predicate, Callable[[dict[str, str]], bool]]] = [
+    (
+        HasAnyKey(frozenset({"highway", "building"})),
+        lambda t: len({"highway", "building"} & t.keys()) > 0,
+    ),
+    (
+        Key("highway").isin({"primary", "secondary"}),
+        lambda t: t.get("highway") in {"primary", "secondary"},
+    ),
+    (
+        Key("building").not_in({"no"}),
+        lambda t: "building" in t and t["building"] != "no",
+    ),
+    (
+        ~Key("building").equals("yes"),
+        lambda t: t.get("building") != "yes",
+    ),
+    (
+        Key("name").matches("^Carrer"),
+        lambda t: re.search("^Carrer", t.get("name", "")) is not None,
+    ),
+    (
+        Key("highway") & ~Key("name"),
+        lambda t: "highway" in t and "name" not in t,
+    ),
+    (
+        Key("amenity") | Key("shop").equals("bakery"),
+        lambda t: "amenity" in t or t.get("shop") == "bakery",
+    ),
+]
+
+
+@pytest.mark.parametrize("predicate,expected", PREDICATES)
+def test_predicates_match_reference(
+    predicate: Predicate,
+    expected: Callable[[dict[str, str]], bool],
+    andorra: Path,
+) -> None:
+    osm = OSMFile.from_file(andorra)
+    compiled = predicate.compile(osm.strings)
+
+    for group in osm.ways[:3]:
+        mask = compiled(group.tags)
+        reference = [expected(group.tags.get(i, {})) for i in range(len(group.ids))]
+
+        assert mask.tolist() == reference
+        # calling the predicate compiles it against the table of the tags
+        np.testing.assert_array_equal(predicate(group.tags), mask)
+
+
+def test_consolidation_respects_predicate(andorra: Path) -> None:
+    predicate = Key("highway").isin({"primary", "secondary"})
+    gdf = OSMFile.from_file(andorra, tags=predicate).consolidate()
+
+    assert len(gdf) > 0
+    assert set(gdf["highway"]) == {"primary", "secondary"}
@@ -1,5 +1,6 @@
 import numpy as np
 import pytest
+from builders import GroupBuilder
 
 from osm4gpd import OSMFile
 from osm4gpd.references import find_references
@@ -7,7 +8,7 @@ from osm4gpd.references import find_references
 
 @pytest.mark.parametrize(
     "filename",
-    ["isle_of_man", "malta"],
+    ["isle_of_man", "malta", "andorra"],
 )
 def test_get_way_references(filename: str, request: pytest.FixtureRequest) -> None:
     osm = OSMFile.from_file(request.getfixturevalue(filename))
@@ -24,7 +25,7 @@ def test_get_way_references(filename: str, request: pytest.FixtureRequest) -> No
 
 @pytest.mark.parametrize(
     "filename",
-    ["isle_of_man", "malta"],
+    ["isle_of_man", "malta", "andorra"],
 )
 def test_get_relation_references(filename: str, request: pytest.FixtureRequest) -> None:
     osm = OSMFile.from_file(request.getfixturevalue(filename))
@@ -80,3 +81,37 @@ def test_get_relation_references(filename: str, request: pytest.FixtureRequest)
     assert np.isin(np.concatenate(node_ids), references["node"]).all()
     assert np.isin(np.concatenate(way_ids), references["way"]).all()
     assert np.isin(np.concatenate(relation_ids), references["relation"]).all()
+
+
+def test_nested_relations_are_resolved_across_groups_and_cycles(
+    group_builder: GroupBuilder,
+) -> None:
+    groups = [
+        group_builder.relations(
+            {1: [("relation", 2, "")], 2: [("relation", 3, ""), ("way", 100, "")]}
+        ),
+        # 3 closes a cycle back to 1, 4 is not referenced at all
+        group_builder.relations(
+            {3: [("relation", 1, ""), ("node", 5, "")], 4: [("way", 101, "")]}
+        ),
+    ]
+
+    references = find_references(np.array([1], dtype=np.int64), groups)
+
+    assert references["relation"].tolist() == [1, 2, 3]
+    assert references["way"].tolist() == [100]
+    assert references["node"].tolist() == [5]
+
+
+def test_deeply_nested_relations_do_not_recurse(group_builder: GroupBuilder) -> None:
+    depth = 5000
+    groups = [
+        group_builder.relations(
+            {i: [("relation", i + 1, ""), ("node", i, "")] for i in range(depth)}
+        )
+    ]
+
+    references = find_references(np.array([0], dtype=np.int64), groups)
+
+    assert references["relation"].tolist() == list(range(1, depth + 1))
+    assert references["node"].tolist() == list(range(depth))
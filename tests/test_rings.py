@@ -0,0 +1,100 @@
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+from builders import GroupBuilder
+from shapely import MultiPolygon, Polygon, box
+
+from osm4gpd.locations import NodeLocations
+from osm4gpd.parse import OSMFile
+from osm4gpd.references import MemberIndex
+from osm4gpd.relations import consolidate_relations
+from osm4gpd.rings import RingAssemblyError, assemble_multipolygon, join_rings
+from osm4gpd.ways import consolidate_ways
+
+# corners of two squares, node `10 * x + y` is at `(x, y)`
+SQUARES = {
+    # outer square, split into two ways that share their end nodes
+    1: [0, 40, 44],
+    2: [0, 4, 44],
+    # hole
+    3: [11, 31, 33, 13, 11],
+    # island within the hole
+    4: [22, 21, 32, 22],
+    # square that overlaps the outer square
+    5: [33, 63, 66, 36, 33],
+}
+
+
+def _ways(
+    group_builder: GroupBuilder, way_ids: list[int]
+) -> tuple[gpd.GeoDataFrame, MemberIndex]:
+    way_ids = sorted(way_ids)
+    group = group_builder.ways({way: SQUARES[way] for way in way_ids})
+    ways = gpd.GeoDataFrame(
+        {
+            "geometry": shapely.linestrings(
+                np.stack([group.refs // 10, group.refs % 10], axis=1),
+                indices=np.repeat(np.arange(len(way_ids)), np.diff(group.ref_offsets)),
+            )
+        },
+        index=pd.Index(way_ids, name="id"),
+    )
+    return ways, MemberIndex.from_groups([group])
+
+
+def _assemble(
+    group_builder: GroupBuilder, outer: list[int], inner: list[int]
+) -> Polygon | MultiPolygon:
+    ways, way_nodes = _ways(group_builder, outer + inner)
+    return assemble_multipolygon(
+        np.array(outer, dtype=np.int64),
+        np.array(inner, dtype=np.int64),
+        ways,
+        way_nodes,
+    )
+
+
+def test_ways_are_joined_at_shared_nodes() -> None:
+    rings = join_rings([np.array(SQUARES[way], dtype=np.int64) for way in (3, 1, 2)])
+
+    assert rings == [[(0, False)], [(1, False), (2, True)]]
+
+
+def test_open_rings_can_not_be_joined() -> None:
+    with pytest.raises(RingAssemblyError):
+        join_rings([np.array(SQUARES[1], dtype=np.int64)])
+
+
+def test_rings_are_nested(group_builder: GroupBuilder) -> None:
+    result = _assemble(group_builder, [1, 2, 4], [3])
+
+    expected = (
+        box(0, 0, 4, 4)
+        .difference(box(1, 1, 3, 3))
+        .union(Polygon([(2, 2), (2, 1), (3, 2)]))
+    )
+    assert isinstance(result, MultiPolygon)
+    assert result.equals(expected)
+
+
+def test_overlapping_rings_are_rejected(group_builder: GroupBuilder) -> None:
+    with pytest.raises(RingAssemblyError):
+        _assemble(group_builder, [1, 2, 5], [])
+
+
+def test_rings_match_overlay(andorra: Path) -> None:
+    osm = OSMFile.from_file(andorra, kinds={"relation"})
+    locations = NodeLocations.from_groups(osm.nodes)
+    ways = pd.concat([consolidate_ways(group, locations) for group in osm.ways])
+
+    expected = consolidate_relations(osm.relations, ways=ways, locations=locations)
+    result = consolidate_relations(
+        osm.relations, ways=ways, locations=locations, way_groups=osm.ways
+    )
+
+    assert result.geometry.geom_equals(expected.geometry).all()
+    assert (result.geom_type == expected.geom_type).all()
@@ -1,10 +1,17 @@
+from itertools import accumulate, chain
 from pathlib import Path
 from typing import Generator
 
+import numpy as np
+import pandas as pd
 import pytest
 
+from osm4gpd import tags as tags_module
 from osm4gpd.blocks import read_blocks
+from osm4gpd.filter import Selection
+from osm4gpd.predicates import Key
 from osm4gpd.proto import PrimitiveBlock, PrimitiveGroup
+from osm4gpd.tags import StringTable, Tags, parse_dense_tags
 from osm4gpd.unpacked import NodesGroup, RelationGroup, WayGroup
 
 
@@ -87,6 +94,39 @@ def test_unpack_dense_group(
     assert len(result.visible) == n_items
 
 
+def test_unpack_dense_group_with_selection(
+    dense_group_context: tuple[PrimitiveGroup, list[str], float, float, float]
+) -> None:
+    group, string_table, granularity, lat_offset, lon_offset = dense_group_context
+    full = NodesGroup.from_dense_group(
+        group,
+        string_table,
+        granularity=granularity,
+        lat_offset=lat_offset,
+        lon_offset=lon_offset,
+    )
+
+    referenced = full.ids[::100]
+    selection = Selection(Key("highway"), referenced)
+    result = NodesGroup.from_dense_group(
+        group,
+        string_table,
+        granularity=granularity,
+        lat_offset=lat_offset,
+        lon_offset=lon_offset,
+        select=selection,
+    )
+
+    keep = np.flatnonzero(
+        full.tags.has_any_key({"highway"}) | np.isin(full.ids, referenced)
+    )
+    assert len(keep) < len(full.ids)
+    np.testing.assert_array_equal(result.ids, full.ids[keep])
+    np.testing.assert_array_equal(result.lat, full.lat[keep])
+    np.testing.assert_array_equal(result.version, full.version[keep])
+    assert dict(result.tags.items()) == dict(full.tags.take(keep).items())
+
+
 def test_unpack_way_group(way_group_context: tuple[PrimitiveGroup, list[str]]) -> None:
     result = WayGroup.from_primitive_group(*way_group_context)
 
@@ -99,6 +139,22 @@ def test_unpack_way_group(way_group_context: tuple[PrimitiveGroup, list[str]]) -
     assert len(result.visible) == n_items
 
 
+def test_way_refs_are_decoded_per_way(
+    way_group_context: tuple[PrimitiveGroup, list[str]]
+) -> None:
+    group, _ = way_group_context
+    result = WayGroup.from_primitive_group(*way_group_context)
+
+    assert len(result.ref_offsets) == len(result.ids) + 1
+    for way, refs in zip(group.ways, result.member_ids):
+        assert refs.tolist() == list(accumulate(way.refs))
+
+    indices = np.array([3, 0, 3], dtype=np.int64)
+    assert result.refs_of(indices).tolist() == list(
+        chain.from_iterable(accumulate(group.ways[idx].refs) for idx in indices)
+    )
+
+
 def test_unpack_relations_group(
     relation_group_context: tuple[PrimitiveGroup, list[str]]
 ) -> None:
@@ -111,3 +167,124 @@ def test_unpack_relations_group(
     assert len(result.version) == n_items
     assert len(result.changeset) == n_items
     assert len(result.visible) == n_items
+
+
+def _parse_dense_tags_reference(
+    keys_vals: list[int], string_table: list[str]
+) -> dict[int, dict[str, str]]:
+    tags: dict[int, dict[str, str]] = {}
+    node_idx = 0
+    kv_idx = 0
+    while kv_idx < len(keys_vals):
+        while keys_vals[kv_idx] != 0:
+            key, value = keys_vals[kv_idx], keys_vals[kv_idx + 1]
+            tags.setdefault(node_idx, {})[string_table[key]] = string_table[value]
+            kv_idx += 2
+        kv_idx += 1
+        node_idx += 1
+
+    return tags
+
+
+def test_parse_dense_tags(
+    dense_group_context: tuple[PrimitiveGroup, list[str], float, float, float]
+) -> None:
+    group, string_table, *_ = dense_group_context
+    offsets, *_ = parse_dense_tags(group.dense.keys_vals, len(group.dense.id))
+    interner = StringTable()
+    tags = Tags.from_dense(
+        group.dense.keys_vals,
+        len(group.dense.id),
+        interner.intern(string_table),
+        interner,
+    )
+
+    assert len(offsets) == len(group.dense.id) + 1
+    assert dict(tags.items()) == (
+        _parse_dense_tags_reference(list(group.dense.keys_vals), string_table)
+    )
+
+
+def test_tags_can_be_taken_and_converted_to_columns(
+    way_group_context: tuple[PrimitiveGroup, list[str]]
+) -> None:
+    tags = WayGroup.from_primitive_group(*way_group_context).tags
+    indices = np.array([5, 0, 3, 3, 42], dtype=np.int64)
+
+    taken = tags.take(indices)
+    assert taken.n_elements == len(indices)
+    for i, idx in enumerate(indices):
+        assert taken.get(i, {}) == tags.get(idx, {})
+
+    columns = taken.to_columns()
+    assert all(len(column) == len(indices) for column in columns.values())
+    for i in range(len(indices)):
+        assert {
+            key: column[i] for key, column in columns.items() if pd.notna(column[i])
+        } == taken.get(i, {})
+
+
+def test_sparse_columns_can_be_built_without_sparse_index(
+    way_group_context: tuple[PrimitiveGroup, list[str]],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    tags = WayGroup.from_primitive_group(*way_group_context).tags
+    expected = tags.to_columns()
+
+    monkeypatch.setattr(tags_module, "_IntIndex", None)
+    columns = tags.to_columns()
+
+    assert list(columns) == list(expected)
+    for key, column in columns.items():
+        pd.testing.assert_extension_array_equal(column, expected[key])
+
+
+def test_string_table_interns_strings() -> None:
+    table = StringTable(["", "highway", "yes"])
+
+    ids = table.intern(["yes", "building", "yes", "highway"])
+
+    assert ids.tolist() == [2, 3, 2, 1]
+    assert table.lookup(["building", "missing"]).tolist() == [3]
+    assert table.resolve(ids) == ["yes", "building", "yes", "highway"]
+    assert len(table) == 4
+
+
+def test_groups_can_be_taken(
+    dense_group_context: tuple[PrimitiveGroup, list[str], float, float, float],
+    way_group_context: tuple[PrimitiveGroup, list[str]],
+    relation_group_context: tuple[PrimitiveGroup, list[str]],
+) -> None:
+    group, str_tab, granularity, lat_offset, lon_offset = dense_group_context
+    nodes = NodesGroup.from_dense_group(
+        group,
+        str_tab,
+        granularity=granularity,
+        lat_offset=lat_offset,
+        lon_offset=lon_offset,
+    )
+    ways = WayGroup.from_primitive_group(*way_group_context)
+    relations = RelationGroup.from_primitive_group(*relation_group_context)
+
+    for result in (nodes, ways, relations):
+        indices = np.array([4, 1, 2], dtype=np.int64)
+        taken = result.take(indices)
+        mask = np.zeros(len(result.ids), dtype=np.bool_)
+        mask[indices] = True
+
+        assert taken.ids.tolist() == result.ids[indices].tolist()
+        assert taken.version.tolist() == result.version[indices].tolist()
+        assert taken.changeset.tolist() == result.changeset[indices].tolist()
+        assert taken.visible.tolist() == result.visible[indices].tolist()
+        assert [taken.tags.get(i, {}) for i in range(3)] == [
+            result.tags.get(i, {}) for i in indices
+        ]
+        assert result.take(mask).ids.tolist() == sorted(taken.ids.tolist())
+
+    assert nodes.take(np.array([2], dtype=np.int64)).lon[0] == nodes.lon[2]
+    assert ways.take(np.array([2], dtype=np.int64)).refs.tolist() == (
+        ways.member_ids[2].tolist()
+    )
+    assert relations.take(np.array([2], dtype=np.int64)).member_ids[0].tolist() == (
+        relations.member_ids[2].tolist()
+    )